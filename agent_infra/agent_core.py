@@ -1,10 +1,22 @@
+import contextvars
 import json
 import re
 import logging
-import requests
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Any, Iterator, Generator, Optional, Tuple
+from cassette import CassetteHTTPClient, get_cassette
+from compaction import ContextCompactor, encode_observation, summarize_observation
 from config import load_config
-from tools import tool_kit
+from http_client import PooledHTTPClient
+from llm_cache import CompletionCache
+from metrics import ERRORS, ITERATIONS, LLM_FINISH, LLM_LATENCY, LLM_TOKENS, PARSE_LATENCY, PROMPT_TOKENS_SAVED, error_class
+from ratelimit import get_limiter
+from router import IntentRouter
+from session import create_session_store, trim_history
+from tokens import estimate_message_tokens
+from tools import get_tool_kit
 
 # 配置日志
 # logging.basicConfig(
@@ -17,6 +29,9 @@ from tools import tool_kit
 # )
 logger = logging.getLogger(__name__)
 
+# 只缓存服务端正常结束的生成结果；提前断开（abort）或未收到结束原因的流式结果不完整，不写入缓存
+CACHEABLE_FINISH_REASONS = ("stop", "tool_calls", "length")
+
 
 class QwenClient:
     """Qwen API客户端"""
@@ -26,94 +41,362 @@ class QwenClient:
         self.api_key = config["api_key"]
         self.base_url = config["base_url"]
         self.model = config["model"]
+        # 复用长连接，避免每次迭代都重新进行TCP+TLS握手
+        self.http = PooledHTTPClient(
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            },
+            pool_size=config["llm_pool_size"],
+            connect_timeout=config["llm_connect_timeout"],
+            read_timeout=config["llm_read_timeout"],
+            max_retries=config["llm_max_retries"],
+            # DashScope按账号限流，429时降速排队而不是直接失败
+            rate_limiter=get_limiter(
+                "dashscope", config["rate_limits"]["dashscope"],
+                max_wait=config["rate_limit_max_wait"], max_retries=config["rate_limit_max_retries"]
+            ),
+        )
+        # 录制/回放模式下经cassette收发，回放时不访问大模型服务
+        cassette = get_cassette()
+        if cassette is not None:
+            self.http = CassetteHTTPClient(cassette, self.http)
+        self.generation_params = {"temperature": 0.1, "max_tokens": config["llm_max_tokens_answer"]}
+        self.stop_sequences = config["llm_stop_sequences"]
+        # 可选的补全结果缓存，相同的请求不再重复生成
+        self.cache = None
+        if config["llm_cache_enabled"]:
+            self.cache = CompletionCache(
+                maxsize=config["llm_cache_max_entries"],
+                ttl=config["llm_cache_ttl"],
+                disk_path=config["llm_cache_disk_path"] or None,
+                disk_max_entries=config["llm_cache_disk_max_entries"],
+            )
         logger.info("Qwen客户端初始化完成")
 
-    def chat_completion(self, messages: List[Dict[str, str]]) -> str:
-        """调用Qwen聊天补全API"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+    def pool_stats(self) -> Dict[str, int]:
+        """返回连接池命中、未命中和重连计数"""
+        return self.http.stats.snapshot()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回补全缓存命中率统计"""
+        return self.cache.stats() if self.cache else {"enabled": False}
+
+    def _request_params(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        """本次调用的生成参数，max_tokens和stop覆盖默认值"""
+        params = dict(self.generation_params)
+        if max_tokens:
+            params["max_tokens"] = max_tokens
+        if stop:
+            params["stop"] = list(stop)
+        return params
+
+    def _cache_key(self, messages: List[Dict[str, Any]], use_cache: bool, tools: Optional[List[Dict]] = None,
+                   params: Optional[Dict[str, Any]] = None):
+        """返回缓存键；未启用缓存或本次请求跳过缓存时返回None"""
+        if self.cache is None:
+            return None
+        if not use_cache:
+            self.cache.record_bypass()
+            return None
+        params = dict(params or self.generation_params)
+        if tools:
+            params["tools"] = tools
+        return CompletionCache.make_key(self.model, params, messages)
+
+    def _cache_get(self, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        try:
+            return json.loads(cached)
+        except (TypeError, ValueError):
+            return None
+
+    def _cache_set(self, cache_key: Optional[str], message: Dict[str, Any]):
+        if cache_key and message.get("finish_reason") in CACHEABLE_FINISH_REASONS:
+            self.cache.set(cache_key, json.dumps(message, ensure_ascii=False))
 
+    def _completion_data(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict]],
+                         stream: bool, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         data = {
             "model": self.model,
             "messages": messages,
-            "temperature": 0.1,
-            "max_tokens": 2000
+            **(params or self.generation_params)
         }
+        if tools:
+            data["tools"] = tools
+            data["parallel_tool_calls"] = True
+        if stream:
+            data["stream"] = True
+            # 流式响应默认不带usage，需显式要求在最后一个分片中返回
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        LLM_TOKENS.inc(usage.get("prompt_tokens") or 0, type="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens") or 0, type="completion")
+
+    def chat_message(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict]] = None,
+                     use_cache: bool = True, max_tokens: Optional[int] = None,
+                     stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        """调用Qwen聊天补全API，返回assistant消息（可能包含tool_calls，finish_reason为结束原因）
+
+        调用失败时返回带 error 标记的消息，content为错误说明。
+        """
+        params = self._request_params(max_tokens, stop)
+        cache_key = self._cache_key(messages, use_cache, tools, params)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
 
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=60
-            )
+            response = self.http.post(
+                f"{self.base_url}/chat/completions", json=self._completion_data(messages, tools, False, params))
             response.raise_for_status()
             result = response.json()
-            return result["choices"][0]["message"]["content"]
+            self._record_usage(result.get("usage"))
+            choice = result["choices"][0]
+            source = choice["message"]
+            message = {"role": "assistant", "content": source.get("content"), "finish_reason": choice.get("finish_reason")}
+            if source.get("tool_calls"):
+                message["tool_calls"] = source["tool_calls"]
+            self._cache_set(cache_key, message)
+            return message
         except Exception as e:
             logger.error(f"调用Qwen API失败: {e}")
-            return f"调用大模型失败: {e}"
+            return self._error_message(e)
+
+    def _error_message(self, error: Exception) -> Dict[str, Any]:
+        """构造调用失败时的assistant消息，保留HTTP状态码供调用方判断"""
+        ERRORS.inc(stage="llm", error_class=error_class(error))
+        return {
+            "role": "assistant",
+            "content": f"调用大模型失败: {error}",
+            "error": True,
+            "status_code": getattr(getattr(error, "response", None), "status_code", None)
+        }
+
+    def chat_message_stream(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict]] = None,
+                            use_cache: bool = True, max_tokens: Optional[int] = None,
+                            stop: Optional[List[str]] = None,
+                            complete_at: Optional[Callable[[str], Optional[int]]] = None
+                            ) -> Generator[str, None, Dict[str, Any]]:
+        """以stream=True模式调用Qwen聊天补全API，逐段产出生成的文本，返回完整的assistant消息
+
+        complete_at接收已生成的文本，返回可以结束生成的位置（或None）；返回位置后截断文本并立即断开连接，
+        返回消息的finish_reason为"abort"，这样的部分结果不写入缓存。调用失败时不产出错误文本，而是返回带 error 标记的消息。
+        """
+        params = self._request_params(max_tokens, stop)
+        cache_key = self._cache_key(messages, use_cache, tools, params)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            if cached.get("content"):
+                yield cached["content"]
+            return cached
+
+        try:
+            response = self.http.post(
+                f"{self.base_url}/chat/completions", json=self._completion_data(messages, tools, True, params),
+                stream=True)
+        except Exception as e:
+            logger.error(f"调用Qwen API失败: {e}")
+            return self._error_message(e)
+
+        parts = []
+        length = 0
+        finish_reason = None
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                # SSE格式: "data: {...}"，以 "data: [DONE]" 结束
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                self._record_usage(chunk.get("usage"))
+                if not chunk.get("choices"):
+                    continue
+                choice = chunk["choices"][0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                if content and complete_at and not tool_calls:
+                    end = complete_at("".join(parts) + content)
+                    if end is not None:
+                        # 已得到完整的动作，丢弃之后的内容；关闭未读完的响应会断开连接，服务端随即停止生成
+                        content = content[:max(end - length, 0)]
+                        finish_reason = "abort"
+                if content:
+                    parts.append(content)
+                    length += len(content)
+                    yield content
+                if finish_reason == "abort":
+                    break
+                # 工具调用参数按index分片到达，需要拼接
+                for call_delta in delta.get("tool_calls") or []:
+                    call = tool_calls.setdefault(call_delta.get("index", 0), {
+                        "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+                    })
+                    if call_delta.get("id"):
+                        call["id"] = call_delta["id"]
+                    function = call_delta.get("function") or {}
+                    call["function"]["name"] += function.get("name") or ""
+                    call["function"]["arguments"] += function.get("arguments") or ""
+        except Exception as e:
+            logger.error(f"读取Qwen流式响应失败: {e}")
+            return self._error_message(e)
+        finally:
+            response.close()
+
+        message = {"role": "assistant", "content": "".join(parts) or None, "finish_reason": finish_reason}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        self._cache_set(cache_key, message)
+        return message
+
+    def chat_completion(self, messages: List[Dict[str, str]], use_cache: bool = True) -> str:
+        """调用Qwen聊天补全API"""
+        return self.chat_message(messages, use_cache=use_cache).get("content") or ""
+
+    def chat_completion_stream(self, messages: List[Dict[str, str]], use_cache: bool = True) -> Iterator[str]:
+        """以stream=True模式调用Qwen聊天补全API，逐段返回生成的文本"""
+        message = yield from self.chat_message_stream(messages, use_cache=use_cache)
+        if message.get("error"):
+            yield message["content"]
 
 
 class SimpleAgent:
     def __init__(self):
+        config = load_config()
         self.llm = QwenClient()
+        # 多轮会话存储，每次调用的历史按token预算裁剪
+        self.sessions = create_session_store(config)
+        self.history_token_budget = config["session_history_token_budget"]
+        # native: 使用OpenAI兼容的tools/tool_calls接口；react: 文本ReAct格式
+        self.tool_mode = config["agent_tool_mode"]
+        # 每次调用大模型前压缩上下文，单次提示不超过prompt_token_budget
+        self.compaction_enabled = config["context_compaction_enabled"]
+        # 生成控制：首轮通常是动作步骤，使用较小的max_tokens；拿到工具结果后按最终回答的上限生成
+        self.max_tokens = {"action": config["llm_max_tokens_action"], "answer": config["llm_max_tokens_answer"]}
+        self.stream_early_abort = config["llm_stream_early_abort"]
+        self.prompt_token_budget = config["prompt_token_budget"]
+        # 同一轮中的多个工具调用在有界线程池中并发执行
+        self.tool_pool = ThreadPoolExecutor(max_workers=config["tool_max_workers"], thread_name_prefix="agent-tool")
+        tool_kit = get_tool_kit()
         self.tools = {
             "create_ecs_instance": {
                 "function": tool_kit.create_ecs_instance,
-                "description": "创建ECS实例。需要参数: instance_type, image_id, instance_name等"
+                "description": "创建ECS实例。需要参数: instance_type, image_id, instance_name等",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "instance_type": {"type": "string", "description": "实例规格，如 ecs.g6.large"},
+                        "image_id": {"type": "string", "description": "镜像ID"},
+                        "instance_name": {"type": "string", "description": "实例名称"},
+                        "system_disk_size": {"type": "integer", "description": "系统盘大小(GB)"},
+                        "security_group_id": {"type": "string", "description": "安全组ID"},
+                        "vswitch_id": {"type": "string", "description": "交换机ID"},
+                        "password": {"type": "string", "description": "实例登录密码"},
+                        "region": {"type": "string", "description": "地域ID，如 cn-beijing，默认使用配置的地域"}
+                    },
+                    "required": []
+                }
+            },
+            "create_ecs_fleet": {
+                "function": tool_kit.create_ecs_fleet,
+                "description": "一次创建多台相同配置的ECS实例（最多100台）并等待全部运行。需要参数: amount, instance_type, image_id等",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "amount": {"type": "integer", "description": "创建的实例数量，1-100"},
+                        "min_amount": {"type": "integer", "description": "库存不足时可接受的最少数量，默认等于amount"},
+                        "instance_type": {"type": "string", "description": "实例规格，如 ecs.g6.large"},
+                        "image_id": {"type": "string", "description": "镜像ID"},
+                        "instance_name": {"type": "string", "description": "实例名称，多台时自动追加序号"},
+                        "system_disk_size": {"type": "integer", "description": "系统盘大小(GB)"},
+                        "security_group_id": {"type": "string", "description": "安全组ID"},
+                        "vswitch_id": {"type": "string", "description": "交换机ID"},
+                        "password": {"type": "string", "description": "实例登录密码"},
+                        "region": {"type": "string", "description": "地域ID，如 cn-beijing，默认使用配置的地域"}
+                    },
+                    "required": ["amount"]
+                }
             },
             "create_oss_bucket": {
                 "function": tool_kit.create_oss_bucket,
-                "description": "创建OSS Bucket。需要参数: bucket_name, acl等"
+                "description": "创建OSS Bucket。需要参数: bucket_name, acl等",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "bucket_name": {
+                            "type": "string",
+                            "description": "全局唯一的Bucket名称：小写字母、数字和短横线，3-63字符"
+                        },
+                        "acl": {
+                            "type": "string",
+                            "enum": ["private", "public-read", "public-read-write"],
+                            "description": "访问权限，默认private"
+                        },
+                        "region": {"type": "string", "description": "地域ID，如 cn-beijing，默认使用配置的地域"}
+                    },
+                    "required": ["bucket_name"]
+                }
+            },
+            "query_inventory": {
+                "function": tool_kit.query_inventory,
+                "description": "查询当前用户已有的云资源清单（本地记录，毫秒级返回），如列出所有实例或已停止的实例",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "resource_type": {"type": "string", "enum": ["ecs", "oss", "vswitch"], "description": "资源类型"},
+                        "region": {"type": "string", "description": "地域ID，如 cn-beijing"},
+                        "status": {"type": "string", "description": "资源状态，如 Running、Stopped、available"},
+                        "limit": {"type": "integer", "description": "最多返回的条数，默认50"}
+                    },
+                    "required": []
+                }
             },
             "check_ecs_status": {
                 "function": tool_kit.check_ecs_status,
-                "description": "检查ECS实例状态。需要参数: 实例ID"
+                "description": "检查ECS实例状态。需要参数: 实例ID",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "instance_id": {"type": "string", "description": "ECS实例ID，如 i-bp1xxxx"},
+                        "region": {"type": "string", "description": "地域ID，如 cn-beijing，默认使用配置的地域"}
+                    },
+                    "required": ["instance_id"]
+                }
             }
         }
+        # 快速路由：高置信度的简单意图直接调用工具
+        self.router = IntentRouter(self.tools) if config["router_enabled"] else None
         logger.info("Agent初始化完成，可用工具: %s", list(self.tools.keys()))
 
     def _extract_action(self, text: str) -> Dict[str, Any]:
         """从文本中提取Action"""
-        text = text.strip()
+        with PARSE_LATENCY.time():
+            return self._match_action(text.strip())
 
+    def _match_action(self, text: str) -> Dict[str, Any]:
+        """按Action优先、Final Answer其次的顺序匹配模型输出"""
         # 先尝试解析Action和Action Input，优先于Final Answer
+        actions = self._extract_actions(text)
+        if actions:
+            return actions[0]
         action_match = re.search(r"Action:\s*(\w+)\s*Action Input:\s*(.+?)(?:\s+Observation:|$)", text, re.DOTALL)
         if action_match:
-            action = action_match.group(1).strip()
-            action_input = action_match.group(2).strip()
-            #logger.debug("提取到动作: %s, 输入: %s", action, action_input)
-
-            # 清理JSON格式
-            action_input = action_input.replace('```json', '').replace('```', '').strip()
-
-            # 解析JSON或处理文本
-            if action_input.startswith('{'):
-                try:
-                    parsed_input = json.loads(action_input)
-                    logger.debug("成功解析JSON参数")
-                    return {
-                        "type": "action",
-                        "action": action,
-                        "action_input": parsed_input
-                    }
-                except json.JSONDecodeError:
-                    #logger.warning("JSON解析失败，尝试文本处理")
-                    pass
-
-            # 文本处理逻辑
-            if action == "create_oss_bucket":
-                bucket_name = self._extract_bucket_name(action_input)
-                if bucket_name:
-                    logger.debug("从文本提取到bucket名称: %s", bucket_name)
-                    return {
-                        "type": "action",
-                        "action": action,
-                        "action_input": {"bucket_name": bucket_name, "acl": "private"}
-                    }
+            action_info = self._parse_action_input(action_match.group(1).strip(), action_match.group(2).strip())
+            if action_info:
+                return action_info
 
         # 检查最终答案 - 只有在没有Action时才返回Final Answer
         if "Final Answer:" in text:
@@ -136,6 +419,49 @@ class SimpleAgent:
             "content": text
         }
 
+    def _parse_action_input(self, action: str, action_input: str) -> Optional[Dict[str, Any]]:
+        """解析Action Input，无法解析时返回None"""
+        #logger.debug("提取到动作: %s, 输入: %s", action, action_input)
+
+        # 清理JSON格式
+        action_input = action_input.replace('```json', '').replace('```', '').strip()
+
+        # 解析JSON或处理文本
+        if action_input.startswith('{'):
+            try:
+                parsed_input = json.loads(action_input)
+                logger.debug("成功解析JSON参数")
+                return {
+                    "type": "action",
+                    "action": action,
+                    "action_input": parsed_input
+                }
+            except json.JSONDecodeError:
+                #logger.warning("JSON解析失败，尝试文本处理")
+                pass
+
+        # 文本处理逻辑
+        if action == "create_oss_bucket":
+            bucket_name = self._extract_bucket_name(action_input)
+            if bucket_name:
+                logger.debug("从文本提取到bucket名称: %s", bucket_name)
+                return {
+                    "type": "action",
+                    "action": action,
+                    "action_input": {"bucket_name": bucket_name, "acl": "private"}
+                }
+        return None
+
+    def _extract_actions(self, text: str) -> List[Dict[str, Any]]:
+        """从文本中提取同一轮给出的所有Action"""
+        actions = []
+        pattern = r"Action:\s*(\w+)\s*Action Input:\s*(.+?)(?=\s*(?:Thought:|Action:|Observation:|Final Answer:)|$)"
+        for match in re.finditer(pattern, text.strip(), re.DOTALL):
+            action_info = self._parse_action_input(match.group(1).strip(), match.group(2).strip())
+            if action_info:
+                actions.append(action_info)
+        return actions
+
     def _extract_bucket_name(self, text: str) -> str:
         """从文本中提取bucket名称"""
         # 查找bucket名称模式
@@ -170,8 +496,33 @@ class SimpleAgent:
         pattern = r'^[a-z0-9][a-z0-9-]{1,61}[a-z0-9]$'
         return bool(re.match(pattern, bucket_name)) and 3 <= len(bucket_name) <= 63
 
-    def _build_system_prompt(self) -> str:
+    def _tool_schemas(self) -> List[Dict[str, Any]]:
+        """根据工具注册表生成OpenAI兼容的tools定义"""
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": tool["description"],
+                    "parameters": tool["parameters"]
+                }
+            }
+            for name, tool in self.tools.items()
+        ]
+
+    def _build_system_prompt(self, native: bool = False) -> str:
         """构建系统提示词"""
+        if native:
+            # 原生工具调用模式下工具定义通过tools参数传递，无需描述文本格式
+            return """你是一个云基础设施运维AI助手，负责阿里云资源的自动化交付。
+
+重要规则：
+- 需要操作资源时直接调用提供的工具，参数必须符合工具定义
+- 多个相互独立的操作（如同时创建ECS和OSS）请在一次回复中同时发起多个工具调用，它们会被并行执行
+- 对于OSS Bucket创建，用户必须提供bucket_name参数，缺少时请向用户询问，不要自行编造
+- bucket_name必须全局唯一，符合命名规范：小写字母、数字和短横线，3-63字符
+- 不要假设操作结果，根据工具实际返回的结果给出最终回答"""
+
         tools_desc = "\n".join([f"- {name}: {desc['description']}" for name, desc in self.tools.items()])
 
         return f"""你是一个云基础设施运维AI助手，负责阿里云资源的自动化交付。
@@ -183,6 +534,7 @@ class SimpleAgent:
 - 对于OSS Bucket创建，用户必须提供bucket_name参数
 - bucket_name必须全局唯一，符合命名规范：小写字母、数字和短横线，3-63字符
 - 使用JSON格式传递参数
+- 多个相互独立的操作可以在同一轮中给出多组 Action/Action Input，它们会被并行执行
 - 不要假设操作结果，等待实际执行后的Observation
 
 响应格式：
@@ -195,56 +547,391 @@ Final Answer: 基于实际执行结果的最终回答
 
 现在开始处理用户请求："""
 
-    def process_request(self, user_input: str, max_iterations: int = 3) -> str:
-        """处理用户请求"""
-        #logger.info("处理用户请求: %s", user_input)
-        messages = [
-            {"role": "system", "content": self._build_system_prompt()},
+    def _extract_thought(self, text: str) -> str:
+        """从文本中提取Thought"""
+        match = re.search(r"Thought:\s*(.+?)(?=\s*(?:Action:|Final Answer:)|$)", text, re.DOTALL)
+        return match.group(1).strip() if match else ""
+
+    def _action_end(self, text: str) -> Optional[int]:
+        """流式生成中判断动作是否已完整
+
+        最后一个Action Input的JSON已闭合，且其后开始了Observation、Final Answer等内容时，返回JSON结束的位置；
+        其后为空或仍可能是下一组Thought/Action时返回None，继续生成。
+        """
+        start = text.rfind("Action Input:")
+        if start < 0:
+            return None
+        brace = text.find("{", start)
+        if brace < 0 or text[start + len("Action Input:"):brace].replace("```json", "").strip():
+            return None
+        depth, in_string, escaped = 0, False, False
+        for end in range(brace, len(text)):
+            char = text[end]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    rest = text[end + 1:].replace("```", "").lstrip()
+                    if not rest or any(rest.startswith(k) or k.startswith(rest) for k in ("Action", "Thought")):
+                        return None
+                    return end + 1
+        return None
+
+    def _generate(self, messages: List[Dict[str, Any]], iteration: int, stream: bool,
+                  use_cache: bool = True, tools: Optional[List[Dict]] = None, phase: str = "action"
+                  ) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """调用LLM；流式模式下逐段产出token事件，返回完整的assistant消息
+
+        phase为action（动作步骤）或answer（最终回答），决定本次生成的max_tokens；
+        动作步骤因达到上限而截断、且没有得到完整动作时，按最终回答的上限重新生成一次。
+        """
+        start = time.perf_counter()
+        max_tokens = self.max_tokens[phase]
+        stop = self.llm.stop_sequences
+        if not stream:
+            message = self.llm.chat_message(messages, tools=tools, use_cache=use_cache, max_tokens=max_tokens, stop=stop)
+        else:
+            deltas = self.llm.chat_message_stream(
+                messages, tools=tools, use_cache=use_cache, max_tokens=max_tokens, stop=stop,
+                complete_at=self._action_end if self.stream_early_abort else None)
+            while True:
+                try:
+                    delta = next(deltas)
+                except StopIteration as finished:
+                    message = finished.value
+                    break
+                yield {"event": "token", "data": {"iteration": iteration, "content": delta}}
+        LLM_LATENCY.observe(
+            time.perf_counter() - start,
+            mode="native" if tools else "react",
+            stream=str(stream).lower(),
+            outcome="error" if message.get("error") else "ok",
+        )
+        if message.get("error"):
+            return message
+        LLM_FINISH.inc(phase=phase, reason=message.get("finish_reason") or "unknown")
+        if (phase == "action" and message.get("finish_reason") == "length" and not message.get("tool_calls")
+                and self._extract_action(message.get("content") or "")["type"] != "action"):
+            # 已流式输出的部分不再重复推送，重新生成的完整内容通过final事件返回
+            logger.info(f"动作步骤达到max_tokens={max_tokens}仍未完成，按最终回答的上限重新生成")
+            message = yield from self._generate(messages, iteration, False, use_cache, tools, phase="answer")
+        return message
+
+    def _execute_tool(self, action: str, action_input: Any) -> Dict[str, Any]:
+        """执行工具，返回 {"observation": 结果} 或 {"error": 错误信息}"""
+        if action not in self.tools:
+            ERRORS.inc(stage="tool", error_class="UnknownTool")
+            return {"error": f"未知工具: {action}"}
+        try:
+            # 调用工具
+            tool_func = self.tools[action]["function"]
+            #logger.info("调用工具函数: %s", action)
+            return {"observation": tool_func(action_input)}
+        except Exception as e:
+            ERRORS.inc(stage="tool", error_class=type(e).__name__)
+            return {"error": f"执行工具 {action} 时出错: {str(e)}"}
+
+    def _build_messages(self, user_input: str, history: List[Dict[str, str]], native: bool) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": self._build_system_prompt(native)},
+            *history,
             {"role": "user", "content": f"Question: {user_input}"}
         ]
 
+    def iter_events(self, user_input: str, max_iterations: int = 3, stream: bool = False,
+                    use_cache: bool = True, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """处理用户请求，按ReAct步骤逐个产出事件
+
+        事件类型: token(仅流式)、step、observation、error、final；final总是最后一个事件，
+        其中iterations为本次请求调用大模型的轮数（快速路由为0），tokens_saved为上下文压缩节省的提示token数（本地估算）。
+        指定session_id时会带上该会话按token预算裁剪后的历史，并在结束时保存本轮问答。
+        """
+        #logger.info("处理用户请求: %s", user_input)
+        history = []
+        if session_id:
+            history = trim_history(self.sessions.get_history(session_id), self.history_token_budget)
+        observations = []
+        for event in self._agent_loop(user_input, history, max_iterations, stream, use_cache):
+            if event["event"] == "observation":
+                observations.append(event["data"])
+            elif event["event"] == "final":
+                iterations = event["data"].get("iterations", 0)
+                ITERATIONS.observe(iterations, path="llm" if iterations else "router")
+                if session_id:
+                    self._save_turn(session_id, user_input, event["data"]["content"], observations)
+            yield event
+
+    def _save_turn(self, session_id: str, user_input: str, answer: str, observations: List[Dict[str, Any]]):
+        """保存本轮问答，只保留工具结果中的关键字段，供后续追问引用"""
+        content = f"Final Answer: {answer}"
+        results = [
+            {k: obs["observation"][k] for k in ("resource_type", "resource_id", "status") if k in obs["observation"]}
+            for obs in observations if isinstance(obs.get("observation"), dict)
+        ]
+        results = [r for r in results if r]
+        if results:
+            content += f"\n本轮操作结果: {json.dumps(results, ensure_ascii=False)}"
+        try:
+            self.sessions.append(session_id, [
+                {"role": "user", "content": f"Question: {user_input}"},
+                {"role": "assistant", "content": content}
+            ])
+        except Exception as e:
+            logger.warning(f"保存会话失败: {e}")
+
+    def _agent_loop(self, user_input: str, history: List[Dict[str, str]], max_iterations: int,
+                    stream: bool, use_cache: bool) -> Iterator[Dict[str, Any]]:
+        """按配置选择原生工具调用或文本ReAct；原生模式不可用时回退到文本ReAct
+
+        结构明确的简单请求先经快速路由直接调用工具，不经过大模型。
+        """
+        routed = self.router.route(user_input) if self.router else None
+        if routed:
+            yield {"event": "step", "data": {
+                "iteration": 0,
+                "thought": "快速路由",
+                "action": routed["action"],
+                "action_input": routed["action_input"]
+            }}
+            yield {"event": "observation", "data": {"action": routed["action"], "observation": routed["observation"]}}
+            yield {"event": "final", "data": {"content": routed["answer"], "iterations": 0, "tokens_saved": 0}}
+            return
+
+        contexts = []
+        if self.tool_mode == "native":
+            contexts.append(self._new_context(user_input, history, native=True))
+            handled = yield from self._with_tokens_saved(
+                self._native_loop(contexts[-1], max_iterations, stream, use_cache), contexts, "native")
+            if handled:
+                return
+        contexts.append(self._new_context(user_input, history, native=False))
+        yield from self._with_tokens_saved(
+            self._react_loop(contexts[-1], max_iterations, stream, use_cache), contexts, "react")
+
+    def _new_context(self, user_input: str, history: List[Dict[str, str]], native: bool) -> ContextCompactor:
+        return ContextCompactor(self._build_messages(user_input, history, native),
+                                token_budget=self.prompt_token_budget, enabled=self.compaction_enabled)
+
+    def _with_tokens_saved(self, loop: Generator[Dict[str, Any], None, Any], contexts: List[ContextCompactor],
+                           mode: str) -> Generator[Dict[str, Any], None, Any]:
+        """转发主循环的事件，在final事件中附上本次请求上下文压缩节省的token数"""
+        while True:
+            try:
+                event = next(loop)
+            except StopIteration as stop:
+                return stop.value
+            if event["event"] == "final":
+                tokens_saved = sum(context.tokens_saved for context in contexts)
+                event["data"]["tokens_saved"] = tokens_saved
+                if tokens_saved:
+                    PROMPT_TOKENS_SAVED.inc(tokens_saved, mode=mode)
+                    logger.info(f"上下文压缩节省约 {tokens_saved} 个提示token")
+            yield event
+
+    def _native_loop(self, context: ContextCompactor, max_iterations: int, stream: bool,
+                     use_cache: bool) -> Generator[Dict[str, Any], None, bool]:
+        """原生工具调用主循环，直接读取结构化的tool_calls参数
+
+        首轮调用因接口不支持tools而失败时返回False，由调用方回退到文本ReAct。
+        """
+        tools = self._tool_schemas()
+        for i in range(max_iterations):
+            message = yield from self._generate(context.prompt(), i + 1, stream, use_cache, tools=tools,
+                                                phase="answer" if context.turns else "action")
+            content = message.get("content") or ""
+
+            if message.get("error"):
+                if i == 0 and message.get("status_code") == 400:
+                    logger.warning("原生工具调用不可用，回退到文本ReAct模式")
+                    return False
+                yield {"event": "final", "data": {"content": content, "iterations": i + 1}}
+                return True
+
+            tool_calls = message.get("tool_calls")
+            if not tool_calls:
+                # 模型仍可能按文本ReAct格式回复，兼容处理
+                action_info = self._extract_action(content)
+                if action_info["type"] == "final":
+                    logger.info("返回最终答案")
+                    yield {"event": "final", "data": {"content": action_info["content"], "iterations": i + 1}}
+                    return True
+                actions = self._extract_actions(content) or [action_info]
+                yield from self._run_text_actions(content, actions, i + 1, context)
+                continue
+
+            calls = []
+            for call in tool_calls:
+                action = call["function"]["name"]
+                try:
+                    action_input = json.loads(call["function"].get("arguments") or "{}")
+                except json.JSONDecodeError:
+                    ERRORS.inc(stage="parse", error_class="InvalidToolArguments")
+                    action_input = None
+                calls.append((action, action_input))
+                logger.info("执行动作: %s", action)
+                yield {"event": "step", "data": {
+                    "iteration": i + 1,
+                    "thought": content,
+                    "action": action,
+                    "action_input": action_input
+                }}
+
+            # 参数合法的工具调用并发执行
+            results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+            runnable = [index for index, (_, action_input) in enumerate(calls) if action_input is not None]
+            for index, (action, action_input) in enumerate(calls):
+                if action_input is None:
+                    results[index] = {"error": f"工具 {action} 的参数不是合法JSON"}
+                    yield {"event": "error", "data": {"message": results[index]["error"]}}
+            for position, result in self._execute_tools([calls[index] for index in runnable]):
+                index = runnable[position]
+                results[index] = result
+                if "error" in result:
+                    yield {"event": "error", "data": {"message": result["error"]}}
+                else:
+                    yield {"event": "observation", "data": {"action": calls[index][0], "observation": result["observation"]}}
+
+            # 所有工具结果按调用顺序一次性回传；较早的轮次只保留工具调用和结果摘要
+            assistant = {"role": "assistant", "content": content, "tool_calls": tool_calls}
+            turn, summary, raw = [assistant], [{**assistant, "content": ""}], [assistant]
+            for call, result in zip(tool_calls, results):
+                payload = {"error": result["error"]} if "error" in result else result["observation"]
+                message = {"role": "tool", "tool_call_id": call.get("id")}
+                turn.append({**message, "content": encode_observation(payload, compact=context.enabled)})
+                summary.append({**message, "content": summarize_observation(payload)})
+                raw.append({**message, "content": encode_observation(payload, compact=False)})
+            context.add_turn(turn, summary, raw_tokens=estimate_message_tokens(raw))
+
+        yield {"event": "final", "data": {"content": "达到最大迭代次数，未能完成请求。", "iterations": max_iterations}}
+        return True
+
+    def _execute_tools(self, calls: List[Tuple[str, Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """在工具线程池中并发执行多个相互独立的工具调用，按完成顺序产出 (序号, 结果)"""
+        if len(calls) == 1:
+            yield 0, self._execute_tool(*calls[0])
+            return
+        # 每个任务复制一份上下文，工具中可读取请求用户等上下文变量
+        futures = {self.tool_pool.submit(contextvars.copy_context().run, self._execute_tool, action, action_input): index
+                   for index, (action, action_input) in enumerate(calls)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def _run_text_actions(self, response: str, actions: List[Dict[str, Any]], iteration: int,
+                          context: ContextCompactor) -> Iterator[Dict[str, Any]]:
+        """执行从文本ReAct格式中解析出的动作（可能有多个），并将所有Observation合并为一条消息追加到对话"""
+        thought = self._extract_thought(response)
+        for action_info in actions:
+            logger.info("执行动作: %s", action_info["action"])
+            yield {"event": "step", "data": {
+                "iteration": iteration,
+                "thought": thought,
+                "action": action_info["action"],
+                "action_input": action_info["action_input"]
+            }}
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(actions)
+        for index, result in self._execute_tools([(a["action"], a["action_input"]) for a in actions]):
+            results[index] = result
+            if "error" in result:
+                #logger.error(result["error"])
+                yield {"event": "error", "data": {"message": result["error"]}}
+            else:
+                #logger.info("工具执行完成，状态: %s", observation.get('status', 'unknown'))
+                yield {"event": "observation", "data": {
+                    "action": actions[index]["action"], "observation": result["observation"]}}
+
+        # 较早的轮次折叠为Action和结果摘要，去掉Thought
+        action_lines = "\n".join(
+            f"Action: {a['action']}\nAction Input: {json.dumps(a['action_input'], ensure_ascii=False)}" for a in actions)
+        observation = self._observation_text(
+            actions, results, lambda value: encode_observation(value, compact=context.enabled))
+        raw_observation = self._observation_text(
+            actions, results, lambda value: encode_observation(value, compact=False))
+        raw = [{"role": "assistant", "content": response}, {"role": "user", "content": raw_observation}]
+        context.add_turn(
+            [{"role": "assistant", "content": response}, {"role": "user", "content": observation}],
+            [{"role": "assistant", "content": action_lines},
+             {"role": "user", "content": self._observation_text(actions, results, summarize_observation)}],
+            raw_tokens=estimate_message_tokens(raw)
+        )
+
+    @staticmethod
+    def _observation_text(actions: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                          encode: Callable[[Any], str]) -> str:
+        """将工具结果按调用顺序合并为一条Observation消息"""
+        if len(actions) == 1:
+            if "error" in results[0]:
+                return f"Error: {results[0]['error']}"
+            return f"Observation: {encode(results[0]['observation'])}"
+        lines = []
+        for index, (action_info, result) in enumerate(zip(actions, results), start=1):
+            if "error" in result:
+                lines.append(f"Observation {index} ({action_info['action']}): Error: {result['error']}")
+            else:
+                lines.append(f"Observation {index} ({action_info['action']}): {encode(result['observation'])}")
+        return "\n".join(lines)
+
+    def _react_loop(self, context: ContextCompactor, max_iterations: int, stream: bool,
+                    use_cache: bool) -> Iterator[Dict[str, Any]]:
+        """ReAct主循环"""
         for i in range(max_iterations):
            # logger.debug("第 %d 次迭代", i+1)
             # 调用LLM
-            response = self.llm.chat_completion(messages)
+            message = yield from self._generate(context.prompt(), i + 1, stream, use_cache,
+                                                phase="answer" if context.turns else "action")
+            response = message.get("content") or ""
 
             # 解析响应
             action_info = self._extract_action(response)
 
             if action_info["type"] == "final":
                 logger.info("返回最终答案")
-                return action_info["content"]
+                yield {"event": "final", "data": {"content": action_info["content"], "iterations": i + 1}}
+                return
 
             elif action_info["type"] == "action":
-                action = action_info["action"]
-                action_input = action_info["action_input"]
-                logger.info("执行动作: %s", action)
-
-                if action in self.tools:
-                    try:
-                        # 调用工具
-                        tool_func = self.tools[action]["function"]
-                        #logger.info("调用工具函数: %s", action)
-                        observation = tool_func(action_input)
-                        #logger.info("工具执行完成，状态: %s", observation.get('status', 'unknown'))
-
-                        # 更新对话
-                        messages.extend([
-                            {"role": "assistant", "content": response},
-                            {"role": "user", "content": f"Observation: {json.dumps(observation, ensure_ascii=False)}"}
-                        ])
-                    except Exception as e:
-                        error_msg = f"执行工具 {action} 时出错: {str(e)}"
-                        #logger.error(error_msg)
-                        messages.append({"role": "user", "content": f"Error: {error_msg}"})
-                else:
-                    error_msg = f"未知工具: {action}"
-                    #logger.error(error_msg)
-                    messages.append({"role": "user", "content": f"Error: {error_msg}"})
+                actions = self._extract_actions(response) or [action_info]
+                yield from self._run_text_actions(response, actions, i + 1, context)
 
         #logger.warning("达到最大迭代次数，未能完成请求")
-        return "达到最大迭代次数，未能完成请求。"
+        yield {"event": "final", "data": {"content": "达到最大迭代次数，未能完成请求。", "iterations": max_iterations}}
+
+    def process_request(self, user_input: str, max_iterations: int = 3, use_cache: bool = True,
+                        session_id: Optional[str] = None) -> str:
+        """处理用户请求"""
+        content = ""
+        for event in self.iter_events(user_input, max_iterations, use_cache=use_cache, session_id=session_id):
+            if event["event"] == "final":
+                content = event["data"]["content"]
+        return content
+
+
+_agent: Optional[SimpleAgent] = None
+_agent_lock = threading.Lock()
+
+
+def get_agent() -> SimpleAgent:
+    """返回全局Agent实例，首次调用时创建"""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = SimpleAgent()
+    return _agent
 
 
-# 全局Agent实例
-infra_agent = SimpleAgent()
+def __getattr__(name: str):
+    # 兼容 from agent_core import infra_agent 的用法，访问时才创建实例
+    if name == "infra_agent":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,24 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional
+import json
+import uuid
 import uvicorn
 import logging
 
-from agent_core import infra_agent
+from agent_core import get_agent
+from tools import get_tool_kit
+from config import load_config
+from executor import AgentExecutor, OverloadedError
+from inventory import current_request, current_user
+from jobs import FINISHED_STATUSES, create_job_queue, public_job
+from metrics import REGISTRY
+from ratelimit import limiter_stats
+from models import ResourceType, ECS_DEFAULT_CONFIG, OSS_DEFAULT_CONFIG
+from scheduler import get_provision_scheduler
+from worker import JOB_HANDLERS, JobWorker
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -15,9 +30,36 @@ app = FastAPI(
     version="1.0.0"
 )
 
+config = load_config()
+# Agent调用在有界线程池中执行，避免阻塞事件循环
+agent_executor = AgentExecutor(
+    max_concurrency=config["agent_max_concurrency"],
+    queue_size=config["agent_queue_size"],
+    retry_after=config["agent_retry_after"],
+)
+REGISTRY.gauge("agent_executor_active", "正在执行的Agent请求数", lambda: agent_executor.stats()["active"])
+REGISTRY.gauge("agent_executor_waiting", "排队等待执行的Agent请求数", lambda: agent_executor.stats()["waiting"])
+# 结构化批量交付，不经过大模型；工具实例在首次调用时才创建
+provision_scheduler = get_provision_scheduler()
+# 后台任务队列；内存队列由本进程的工作线程消费，SQLite/Redis队列还可由独立的worker.py进程消费
+job_queue = create_job_queue(config)
+job_worker = JobWorker(job_queue, concurrency=config["job_inprocess_workers"]) \
+    if config["job_inprocess_workers"] > 0 else None
+
 class UserRequest(BaseModel):
     message: str
     user_id: str = "default"
+    use_cache: bool = True
+    request_id: Optional[str] = None
+
+def _bind_request(user_id: str, request_id: Optional[str]):
+    """设置当前用户和请求标识；客户端重试同一请求时传入相同的request_id，创建调用复用同一幂等令牌"""
+    current_user.set(user_id)
+    current_request.set(request_id or uuid.uuid4().hex)
+
+def _session_id(request: UserRequest):
+    """未指定user_id的请求不共享会话"""
+    return request.user_id if request.user_id != "default" else None
 
 class AgentResponse(BaseModel):
     response: str
@@ -28,16 +70,301 @@ async def chat_with_agent(request: UserRequest):
     """与基础设施Agent对话"""
     try:
         logger.info(f"收到用户 {request.user_id} 的请求: {request.message}")
-        response = infra_agent.process_request(request.message)
+        _bind_request(request.user_id, request.request_id)
+        response = await agent_executor.submit(
+            get_agent().process_request, request.message,
+            use_cache=request.use_cache, session_id=_session_id(request))
         return AgentResponse(response=response)
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"处理请求时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    """将Agent事件编码为Server-Sent Events格式"""
+    data = json.dumps(event["data"], ensure_ascii=False)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+async def _sse_stream(first: Dict[str, Any], events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    yield _format_sse(first)
+    try:
+        async for event in events:
+            yield _format_sse(event)
+    except Exception as e:
+        logger.error(f"流式处理请求时发生错误: {str(e)}")
+        yield _format_sse({"event": "error", "data": {"message": str(e)}})
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: UserRequest):
+    """与基础设施Agent对话（SSE流式返回token、ReAct步骤和工具结果）"""
+    logger.info(f"收到用户 {request.user_id} 的流式请求: {request.message}")
+    _bind_request(request.user_id, request.request_id)
+    events = agent_executor.stream(
+        get_agent().iter_events, request.message, stream=True,
+        use_cache=request.use_cache, session_id=_session_id(request))
+    try:
+        # 先取第一个事件，以便在响应开始前完成准入检查
+        first = await events.__anext__()
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"处理请求时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    return StreamingResponse(
+        _sse_stream(first, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class ProvisionItem(BaseModel):
+    id: str
+    type: ResourceType
+    params: Dict[str, Any] = {}
+    depends_on: List[str] = []
+
+class BatchProvisionRequest(BaseModel):
+    items: List[ProvisionItem]
+    user_id: str = "default"
+    request_id: Optional[str] = None
+
+def _provision_items(request: BatchProvisionRequest) -> List[Dict[str, Any]]:
+    """转换为调度器任务，ECS/OSS参数以models.py中的默认配置为基础"""
+    defaults = {
+        ResourceType.ECS: ECS_DEFAULT_CONFIG,
+        ResourceType.ECS_FLEET: ECS_DEFAULT_CONFIG,
+        ResourceType.OSS: OSS_DEFAULT_CONFIG,
+    }
+    return [
+        {
+            "id": item.id,
+            "type": item.type.value,
+            "params": {**defaults.get(item.type, {}), **item.params},
+            "depends_on": item.depends_on,
+        }
+        for item in request.items
+    ]
+
+@app.post("/provision/batch")
+async def provision_batch(request: BatchProvisionRequest, stream: bool = False):
+    """按结构化规格批量交付资源；stream=true时以SSE返回逐项进度"""
+    items = _provision_items(request)
+    try:
+        provision_scheduler.validate(items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"收到用户 {request.user_id} 的批量交付请求: {len(items)} 项")
+    _bind_request(request.user_id, request.request_id)
+
+    try:
+        if not stream:
+            return await agent_executor.submit(provision_scheduler.run_to_completion, items)
+        events = agent_executor.stream(provision_scheduler.run, items)
+        first = await events.__anext__()
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"批量交付时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        _sse_stream(first, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class FleetRequest(BaseModel):
+    amount: int
+    min_amount: Optional[int] = None
+    params: Dict[str, Any] = {}
+    wait: bool = True
+    user_id: str = "default"
+    request_id: Optional[str] = None
+
+def _fleet_config(request: FleetRequest) -> Dict[str, Any]:
+    return {
+        **ECS_DEFAULT_CONFIG,
+        **request.params,
+        "amount": request.amount,
+        "min_amount": request.min_amount,
+        "wait": request.wait,
+    }
+
+@app.post("/provision/fleet")
+async def provision_fleet(request: FleetRequest):
+    """一次请求创建一组相同配置的ECS实例（RunInstances），返回实例组的汇总结果"""
+    fleet_config = _fleet_config(request)
+    logger.info(f"收到用户 {request.user_id} 的实例组创建请求: {request.amount} 台")
+    _bind_request(request.user_id, request.request_id)
+    try:
+        result = await agent_executor.submit(get_tool_kit().create_ecs_fleet, fleet_config)
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"创建实例组时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if result.get("status") == "failed" and not result.get("details"):
+        raise HTTPException(status_code=400, detail=result.get("message"))
+    return result
+
+class JobRequest(BaseModel):
+    kind: str
+    payload: Dict[str, Any] = {}
+
+def _job_payload(request: JobRequest):
+    """按任务类型校验并规范化payload，返回 (payload, user_id)；payload格式与同步接口的请求体相同"""
+    if request.kind == "chat":
+        chat = UserRequest(**request.payload)
+        return {"message": chat.message, "use_cache": chat.use_cache, "session_id": _session_id(chat)}, chat.user_id
+    if request.kind == "provision":
+        batch = BatchProvisionRequest(**request.payload)
+        items = _provision_items(batch)
+        provision_scheduler.validate(items)
+        return {"items": items}, batch.user_id
+    if request.kind == "fleet":
+        fleet = FleetRequest(**request.payload)
+        return {"fleet_config": _fleet_config(fleet)}, fleet.user_id
+    raise ValueError(f"不支持的任务类型: {request.kind}，可选: {sorted(JOB_HANDLERS)}")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """提交后台任务，立即返回job_id；结果通过 GET /jobs/{job_id}/result 获取"""
+    try:
+        payload, user_id = _job_payload(request)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # SQLite/Redis队列的读写是阻塞调用，放到线程池中执行，避免阻塞事件循环
+    job = await run_in_threadpool(job_queue.submit, request.kind, payload, user_id=user_id)
+    logger.info(f"收到用户 {user_id} 的后台任务: {job['job_id']} ({request.kind})")
+    return {
+        **public_job(job),
+        "status_url": f"/jobs/{job['job_id']}",
+        "result_url": f"/jobs/{job['job_id']}/result",
+    }
+
+async def _get_job(job_id: str) -> Dict[str, Any]:
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询后台任务状态"""
+    return public_job(await _get_job(job_id))
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """获取后台任务结果；任务未完成时返回202"""
+    job = await _get_job(job_id)
+    if job["status"] not in FINISHED_STATUSES:
+        return Response(
+            content=json.dumps(public_job(job), ensure_ascii=False),
+            status_code=202,
+            headers={"Content-Type": "application/json", "Retry-After": str(config["agent_retry_after"])},
+        )
+    return public_job(job, include_result=True)
+
+@app.get("/operations/{operation_id}")
+async def get_operation(operation_id: str):
+    """查询资源就绪等待操作的进度"""
+    operation = get_tool_kit().waiter.get(operation_id)
+    if operation is None:
+        raise HTTPException(status_code=404, detail=f"操作不存在: {operation_id}")
+    return operation.to_dict()
+
+def _get_inventory():
+    tool_kit = get_tool_kit()
+    if tool_kit.inventory is None:
+        raise HTTPException(status_code=404, detail="资源清单未启用")
+    return tool_kit
+
+@app.get("/inventory")
+async def list_inventory(user_id: str, resource_type: Optional[str] = None,
+                         region: Optional[str] = None, status: Optional[str] = None,
+                         limit: int = 100, offset: int = 0):
+    """查询某个用户的本地资源清单（不调用云API），可按资源类型、地域和状态过滤；user_id必填，不返回其他用户的资源"""
+    tool_kit = _get_inventory()
+    tool_kit.maybe_sync_inventory()
+    result = await run_in_threadpool(
+        tool_kit.inventory.query,
+        user_id=user_id, resource_type=resource_type, region=region, status=status,
+        limit=min(max(limit, 1), 1000), offset=max(offset, 0),
+    )
+    return {**result, "sync": tool_kit.inventory_sync_stats()}
+
+@app.post("/inventory/sync")
+async def sync_inventory():
+    """立即从云端分页同步资源清单"""
+    tool_kit = _get_inventory()
+    try:
+        return await agent_executor.submit(tool_kit.sync_inventory)
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@app.delete("/sessions/{user_id}")
+async def clear_session(user_id: str):
+    """清除用户的多轮会话历史"""
+    await run_in_threadpool(get_agent().sessions.clear, user_id)
+    return {"status": "success", "user_id": user_id}
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
     return {"status": "healthy", "service": "infra-agent"}
 
+@app.get("/stats")
+async def get_stats():
+    """运行时统计信息"""
+    # 清单和任务队列的统计需要查询SQLite/Redis，在线程池中汇总
+    return await run_in_threadpool(_collect_stats)
+
+def _collect_stats() -> Dict[str, Any]:
+    agent, tool_kit = get_agent(), get_tool_kit()
+    return {
+        "llm_pool": agent.llm.pool_stats(),
+        "llm_cache": agent.llm.cache_stats(),
+        "executor": agent_executor.stats(),
+        "sessions": agent.sessions.stats(),
+        "router": agent.router.stats() if agent.router else {"enabled": False},
+        "waiter": tool_kit.waiter.stats(),
+        "ecs_status_batcher": tool_kit.ecs_status_batcher.stats(),
+        "state_cache": tool_kit.state_cache.stats(),
+        "create_dedup": tool_kit.create_dedup.stats(),
+        "rate_limits": limiter_stats(),
+        "bucket_index": tool_kit.bucket_index.stats() if tool_kit.bucket_index else {"enabled": False},
+        "inventory": {**tool_kit.inventory.stats(), **tool_kit.inventory_sync_stats()}
+        if tool_kit.inventory else {"enabled": False},
+        "jobs": {**job_queue.stats(), "inprocess_workers": job_worker.stats() if job_worker else None},
+        "region_pool": {"ecs": tool_kit.ecs_clients.stats(), "oss": tool_kit.oss_sessions.stats()},
+        "cassette": tool_kit.cassette.stats() if tool_kit.cassette else {"enabled": False},
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus格式的指标"""
+    return Response(content=REGISTRY.render(), headers={"Content-Type": REGISTRY.CONTENT_TYPE})
+
+@app.on_event("startup")
+async def start_job_worker():
+    if job_worker is not None:
+        job_worker.start()
+
+@app.on_event("startup")
+async def warm_bucket_index():
+    # 后台加载Bucket索引；工具集在这里创建，之后的请求直接复用
+    tool_kit = get_tool_kit()
+    if tool_kit.bucket_index:
+        tool_kit.bucket_index.warm()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if job_worker is not None:
+        job_worker.stop(timeout=5)
+    agent_executor.shutdown()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""ECS和OSS的离线替身
+
+FakeEcsClient实现AliyunToolKit用到的ECS SDK方法，FakeOssBackend提供Bucket操作对象和ListBuckets，
+两者都按配置的延迟模拟网络调用，并模拟资源从提交到就绪的过程。
+通过 AliyunToolKit(ecs_client=..., bucket_factory=..., oss_service=...) 注入。
+"""
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable
+
+
+class _CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = {}
+
+    def count(self, name: str):
+        with self._lock:
+            self._calls[name] = self._calls.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._calls)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+class FakeEcsClient:
+    """ECS客户端替身：新建实例在ready_after秒内为Pending，之后CreateInstance的实例变为Stopped，RunInstances的变为Running"""
+
+    def __init__(self, latency: float = 0.05, ready_after: float = 1.0, existing: Iterable[str] = ()):
+        self.latency = latency
+        self.ready_after = ready_after
+        self.counter = _CallCounter()
+        self._lock = threading.Lock()
+        # instance_id -> (实例名称, 就绪时间, 就绪后的状态)
+        self._instances: Dict[str, tuple] = {
+            instance_id: (instance_id, 0.0, "Running") for instance_id in existing
+        }
+
+    def _call(self, name: str):
+        self.counter.count(name)
+        time.sleep(self.latency)
+
+    def create_instance_with_options(self, request, runtime):
+        self._call("CreateInstance")
+        instance_id = f"i-{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._instances[instance_id] = (request.instance_name, time.monotonic() + self.ready_after, "Stopped")
+        return SimpleNamespace(body=SimpleNamespace(instance_id=instance_id, request_id=str(uuid.uuid4())))
+
+    def run_instances_with_options(self, request, runtime):
+        self._call("RunInstances")
+        instance_ids = [f"i-{uuid.uuid4().hex[:16]}" for _ in range(request.amount or 1)]
+        ready_at = time.monotonic() + self.ready_after
+        with self._lock:
+            for index, instance_id in enumerate(instance_ids, 1):
+                name = f"{request.instance_name}{index:03d}" if request.unique_suffix else request.instance_name
+                self._instances[instance_id] = (name, ready_at, "Running")
+        return SimpleNamespace(body=SimpleNamespace(
+            instance_id_sets=SimpleNamespace(instance_id_set=instance_ids),
+            order_id=str(uuid.uuid4().int)[:15],
+            request_id=str(uuid.uuid4()),
+        ))
+
+    def create_vswitch_with_options(self, request, runtime):
+        self._call("CreateVSwitch")
+        return SimpleNamespace(body=SimpleNamespace(v_switch_id=f"vsw-{uuid.uuid4().hex[:16]}"))
+
+    def describe_instances_with_options(self, request, runtime):
+        """按instance_ids查询；未指定时按max_results/next_token分页列举全部实例"""
+        self._call("DescribeInstances")
+        now = time.monotonic()
+        next_token = None
+        with self._lock:
+            if request.instance_ids:
+                instance_ids = [i for i in json.loads(request.instance_ids) if i in self._instances]
+            else:
+                start = int(request.next_token or 0)
+                page_size = request.max_results or 10
+                instance_ids = list(self._instances)[start:start + page_size]
+                if start + page_size < len(self._instances):
+                    next_token = str(start + page_size)
+            instances = []
+            for instance_id in instance_ids:
+                name, ready_at, ready_status = self._instances[instance_id]
+                instances.append(SimpleNamespace(
+                    instance_id=instance_id,
+                    instance_name=name,
+                    instance_type="ecs.g6.large",
+                    status=ready_status if now >= ready_at else "Pending",
+                    public_ip_address=None,
+                ))
+        return SimpleNamespace(body=SimpleNamespace(
+            instances=SimpleNamespace(instance=instances), next_token=next_token))
+
+
+class FakeOssBackend:
+    """OSS替身：新建的Bucket在ready_after秒后才能被GetBucketInfo查到"""
+
+    def __init__(self, latency: float = 0.03, ready_after: float = 0.5, existing: Iterable[str] = ()):
+        self.latency = latency
+        self.ready_after = ready_after
+        self.counter = _CallCounter()
+        self._lock = threading.Lock()
+        # bucket_name -> (就绪时间, 地域)
+        self._buckets: Dict[str, tuple] = {name: (0.0, "cn-hangzhou") for name in existing}
+
+    def bucket(self, bucket_name: str, region: str = None) -> "FakeBucket":
+        return FakeBucket(self, bucket_name, region or "cn-hangzhou")
+
+    def service(self) -> "FakeService":
+        return FakeService(self)
+
+    def _call(self, name: str):
+        self.counter.count(name)
+        time.sleep(self.latency)
+
+
+class FakeBucket:
+    def __init__(self, backend: FakeOssBackend, bucket_name: str, region: str):
+        self.backend = backend
+        self.bucket_name = bucket_name
+        self.region = region
+
+    def create_bucket(self, permission=None, input=None):
+        self.backend._call("PutBucket")
+        with self.backend._lock:
+            self.backend._buckets.setdefault(
+                self.bucket_name, (time.monotonic() + self.backend.ready_after, self.region))
+        return SimpleNamespace(status=200, request_id=str(uuid.uuid4()))
+
+    def get_bucket_info(self) -> Any:
+        from oss2.exceptions import NoSuchBucket
+
+        self.backend._call("GetBucketInfo")
+        with self.backend._lock:
+            ready_at, region = self.backend._buckets.get(self.bucket_name, (None, None))
+        if ready_at is None or time.monotonic() < ready_at:
+            raise NoSuchBucket(404, {}, "", {"Code": "NoSuchBucket", "Message": "The specified bucket does not exist."})
+        return SimpleNamespace(name=self.bucket_name, creation_date=ready_at, location=f"oss-{region}")
+
+
+class FakeService:
+    """oss2.Service替身，只实现分页ListBuckets"""
+
+    def __init__(self, backend: FakeOssBackend):
+        self.backend = backend
+
+    def list_buckets(self, prefix="", marker="", max_keys=100):
+        self.backend._call("ListBuckets")
+        with self.backend._lock:
+            names = sorted(name for name in self.backend._buckets if name > marker and name.startswith(prefix))
+            page = [SimpleNamespace(name=name, location=f"oss-{self.backend._buckets[name][1]}")
+                    for name in names[:max_keys]]
+        is_truncated = len(names) > max_keys
+        return SimpleNamespace(buckets=page, is_truncated=is_truncated,
+                               next_marker=page[-1].name if is_truncated else "")
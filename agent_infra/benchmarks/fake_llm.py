@@ -0,0 +1,185 @@
+"""本地OpenAI兼容聊天补全服务（DashScope替身）
+
+按对话内容返回脚本化的回复：首轮根据用户问题中的关键词给出工具调用
+（请求带tools时返回原生tool_calls，否则返回文本ReAct格式），
+收到工具结果后返回最终答案。每次调用按配置的延迟休眠，用于离线压测。
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+_INSTANCE_ID = re.compile(r"\bi-[a-z0-9]{6,}\b")
+_ECS_NAME = re.compile(r"实例\s*([a-z][a-z0-9-]{1,62})")
+_BUCKET_NAME = re.compile(r"bucket\s*([a-z0-9][a-z0-9-]{1,61}[a-z0-9])", re.IGNORECASE)
+
+
+def plan_actions(question: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """根据问题中的关键词决定本轮要调用的工具"""
+    instance_id = _INSTANCE_ID.search(question)
+    if instance_id:
+        return [("check_ecs_status", {"instance_id": instance_id.group(0)})]
+
+    actions = []
+    ecs_name = _ECS_NAME.search(question)
+    if "ECS" in question.upper() and ecs_name:
+        actions.append(("create_ecs_instance", {
+            "instance_type": "ecs.g6.large",
+            "image_id": "centos_7_9_x64_20G_alibase_20231219.vhd",
+            "instance_name": ecs_name.group(1),
+        }))
+    bucket_name = _BUCKET_NAME.search(question)
+    if bucket_name:
+        actions.append(("create_oss_bucket", {"bucket_name": bucket_name.group(1), "acl": "private"}))
+    return actions
+
+
+def scripted_reply(body: Dict[str, Any]) -> Dict[str, Any]:
+    """根据请求体生成assistant消息"""
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {"role": "user", "content": ""}
+    content = str(last.get("content") or "")
+    native = bool(body.get("tools"))
+
+    # 已经拿到工具结果，给出最终答案
+    if last.get("role") == "tool" or content.startswith(("Observation", "Error:")):
+        answer = "操作已完成，资源状态见上方执行结果。"
+        return {"role": "assistant", "content": answer if native else f"Thought: 已获得执行结果\nFinal Answer: {answer}"}
+
+    actions = plan_actions(content)
+    if not actions:
+        answer = "我可以帮您创建ECS实例、创建OSS Bucket以及查询实例状态。"
+        return {"role": "assistant", "content": answer if native else f"Final Answer: {answer}"}
+
+    if native:
+        return {"role": "assistant", "content": "", "tool_calls": [
+            {"id": f"call_{index}", "type": "function",
+             "function": {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}}
+            for index, (name, arguments) in enumerate(actions)
+        ]}
+    lines = ["Thought: 需要调用工具完成用户请求"]
+    for name, arguments in actions:
+        lines.append(f"Action: {name}\nAction Input: {json.dumps(arguments, ensure_ascii=False)}")
+    return {"role": "assistant", "content": "\n".join(lines)}
+
+
+def _usage(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+    prompt_tokens = len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4
+    completion_tokens = len(json.dumps(message, ensure_ascii=False)) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class FakeChatServer:
+    """在后台线程中运行的假聊天补全服务
+
+    latency为每次调用的基础延迟（秒），jitter为在其基础上叠加的随机延迟上限。
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def calls(self) -> int:
+        with self._lock:
+            return self._calls
+
+    def reset(self):
+        with self._lock:
+            self._calls = 0
+
+    def start(self) -> "FakeChatServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server._calls += 1
+                time.sleep(server.latency + random.uniform(0, server.jitter))
+
+                message = scripted_reply(body)
+                if body.get("stream"):
+                    self._write_stream(body, message)
+                else:
+                    self._write_json({
+                        "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                        "usage": _usage(body, message),
+                    })
+
+            def _write_json(self, payload: Dict[str, Any]):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_stream(self, body: Dict[str, Any], message: Dict[str, Any]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(payload: Any):
+                    data = f"data: {payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)}\n\n"
+                    chunk = data.encode("utf-8")
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+
+                content = message.get("content") or ""
+                for start in range(0, len(content), 16):
+                    send({"choices": [{"index": 0, "delta": {"content": content[start:start + 16]}}]})
+                for index, call in enumerate(message.get("tool_calls") or []):
+                    send({"choices": [{"index": 0, "delta": {"tool_calls": [{**call, "index": index}]}}]})
+                send({"choices": [], "usage": _usage(body, message)})
+                send("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容聊天补全服务")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    fake = FakeChatServer(args.latency_ms / 1000, args.jitter_ms / 1000, port=args.port).start()
+    print(f"假聊天补全服务已启动: {fake.url} （设置 QWEN_BASE_URL={fake.url}）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,109 @@
+"""模块导入耗时基准
+
+在全新的解释器进程中用 python -X importtime 导入各模块，取多次运行的中位数，
+超过启动预算或在导入阶段加载了重量级SDK时以非零状态码退出，可用于CI检查冷启动回退。
+
+用法:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --budget app=800 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+
+# 各模块的导入耗时预算（毫秒）
+DEFAULT_BUDGETS_MS: Dict[str, float] = {
+    "config": 150,
+    "tools": 300,
+    "agent_core": 600,
+    "oss": 150,
+    "app": 1200,
+}
+
+# 这些SDK只应在首次调用云API时导入
+DEFERRED_MODULES = ("alibabacloud_ecs20140526", "alibabacloud_tea_openapi", "oss2")
+
+# 导入config只需要变量存在，基准运行不会访问真实服务
+_PLACEHOLDER_ENV = {
+    "QWEN_API_KEY": "benchmark",
+    "ALIYUN_ACCESS_KEY_ID": "benchmark",
+    "ALIYUN_ACCESS_KEY_SECRET": "benchmark",
+}
+
+
+def measure_once(module: str) -> Tuple[float, Set[str], List[Tuple[float, str]]]:
+    """在新进程中导入模块，返回 (总耗时ms, 已导入模块集合, [(累计耗时ms, 模块名)])"""
+    env = {**_PLACEHOLDER_ENV, **os.environ}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AGENT_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    total_ms = 0.0
+    imported: Set[str] = set()
+    entries: List[Tuple[float, str]] = []
+    for line in proc.stderr.splitlines():
+        # 格式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        try:
+            cumulative_ms = int(cumulative) / 1000
+        except ValueError:
+            continue
+        imported.add(name.strip())
+        entries.append((cumulative_ms, name.rstrip()))
+        if name.strip() == module and name.startswith(" ") and not name.startswith("  "):
+            total_ms = cumulative_ms
+    return total_ms, imported, entries
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="模块导入耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="每个模块的测量次数，取中位数")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="覆盖某个模块的预算，可多次指定")
+    parser.add_argument("--top", type=int, default=10, help="列出app导入中耗时最多的模块数量")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for item in args.budget:
+        module, _, value = item.partition("=")
+        budgets[module] = float(value)
+
+    failures = []
+    print(f"{'module':<12}{'median_ms':>12}{'budget_ms':>12}  result")
+    for module, budget in budgets.items():
+        samples, imported, entries = [], set(), []
+        for _ in range(args.runs):
+            total_ms, imported, entries = measure_once(module)
+            samples.append(total_ms)
+        median = statistics.median(samples)
+        eager = [name for name in DEFERRED_MODULES if name in imported]
+        ok = median <= budget and not eager
+        print(f"{module:<12}{median:>12.1f}{budget:>12.0f}  {'ok' if ok else 'FAIL'}")
+        if median > budget:
+            failures.append(f"{module} 导入耗时 {median:.1f}ms 超出预算 {budget:.0f}ms")
+        if eager:
+            failures.append(f"{module} 在导入阶段加载了应延迟导入的SDK: {eager}")
+        if module == "app" and args.top:
+            print(f"\napp 导入耗时最多的 {args.top} 个模块:")
+            for cumulative_ms, name in sorted(entries, reverse=True)[1:args.top + 1]:
+                print(f"  {cumulative_ms:>8.1f}ms {name.strip()}")
+            print()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""/chat 离线端到端压测
+
+在进程内启动app（uvicorn），大模型使用本地假聊天补全服务，ECS/OSS使用离线替身，
+按给定的并发级别发送混合负载，输出延迟分位数、吞吐量、每请求LLM迭代次数和工具调用次数。
+不消耗任何真实配额，可在发布前对比性能回退。
+
+用法:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 200 --llm-latency-ms 300
+    python benchmarks/load_test.py --tool-mode react --max-p95-ms 1500 --json result.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENT_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import requests
+
+from fake_aliyun import FakeEcsClient, FakeOssBackend
+from fake_llm import FakeChatServer
+
+# 预置的已存在实例，供状态查询类请求使用
+EXISTING_INSTANCES = [f"i-bench{index:06d}" for index in range(20)]
+
+# 混合负载：依次轮换，{n}为请求序号
+WORKLOAD: List[Callable[[int], str]] = [
+    lambda n: f"帮我创建一台ECS实例 bench-web-{n}，规格用 ecs.g6.large",
+    lambda n: f"创建一个存放日志的OSS bucket bench-logs-{n}",
+    lambda n: f"查看实例 {EXISTING_INSTANCES[n % len(EXISTING_INSTANCES)]} 的状态",
+    lambda n: f"同时创建ECS实例 bench-app-{n} 和 OSS bucket bench-data-{n}",
+    lambda n: f"实例 {EXISTING_INSTANCES[n % len(EXISTING_INSTANCES)]} 现在运行得怎么样？",
+    lambda n: "你能帮我做什么？",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class ToolCallCounter:
+    """包装Agent的工具函数，统计调用次数（快速路由和LLM路径共用同一个工具表）"""
+
+    def __init__(self, tools: Dict[str, Dict[str, Any]]):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = {}
+        for name, tool in tools.items():
+            tool["function"] = self._wrap(name, tool["function"])
+
+    def _wrap(self, name: str, func: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self._calls[name] = self._calls.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._calls)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+
+def run_level(base_url: str, concurrency: int, total: int, offset: int) -> Dict[str, Any]:
+    """以固定并发发送total个请求，返回延迟和状态统计"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(n: int):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        message = WORKLOAD[n % len(WORKLOAD)](n)
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/chat", json={"message": message, "use_cache": False}, timeout=120)
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed_ms)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(offset, offset + total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": statuses.get("200", 0),
+        "statuses": statuses,
+        "duration_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="/chat 离线端到端压测")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=60, help="每个并发级别的请求数")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="假大模型每次调用的基础延迟")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50, help="假大模型延迟的随机抖动上限")
+    parser.add_argument("--cloud-latency-ms", type=float, default=50, help="ECS/OSS替身每次API调用的延迟")
+    parser.add_argument("--tool-mode", choices=["native", "react"], default="native")
+    parser.add_argument("--agent-concurrency", type=int, default=None, help="覆盖AGENT_MAX_CONCURRENCY")
+    parser.add_argument("--no-router", action="store_true", help="关闭快速路由，全部请求经过大模型")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="任一并发级别p95超过该值时以非零状态码退出")
+    parser.add_argument("--json", dest="json_path", default=None, help="将结果写入JSON文件")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    fake_llm = FakeChatServer(args.llm_latency_ms / 1000, args.llm_jitter_ms / 1000).start()
+
+    # 配置在首次load_config()时解析并缓存，必须在导入app之前设置
+    os.environ.setdefault("QWEN_API_KEY", "benchmark")
+    os.environ.setdefault("ALIYUN_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("ALIYUN_ACCESS_KEY_SECRET", "benchmark")
+    os.environ["QWEN_BASE_URL"] = fake_llm.url
+    os.environ["AGENT_TOOL_MODE"] = args.tool_mode
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["SESSION_BACKEND"] = "memory"
+    os.environ["INVENTORY_PATH"] = ":memory:"
+    if args.no_router:
+        os.environ["ROUTER_ENABLED"] = "false"
+    if args.agent_concurrency:
+        os.environ["AGENT_MAX_CONCURRENCY"] = str(args.agent_concurrency)
+
+    import tools
+    import uvicorn
+
+    cloud_latency = args.cloud_latency_ms / 1000
+    fake_ecs = FakeEcsClient(latency=cloud_latency, existing=EXISTING_INSTANCES)
+    fake_oss = FakeOssBackend(latency=cloud_latency)
+    # 在Agent创建之前替换工具单例
+    tools._tool_kit = tools.AliyunToolKit(ecs_client=fake_ecs, bucket_factory=fake_oss.bucket,
+                                          oss_service=fake_oss.service())
+
+    import app as app_module
+    from agent_core import get_agent
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tool_counter = ToolCallCounter(get_agent().tools)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="uvicorn", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"tool_mode={args.tool_mode} router={'off' if args.no_router else 'on'} "
+          f"llm_latency={args.llm_latency_ms:.0f}ms cloud_latency={args.cloud_latency_ms:.0f}ms")
+    header = f"{'conc':>5}{'reqs':>6}{'ok':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'iter/req':>10}{'tools/req':>11}"
+    print(header)
+
+    results = []
+    offset = 0
+    for concurrency in levels:
+        fake_llm.reset()
+        tool_counter.reset()
+        result = run_level(base_url, concurrency, args.requests, offset)
+        offset += args.requests
+        tool_calls = tool_counter.snapshot()
+        result.update({
+            "llm_calls": fake_llm.calls,
+            "llm_iterations_per_request": round(fake_llm.calls / args.requests, 2),
+            "tool_calls": tool_calls,
+            "tool_calls_per_request": round(sum(tool_calls.values()) / args.requests, 2),
+        })
+        results.append(result)
+        print(f"{concurrency:>5}{result['requests']:>6}{result['ok']:>6}{result['rps']:>8.1f}"
+              f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+              f"{result['llm_iterations_per_request']:>10.2f}{result['tool_calls_per_request']:>11.2f}")
+        if result["ok"] != result["requests"]:
+            print(f"      非200响应: { {k: v for k, v in result['statuses'].items() if k != '200'} }")
+
+    print(f"\n工具调用: {json.dumps({r['concurrency']: r['tool_calls'] for r in results}, ensure_ascii=False)}")
+    print(f"ECS API调用: {fake_ecs.counter.snapshot()}  OSS API调用: {fake_oss.counter.snapshot()}")
+
+    server.should_exit = True
+    fake_llm.stop()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms is not None:
+        slow = [r for r in results if r["p95_ms"] > args.max_p95_ms]
+        if slow:
+            for r in slow:
+                print(f"FAIL: 并发 {r['concurrency']} 的p95 {r['p95_ms']}ms 超过 {args.max_p95_ms}ms")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""按录制的cassette离线回放 process_request
+
+用 CASSETTE_MODE=record 运行服务录制真实流量后，本脚本以回放模式重新执行录制中的用户请求：
+大模型和ECS/OSS调用全部由cassette应答，不需要凭证和网络。默认按原始耗时回放，得到与线上一致的端到端耗时；
+--full-speed 去掉远程耗时，只剩本地开销，配合 --profile 剖析和调优 process_request。
+
+用法:
+    CASSETTE_MODE=record CASSETTE_PATH=traffic.jsonl uvicorn app:app    # 录制
+    python benchmarks/replay.py traffic.jsonl
+    python benchmarks/replay.py traffic.jsonl --full-speed --profile replay.prof --top 25
+    python benchmarks/replay.py traffic.jsonl --max-p95-ms 3000 --json result.json
+"""
+import argparse
+import cProfile
+import json
+import logging
+import math
+import os
+import pstats
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENT_DIR))
+
+QUESTION_PREFIX = "Question: "
+
+
+def recorded_questions(path: str) -> List[Tuple[str, bool]]:
+    """从cassette中提取用户请求 (问题, 是否流式)：每个请求首次调用大模型时，最后一条消息是本轮问题"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if not entry["call"].startswith("llm."):
+                continue
+            messages = entry["request"].get("messages") or []
+            last = messages[-1] if messages else {}
+            content = str(last.get("content") or "")
+            if last.get("role") == "user" and content.startswith(QUESTION_PREFIX):
+                question = (content[len(QUESTION_PREFIX):], bool(entry["request"].get("stream")))
+                # 原生工具调用回退到文本ReAct时同一请求会出现两次首轮调用
+                if not questions or questions[-1] != question:
+                    questions.append(question)
+    return questions
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="按cassette离线回放 process_request")
+    parser.add_argument("cassette", help="录制得到的cassette文件")
+    parser.add_argument("--full-speed", action="store_true", help="不等待录制的远程耗时")
+    parser.add_argument("--question", action="append", default=None, help="只回放指定的请求（非流式），可重复")
+    parser.add_argument("--repeat", type=int, default=1, help="重复回放的轮数")
+    parser.add_argument("--profile", default=None, help="用cProfile剖析并将结果写入该文件")
+    parser.add_argument("--top", type=int, default=20, help="输出累计耗时最高的函数数")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="p95超过该值时以非零状态码退出")
+    parser.add_argument("--json", dest="json_path", default=None, help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    # 配置在首次load_config()时解析并缓存，必须在导入Agent之前设置
+    os.environ.setdefault("QWEN_API_KEY", "replay")
+    os.environ.setdefault("ALIYUN_ACCESS_KEY_ID", "replay")
+    os.environ.setdefault("ALIYUN_ACCESS_KEY_SECRET", "replay")
+    os.environ["CASSETTE_MODE"] = "replay"
+    os.environ["CASSETTE_PATH"] = args.cassette
+    os.environ["CASSETTE_REALTIME"] = "false" if args.full_speed else "true"
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["SESSION_BACKEND"] = "memory"
+    os.environ["INVENTORY_PATH"] = ":memory:"
+    logging.basicConfig(level=logging.WARNING)
+
+    questions = [(question, False) for question in args.question or []] or recorded_questions(args.cassette)
+    if not questions:
+        print("cassette中没有可回放的请求", file=sys.stderr)
+        return 1
+
+    from agent_core import get_agent
+    from cassette import get_cassette
+
+    agent = get_agent()
+    profiler = cProfile.Profile() if args.profile else None
+    latencies: List[float] = []
+    results: List[Dict[str, Any]] = []
+    for _ in range(max(1, args.repeat)):
+        for question, stream in questions:
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            try:
+                # 按录制时的方式调用，流式请求匹配流式录制的响应
+                events = list(agent.iter_events(question, stream=stream, use_cache=False))
+                answer = events[-1]["data"]["content"]
+            finally:
+                if profiler:
+                    profiler.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed_ms)
+            results.append({"question": question, "stream": stream, "ms": round(elapsed_ms, 1), "answer": answer[:80]})
+            print(f"{elapsed_ms:9.1f} ms  {question[:60]}")
+
+    latencies.sort()
+    summary = {
+        "requests": len(latencies),
+        "realtime": not args.full_speed,
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "total_ms": round(sum(latencies), 1),
+        "cassette": get_cassette().stats(),
+    }
+    print(f"\nrequests={summary['requests']} p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms "
+          f"total={summary['total_ms']}ms")
+    print(f"cassette: {json.dumps(summary['cassette'], ensure_ascii=False)}")
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, ensure_ascii=False, indent=2)
+
+    if summary["cassette"]["misses"]:
+        print(f"有 {summary['cassette']['misses']} 次调用在cassette中找不到匹配记录", file=sys.stderr)
+        return 1
+    if args.max_p95_ms is not None and summary["p95_ms"] > args.max_p95_ms:
+        print(f"p95 {summary['p95_ms']}ms 超过预算 {args.max_p95_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# list_page(marker) -> ([(bucket_name, region), ...], 下一页marker；最后一页为空字符串)
+ListPage = Callable[[str], Tuple[Iterable[Tuple[str, str]], str]]
+
+
+class BucketIndex:
+    """本账号Bucket的本地索引
+
+    由分页ListBuckets构建，启动时（warm）或过期后的下次查询时在后台线程中刷新，查询从不等待刷新：
+    逐页合并进现有索引，全部分页完成后再删除已不存在的Bucket。首次刷新完成前索引只含本进程写入的Bucket，
+    其余名称返回None，由调用方远程确认。
+    本进程创建的Bucket立即写入索引，ListBuckets最终一致，刷新时在pending_grace秒内不会被删除。
+    索引只覆盖本账号的Bucket，不在索引中的名称仍需远程确认全局唯一性。
+    """
+
+    def __init__(self, list_page: ListPage, refresh_interval: float = 300.0,
+                 retry_interval: float = 30.0, pending_grace: float = 120.0):
+        self.list_page = list_page
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.pending_grace = pending_grace
+        # bucket_name -> {"region": 地域, "added_at": 本地写入时间（来自ListBuckets时为None）}
+        self._buckets: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._next_refresh = 0.0
+        self._last_refresh: Optional[float] = None
+        self._counters = {"hits": 0, "misses": 0, "refreshes": 0, "pages": 0, "refresh_errors": 0}
+
+    def warm(self):
+        """在后台开始首次刷新，服务启动时调用，第一个请求不承担ListBuckets的耗时"""
+        self._maybe_refresh()
+
+    def lookup(self, bucket_name: str) -> Optional[Dict[str, Any]]:
+        """返回索引中的Bucket信息；不在索引中（或索引尚不可用）时返回None，调用方应远程确认"""
+        self._maybe_refresh()
+        with self._lock:
+            entry = self._buckets.get(bucket_name)
+            self._counters["hits" if entry else "misses"] += 1
+            return {"bucket_name": bucket_name, "region": entry["region"]} if entry else None
+
+    def add(self, bucket_name: str, region: Optional[str]):
+        """记录本进程创建或远程确认存在的Bucket"""
+        with self._lock:
+            self._buckets[bucket_name] = {"region": region, "added_at": time.monotonic()}
+
+    def discard(self, bucket_name: str):
+        with self._lock:
+            self._buckets.pop(bucket_name, None)
+
+    def _maybe_refresh(self):
+        """索引过期时在后台线程中刷新，调用方不等待"""
+        if time.monotonic() < self._next_refresh:
+            return
+        # 同时只有一个线程刷新，其他线程直接使用现有索引
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        if time.monotonic() >= self._next_refresh:
+            threading.Thread(target=self._refresh_in_background, name="bucket-index-refresh", daemon=True).start()
+        else:
+            self._refresh_lock.release()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"刷新Bucket索引失败: {e}")
+            self._next_refresh = time.monotonic() + self.retry_interval
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self):
+        """遍历ListBuckets全部分页并合并进索引；失败时保留现有内容，retry_interval秒后重试"""
+        start = time.monotonic()
+        seen = set()
+        marker = ""
+        try:
+            while True:
+                buckets, marker = self.list_page(marker)
+                page = {name: region for name, region in buckets}
+                seen.update(page)
+                with self._lock:
+                    self._counters["pages"] += 1
+                    for name, region in page.items():
+                        self._buckets[name] = {"region": region, "added_at": None}
+                if not marker:
+                    break
+        except Exception as e:
+            logger.warning(f"刷新Bucket索引失败: {e}")
+            with self._lock:
+                self._counters["refresh_errors"] += 1
+            self._next_refresh = time.monotonic() + self.retry_interval
+            return
+
+        with self._lock:
+            stale = [
+                name for name, entry in self._buckets.items()
+                if name not in seen and (entry["added_at"] is None or start - entry["added_at"] > self.pending_grace)
+            ]
+            for name in stale:
+                del self._buckets[name]
+            self._counters["refreshes"] += 1
+            self._loaded = True
+            size = len(self._buckets)
+        self._last_refresh = time.monotonic()
+        self._next_refresh = self._last_refresh + self.refresh_interval
+        logger.info(f"Bucket索引已刷新: {size} 个Bucket, 移除 {len(stale)} 个, "
+                    f"耗时 {self._last_refresh - start:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._buckets)
+        age = round(time.monotonic() - self._last_refresh, 1) if self._last_refresh is not None else None
+        return {**counters, "loaded": self._loaded, "size": size, "last_refresh_age": age}
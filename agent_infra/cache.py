@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# 缓存未命中标记，用于区分“未缓存”和“缓存值为None/False”
+MISSING = object()
+
+
+class TTLCache:
+    """带容量上限和过期时间的LRU缓存（线程安全）"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._data)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ResourceStateCache:
+    """资源状态缓存：按资源类型设置TTL，支持“不存在”的负缓存"""
+
+    def __init__(self, ttls: Dict[str, float], negative_ttl: float = 10.0, maxsize: int = 4096):
+        self.ttls = ttls
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._type_counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, resource_type: str, name: str):
+        with self._lock:
+            counters = self._type_counters.setdefault(resource_type, {"hits": 0, "misses": 0})
+            counters[name] += 1
+
+    def get(self, resource_type: str, resource_id: str) -> Any:
+        """返回缓存的状态，未命中返回MISSING"""
+        value = self._cache.get((resource_type, resource_id), MISSING)
+        self._count(resource_type, "misses" if value is MISSING else "hits")
+        return value
+
+    def set(self, resource_type: str, resource_id: str, value: Any, found: bool = True):
+        ttl = self.ttls.get(resource_type, self._cache.ttl) if found else self.negative_ttl
+        self._cache.set((resource_type, resource_id), value, ttl=ttl)
+
+    def invalidate(self, resource_type: str, resource_id: str):
+        self._cache.invalidate((resource_type, resource_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_type = {k: dict(v) for k, v in self._type_counters.items()}
+        return {**self._cache.stats(), "by_type": by_type}
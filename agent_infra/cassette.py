@@ -0,0 +1,374 @@
+"""大模型与阿里云SDK流量的录制/回放
+
+record模式下，每次聊天补全请求（含流式分片及其到达时间）和每次ECS/OSS SDK调用的参数、结果（或异常）
+及耗时按JSON Lines追加写入cassette文件；replay模式下不访问任何远程服务，按请求内容匹配录制的记录返回，
+可按原始耗时回放（realtime）或全速回放。回放不需要凭证，可用于离线剖析 process_request 和CI中的端到端计时测试。
+
+匹配规则：先按 调用名+请求内容 精确匹配，同一请求的多条记录按录制顺序依次返回（如轮询实例状态），
+用完后重复最后一条；请求内容不同时（如并发导致批量查询的实例ID顺序变化），按录制顺序取同一调用名下尚未使用的记录。
+
+写入前会脱敏：名称含 Password、AccessKey、Secret、Authorization 等的字段，以及文本（用户问题、模型输出）中
+"密码: xxx"、"password=xxx" 形式的值和AccessKey ID都替换为 ***；匹配键按脱敏后的请求计算，录制和回放一致。
+"""
+import hashlib
+import importlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Mapping
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+
+from config import load_config
+
+logger = logging.getLogger(__name__)
+
+# 序列化SDK对象时跳过的属性：oss2结果对象中的原始HTTP响应
+_SKIPPED_ATTRS = {"resp"}
+_MAX_DEPTH = 12
+
+REDACTED = "***"
+# 整个值都需要脱敏的字段名（不区分大小写的子串匹配），如 Password、AccessKeySecret、Authorization
+_SENSITIVE_KEY = re.compile(r"password|passwd|secret|access_?key|authorization|api_?key|security_?token", re.I)
+# 文本中的敏感值：关键词后跟分隔符的值（兼容JSON字符串中转义的引号），以及AccessKey ID
+_SENSITIVE_TEXT = re.compile(
+    r'((?:password|passwd|pwd|secret|access_?key(?:_?id|_?secret)?|api_?key|密码|口令)(?:\\?")?'
+    r'\s*(?:[:=：]|是|为)\s*(?:\\?")?)([^\s"\\,，;；}]+)', re.I)
+_ACCESS_KEY_ID = re.compile(r"\bLTAI[0-9A-Za-z]{12,30}\b")
+
+
+class CassetteMiss(RuntimeError):
+    """回放时找不到匹配的录制记录"""
+
+
+def _to_plain(value: Any, depth: int = 0) -> Any:
+    """将SDK请求/响应对象转换为可写入JSON的结构；对象记为 {"__attrs__": {...}}，回放时还原为属性访问"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if depth >= _MAX_DEPTH:
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, Mapping):
+        return {str(k): _to_plain(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_to_plain(v, depth + 1) for v in value]
+    attrs = getattr(value, "__dict__", None)
+    if attrs is None:
+        return str(value)
+    return {"__attrs__": {k: _to_plain(v, depth + 1) for k, v in attrs.items()
+                          if not k.startswith("_") and k not in _SKIPPED_ATTRS}}
+
+
+def _from_plain(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_plain(v) for v in value]
+    if isinstance(value, dict):
+        if set(value) == {"__attrs__"}:
+            return SimpleNamespace(**{k: _from_plain(v) for k, v in value["__attrs__"].items()})
+        return {k: _from_plain(v) for k, v in value.items()}
+    return value
+
+
+def _request_plain(value: Any) -> Any:
+    """请求参数只用于匹配，Tea模型使用to_map()（不含空字段）"""
+    if hasattr(value, "to_map"):
+        try:
+            return value.to_map()
+        except Exception:
+            pass
+    return _to_plain(value)
+
+
+def _redact(value: Any) -> Any:
+    """脱敏写入cassette的请求/结果"""
+    if isinstance(value, str):
+        return _ACCESS_KEY_ID.sub(REDACTED, _SENSITIVE_TEXT.sub(rf"\g<1>{REDACTED}", value))
+    if isinstance(value, dict):
+        return {k: REDACTED if _SENSITIVE_KEY.search(str(k)) and isinstance(v, str) and v else _redact(v)
+                for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def _dump_error(error: BaseException) -> Dict[str, Any]:
+    cls = type(error)
+    return {
+        "type": f"{cls.__module__}.{cls.__qualname__}",
+        "message": str(error),
+        "args": _to_plain(list(error.args)),
+        "attrs": _to_plain({k: v for k, v in vars(error).items() if not k.startswith("_")}),
+    }
+
+
+def _load_error(data: Dict[str, Any]) -> BaseException:
+    """按类名还原录制时的异常（不调用构造函数，直接恢复属性），类不可导入时返回CassetteMiss"""
+    module_name, _, qualname = data["type"].rpartition(".")
+    try:
+        cls = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+        error = cls.__new__(cls)
+        error.args = tuple(data.get("args") or ())
+        for key, value in (data.get("attrs") or {}).items():
+            setattr(error, key, _from_plain(value))
+        return error
+    except Exception:
+        return CassetteMiss(f"无法还原录制的异常 {data['type']}: {data.get('message')}")
+
+
+class Cassette:
+    """一个cassette文件，mode为record或replay"""
+
+    def __init__(self, path: str, mode: str, realtime: bool = True):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不支持的cassette模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._counters = {"recorded": 0, "replayed": 0, "fallback": 0, "misses": 0}
+        self._file = None
+        # 回放索引：精确键 -> 记录队列及最后一条记录，调用名 -> 按录制顺序的记录列表
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last_by_key: Dict[str, Dict[str, Any]] = {}
+        self._by_call: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        if mode == "record":
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(call: str, request: Any) -> str:
+        digest = hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"{call}:{digest[:32]}"
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry["used"] = False
+                self._by_key[entry["key"]].append(entry)
+                self._last_by_key[entry["key"]] = entry
+                self._by_call[entry["call"]].append(entry)
+        logger.info(f"已加载cassette {self.path}: {sum(len(v) for v in self._by_call.values())} 条记录")
+
+    def record(self, call: str, request: Any, response: Any = None, error: Optional[BaseException] = None,
+               duration: float = 0.0):
+        """追加一条记录，error不为None时记录异常；请求和结果脱敏后写入"""
+        request = _redact(request)
+        entry = {"call": call, "key": self.make_key(call, request), "request": request, "duration": round(duration, 6)}
+        if error is not None:
+            entry["error"] = _redact(_dump_error(error))
+        else:
+            entry["response"] = _redact(response)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._counters["recorded"] += 1
+
+    def lookup(self, call: str, request: Any) -> Dict[str, Any]:
+        """返回与请求匹配的录制记录，找不到时抛出CassetteMiss"""
+        key = self.make_key(call, _redact(request))
+        with self._lock:
+            queue = self._by_key.get(key)
+            if queue is not None:
+                # 录制过相同的请求：按顺序返回，用完后重复最后一条
+                while queue and queue[0]["used"]:
+                    queue.popleft()
+                entry = queue.popleft() if queue else self._last_by_key[key]
+            else:
+                entry = next((e for e in self._by_call.get(call, ()) if not e["used"]), None)
+                if entry is None:
+                    self._counters["misses"] += 1
+                    raise CassetteMiss(f"cassette中没有与 {call} 匹配的记录")
+                self._counters["fallback"] += 1
+            entry["used"] = True
+            self._counters["replayed"] += 1
+        return entry
+
+    def replay(self, call: str, request: Any) -> Any:
+        """回放一次非流式调用：按需等待原始耗时，返回结果或抛出录制的异常"""
+        entry = self.lookup(call, request)
+        if self.realtime and entry.get("duration"):
+            time.sleep(entry["duration"])
+        if "error" in entry:
+            raise _load_error(entry["error"])
+        return entry.get("response")
+
+    def call(self, call: str, request: Any, func, *args, **kwargs) -> Any:
+        """录制模式下执行func并记录结果；回放模式下直接返回录制的结果"""
+        if self.replaying:
+            return _from_plain(self.replay(call, request))
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record(call, request, error=e, duration=time.perf_counter() - start)
+            raise
+        self.record(call, request, _to_plain(result), duration=time.perf_counter() - start)
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, "realtime": self.realtime, **self._counters}
+
+
+class CassetteClient:
+    """SDK客户端代理：所有方法调用经过cassette录制或回放
+
+    scope用于区分调用方（如 ecs:cn-hangzhou、oss:bucket-name），回放模式下target为None，不创建真实客户端。
+    """
+
+    def __init__(self, cassette: Cassette, scope: str, target: Any = None):
+        self._cassette = cassette
+        self._scope = scope
+        self._target = target
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        cassette, scope, target = self._cassette, self._scope, self._target
+
+        def method(*args, **kwargs):
+            request = {"args": [_request_plain(a) for a in args],
+                       "kwargs": {k: _request_plain(v) for k, v in kwargs.items()}}
+            return cassette.call(f"{scope}.{name}", request,
+                                 lambda: getattr(target, name)(*args, **kwargs))
+
+        return method
+
+
+class _ReplayResponse(requests.Response):
+    """回放的聊天补全HTTP响应，流式响应按录制的到达时间逐行产出"""
+
+    def __init__(self, url: str, status_code: int, body: str = "",
+                 chunks: Optional[List[Any]] = None, realtime: bool = False):
+        super().__init__()
+        self.url = url
+        self.status_code = status_code
+        self.encoding = "utf-8"
+        self._content = body.encode("utf-8")
+        self._content_consumed = True
+        self._chunks = chunks
+        self._realtime = realtime
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False, delimiter=None):
+        if self._chunks is None:
+            yield from super().iter_lines(chunk_size, decode_unicode, delimiter)
+            return
+        start = time.perf_counter()
+        for offset, line in self._chunks:
+            if self._realtime:
+                delay = offset - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield line if decode_unicode else line.encode("utf-8")
+
+
+class _RecordingStream:
+    """录制流式响应：逐行读取时记录到达时间，关闭时（包括提前断开）写入cassette"""
+
+    def __init__(self, response: requests.Response, on_close):
+        self._response = response
+        self._on_close = on_close
+        self._start = time.perf_counter()
+        self._chunks: List[Any] = []
+        self._closed = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._response, name)
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False, delimiter=None):
+        for line in self._response.iter_lines(chunk_size=chunk_size, decode_unicode=True, delimiter=delimiter):
+            self._chunks.append([round(time.perf_counter() - self._start, 6), line])
+            yield line if decode_unicode else line.encode("utf-8")
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close(self._response.status_code, self._chunks, time.perf_counter() - self._start)
+        self._response.close()
+
+
+class CassetteHTTPClient:
+    """包装大模型的HTTP客户端（PooledHTTPClient），录制或回放聊天补全请求；回放模式下不会发出任何请求"""
+
+    CALL = "llm.chat_completions"
+    STREAM_CALL = "llm.chat_completions.stream"
+
+    def __init__(self, cassette: Cassette, http):
+        self.cassette = cassette
+        self.http = http
+
+    @property
+    def stats(self):
+        return self.http.stats
+
+    def post(self, url: str, json: Dict[str, Any], stream: bool = False, **kwargs) -> requests.Response:
+        # 流式和非流式的响应格式不同，分别匹配
+        call = self.STREAM_CALL if stream else self.CALL
+        if self.cassette.replaying:
+            response = self.cassette.replay(call, json)
+            if "chunks" in response:
+                return _ReplayResponse(url, response["status_code"], chunks=response["chunks"],
+                                       realtime=self.cassette.realtime)
+            return _ReplayResponse(url, response["status_code"], body=response["body"])
+
+        start = time.perf_counter()
+        try:
+            response = self.http.post(url, json=json, stream=stream, **kwargs)
+        except Exception as e:
+            self.cassette.record(call, json, error=e, duration=time.perf_counter() - start)
+            raise
+        if not stream:
+            self.cassette.record(call, json, {"status_code": response.status_code, "body": response.text},
+                                 duration=time.perf_counter() - start)
+            return response
+
+        def on_close(status_code: int, chunks: List[Any], elapsed: float):
+            # 流式记录的耗时为首个分片之前的等待，分片按各自的到达时间回放
+            self.cassette.record(call, json, {"status_code": status_code, "chunks": chunks},
+                                 duration=time.perf_counter() - start - elapsed)
+
+        return _RecordingStream(response, on_close)
+
+    def close(self):
+        self.http.close()
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+_cassette_loaded = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """按配置返回全局cassette；CASSETTE_MODE=off（默认）时返回None"""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        with _cassette_lock:
+            if not _cassette_loaded:
+                config = load_config()
+                if config["cassette_mode"] != "off":
+                    _cassette = Cassette(config["cassette_path"], config["cassette_mode"],
+                                         realtime=config["cassette_realtime"])
+                    logger.info(f"cassette {config['cassette_mode']} 模式: {config['cassette_path']}")
+                _cassette_loaded = True
+    return _cassette
@@ -0,0 +1,77 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RegionClientPool:
+    """按地域懒加载的客户端池
+
+    每个地域的客户端在首次使用时由factory创建，之后复用其连接；
+    池中最多保留maxsize个地域（LRU淘汰），空闲超过idle_ttl秒的客户端在下次访问池时被清除。
+    """
+
+    def __init__(self, factory: Callable[[str], Any], maxsize: int = 8, idle_ttl: float = 600.0,
+                 close: Optional[Callable[[Any], None]] = None, name: str = "clients"):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.close = close
+        self.name = name
+        # region -> (client, 最近使用时间)
+        self._clients: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "created": 0, "evicted_lru": 0, "evicted_idle": 0}
+
+    def get(self, region: str) -> Any:
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            evicted.extend(self._purge_idle(now))
+            entry = self._clients.get(region)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(region)
+                self._counters["hits"] += 1
+                client = entry[0]
+            else:
+                # 在锁内创建，避免同一地域并发创建多个客户端；创建本身不发起网络请求
+                client = self.factory(region)
+                self._clients[region] = [client, now]
+                self._counters["created"] += 1
+                logger.info(f"创建 {self.name} 客户端: {region}")
+                while len(self._clients) > self.maxsize:
+                    old_region, (old_client, _) = self._clients.popitem(last=False)
+                    self._counters["evicted_lru"] += 1
+                    evicted.append((old_region, old_client))
+        self._close_all(evicted)
+        return client
+
+    def _purge_idle(self, now: float):
+        idle = [region for region, (_, last_used) in self._clients.items() if now - last_used > self.idle_ttl]
+        for region in idle:
+            client, _ = self._clients.pop(region)
+            self._counters["evicted_idle"] += 1
+            yield region, client
+
+    def _close_all(self, evicted):
+        for region, client in evicted:
+            logger.info(f"淘汰 {self.name} 客户端: {region}")
+            if self.close:
+                try:
+                    self.close(client)
+                except Exception as e:
+                    logger.warning(f"关闭 {self.name} 客户端失败 {region}: {e}")
+
+    def evict_idle(self):
+        """主动清除空闲客户端"""
+        with self._lock:
+            evicted = list(self._purge_idle(time.monotonic()))
+        self._close_all(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "size": len(self._clients), "regions": list(self._clients)}
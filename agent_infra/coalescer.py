@@ -0,0 +1,116 @@
+import threading
+import time
+import logging
+import weakref
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import BATCH_SIZE, BATCH_WAIT, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 按名称登记的合并器，窗口配置在抓取/metrics时读取
+_coalescers: "weakref.WeakValueDictionary[str, BatchCoalescer]" = weakref.WeakValueDictionary()
+REGISTRY.gauge("agent_batch_window_seconds", "合并器的批量等待窗口",
+               lambda: {(name,): coalescer.window for name, coalescer in list(_coalescers.items())}, ("batcher",))
+
+
+class BatchCoalescer:
+    """微批量合并器
+
+    在短时间窗口内到达的单个查询被合并为一次批量调用，结果再分发给各个调用方。
+    窗口内的第一个调用方作为leader等待窗口结束后执行批量调用；
+    批次达到上限时由触发的调用方立即执行，无需后台线程。
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Dict[Hashable, Any]],
+                 window: float = 0.02, max_batch_size: int = 100, name: str = "batch"):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.name = name
+
+        self._lock = threading.Lock()
+        # key -> [(Future, 提交时间)]
+        self._pending: Dict[Hashable, List[Tuple[Future, float]]] = {}
+        self._leader_active = False
+        self._counters = {"requests": 0, "batches": 0, "batched_keys": 0, "max_batch": 0, "errors": 0}
+        _coalescers[name] = self
+
+    def submit(self, key: Hashable) -> Future:
+        """提交单个查询，返回对应结果的Future"""
+        future: Future = Future()
+        batch = None
+        lead = False
+        with self._lock:
+            self._counters["requests"] += 1
+            # 同一批次内的重复key共享一次查询
+            self._pending.setdefault(key, []).append((future, time.monotonic()))
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take_batch()
+            elif not self._leader_active:
+                self._leader_active = True
+                lead = True
+
+        if batch:
+            self._execute(batch)
+        elif lead:
+            self._lead()
+        return future
+
+    def call(self, key: Hashable, timeout: Optional[float] = None) -> Any:
+        """提交查询并阻塞等待结果"""
+        return self.submit(key).result(timeout=timeout)
+
+    def _take_batch(self) -> Dict[Hashable, List[Tuple[Future, float]]]:
+        keys = list(self._pending)[:self.max_batch_size]
+        return {key: self._pending.pop(key) for key in keys}
+
+    def _lead(self):
+        if self.window > 0:
+            time.sleep(self.window)
+        while True:
+            with self._lock:
+                batch = self._take_batch()
+                if not batch:
+                    self._leader_active = False
+                    return
+            self._execute(batch)
+
+    def _execute(self, batch: Dict[Hashable, List[Tuple[Future, float]]]):
+        keys = list(batch)
+        with self._lock:
+            self._counters["batches"] += 1
+            self._counters["batched_keys"] += len(keys)
+            self._counters["max_batch"] = max(self._counters["max_batch"], len(keys))
+        BATCH_SIZE.observe(len(keys), batcher=self.name)
+        now = time.monotonic()
+        for waiters in batch.values():
+            for _, submitted_at in waiters:
+                BATCH_WAIT.observe(now - submitted_at, batcher=self.name)
+        logger.debug(f"{self.name} 批量查询 {len(keys)} 个key")
+
+        try:
+            results = self.batch_fn(keys)
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+            for waiters in batch.values():
+                for future, _ in waiters:
+                    future.set_exception(e)
+            return
+
+        for key, waiters in batch.items():
+            for future, _ in waiters:
+                future.set_result(results.get(key))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        batches = counters["batches"]
+        return {
+            "window_seconds": self.window,
+            "max_batch_size": self.max_batch_size,
+            **counters,
+            "avg_batch_size": round(counters["batched_keys"] / batches, 2) if batches else 0,
+        }
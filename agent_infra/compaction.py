@@ -0,0 +1,119 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from tokens import estimate_message_tokens
+
+# 工具结果中模型用不到的字段：幂等令牌、请求ID、内部计数和时间戳
+OBSERVATION_DROP_KEYS = frozenset({
+    "request_id", "client_token", "fleet_request_id", "verification_attempts",
+    "user_id", "created_at", "updated_at", "sync",
+})
+# 较早轮次的摘要只保留这些字段
+SUMMARY_KEYS = ("status", "resource_type", "resource_id", "operation_id", "message", "error")
+# 资源标识字段（另含 *_id、*_ids）原样保留、不截断，模型需要据此向用户报告创建的每个资源
+ID_KEYS = frozenset({"resource_id", "public_ips"})
+
+
+def _is_id_key(key: Any) -> bool:
+    return isinstance(key, str) and (key in ID_KEYS or key.endswith(("_id", "_ids")))
+
+
+def compact_observation(value: Any, max_items: int = 5, max_chars: int = 200) -> Any:
+    """精简工具结果：去掉模型用不到的字段和空值，长列表/长字典只保留前max_items项，长字符串截断
+
+    资源标识字段（resource_id、public_ips、*_id、*_ids）原样保留，也不占用字典的字段数上限。
+    """
+    if isinstance(value, dict):
+        items = [(k, v if _is_id_key(k) else compact_observation(v, max_items, max_chars))
+                 for k, v in value.items() if k not in OBSERVATION_DROP_KEYS]
+        items = [(k, v) for k, v in items if v not in (None, "", [], {})]
+        compacted = {}
+        kept = omitted = 0
+        for k, v in items:
+            if _is_id_key(k):
+                compacted[k] = v
+            elif kept < max_items * 2:
+                compacted[k] = v
+                kept += 1
+            else:
+                omitted += 1
+        if omitted:
+            compacted["_omitted"] = omitted
+        return compacted
+    if isinstance(value, list):
+        compacted = [compact_observation(v, max_items, max_chars) for v in value[:max_items]]
+        if len(value) > max_items:
+            compacted.append(f"...另有 {len(value) - max_items} 项")
+        return compacted
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def encode_observation(value: Any, compact: bool = True) -> str:
+    """将工具结果编码为回传给模型的文本；compact为False时保持原始JSON"""
+    if not compact:
+        return json.dumps(value, ensure_ascii=False)
+    return json.dumps(compact_observation(value), ensure_ascii=False, separators=(",", ":"))
+
+
+def summarize_observation(value: Any) -> str:
+    """较早轮次的工具结果只保留状态、资源ID等关键字段"""
+    if not isinstance(value, dict):
+        return encode_observation(value)
+    summary = {k: value[k] if _is_id_key(k) else compact_observation(value[k], max_items=3, max_chars=60)
+               for k in SUMMARY_KEYS if value.get(k) not in (None, "")}
+    return json.dumps(summary or compact_observation(value, max_items=3, max_chars=60),
+                      ensure_ascii=False, separators=(",", ":"))
+
+
+class ContextCompactor:
+    """单个请求的对话上下文
+
+    prefix为系统提示、会话历史和本轮问题；每次工具调用作为一轮追加，同时给出完整形式、摘要形式
+    和未压缩时的token估算。构造提示时最近keep_recent轮使用完整形式，更早的轮次使用摘要；
+    超出token_budget时依次将最近轮次也换成摘要、丢弃最早的会话历史、丢弃最早的轮次，
+    系统提示、本轮问题和最后一轮始终保留。tokens_saved累计每次调用相对未压缩上下文节省的token数。
+    """
+
+    def __init__(self, prefix: List[Dict[str, Any]], token_budget: int = 6000,
+                 keep_recent: int = 1, enabled: bool = True):
+        self.prefix = list(prefix)
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.enabled = enabled
+        self.turns: List[Dict[str, Any]] = []
+        self.tokens_saved = 0
+        self._raw_tokens = estimate_message_tokens(self.prefix)
+
+    def add_turn(self, messages: List[Dict[str, Any]], summary: Optional[List[Dict[str, Any]]] = None,
+                 raw_tokens: Optional[int] = None):
+        """追加一轮消息；summary与messages一一对应，raw_tokens为未压缩时这一轮的token估算"""
+        self.turns.append({"messages": messages, "summary": summary or messages})
+        self._raw_tokens += raw_tokens if raw_tokens is not None else estimate_message_tokens(messages)
+
+    def prompt(self) -> List[Dict[str, Any]]:
+        """返回本次调用发送给模型的消息列表"""
+        if not self.enabled:
+            return [*self.prefix, *(m for turn in self.turns for m in turn["messages"])]
+
+        recent = max(len(self.turns) - self.keep_recent, 0)
+        turns = [turn["summary"] if index < recent else turn["messages"] for index, turn in enumerate(self.turns)]
+        history = self.prefix[1:-1]
+        messages = self._assemble(history, turns)
+        if estimate_message_tokens(messages) > self.token_budget:
+            turns = [turn["summary"] for turn in self.turns[:-1]] + turns[-1:]
+            messages = self._assemble(history, turns)
+        # 会话历史按一问一答成对丢弃
+        while history and estimate_message_tokens(messages) > self.token_budget:
+            history = history[2:]
+            messages = self._assemble(history, turns)
+        while len(turns) > 1 and estimate_message_tokens(messages) > self.token_budget:
+            turns = turns[1:]
+            messages = self._assemble(history, turns)
+
+        self.tokens_saved += max(self._raw_tokens - estimate_message_tokens(messages), 0)
+        return messages
+
+    def _assemble(self, history: List[Dict[str, Any]], turns: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        return [self.prefix[0], *history, self.prefix[-1], *(m for turn in turns for m in turn)]
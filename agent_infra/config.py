@@ -1,10 +1,22 @@
 import os
+from functools import lru_cache
 from typing import Optional
 from dotenv import load_dotenv
 from pathlib import Path
 
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+@lru_cache(maxsize=None)
 def load_config() -> dict:
-    """从环境变量和 Agent/.env 文件加载配置"""
+    """从环境变量和 Agent/.env 文件加载配置
+
+    结果在进程内缓存，.env 只解析一次；返回的字典为共享对象，调用方不应修改。
+    环境变量变化后可调用 load_config.cache_clear() 重新加载。
+    """
     agent_dir = Path(__file__).resolve().parent
     env_path = agent_dir / ".env"
     if env_path.exists():
@@ -34,4 +46,97 @@ def load_config() -> dict:
         "access_key_id": access_key_id,
         "access_key_secret": access_key_secret,
         "region_id": region_id,
+        # Qwen HTTP连接池配置
+        "llm_pool_size": int(os.getenv("QWEN_POOL_SIZE", "10")),
+        "llm_connect_timeout": float(os.getenv("QWEN_CONNECT_TIMEOUT", "5")),
+        "llm_read_timeout": float(os.getenv("QWEN_READ_TIMEOUT", "60")),
+        "llm_max_retries": int(os.getenv("QWEN_MAX_RETRIES", "3")),
+        # 生成控制：文本ReAct在Observation处停止生成；动作步骤和最终回答使用不同的max_tokens
+        "llm_stop_sequences": [seq for seq in os.getenv("QWEN_STOP_SEQUENCES", "Observation:").split(",") if seq],
+        "llm_max_tokens_action": int(os.getenv("QWEN_MAX_TOKENS_ACTION", "512")),
+        "llm_max_tokens_answer": int(os.getenv("QWEN_MAX_TOKENS_ANSWER", "2000")),
+        # 流式生成中解析到完整的Action后立即断开连接，不再等待模型生成后续内容
+        "llm_stream_early_abort": _env_bool("QWEN_STREAM_EARLY_ABORT", True),
+        # 多地域客户端池：最多保留的地域数和空闲淘汰时间（秒）
+        "region_pool_max_size": int(os.getenv("REGION_POOL_MAX_SIZE", "8")),
+        "region_pool_idle_ttl": float(os.getenv("REGION_POOL_IDLE_TTL", "600")),
+        # 各端点的自适应限流：QPS上限、最长排队时间和被限流后的重试次数
+        "rate_limits": {
+            "dashscope": float(os.getenv("DASHSCOPE_QPS", "50")),
+            "ecs": float(os.getenv("ECS_API_QPS", "20")),
+            "oss": float(os.getenv("OSS_API_QPS", "50")),
+        },
+        "rate_limit_max_wait": float(os.getenv("RATE_LIMIT_MAX_WAIT", "60")),
+        "rate_limit_max_retries": int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5")),
+        # Agent并发与准入控制
+        "agent_max_concurrency": int(os.getenv("AGENT_MAX_CONCURRENCY", "8")),
+        "agent_queue_size": int(os.getenv("AGENT_QUEUE_SIZE", "32")),
+        "agent_retry_after": int(os.getenv("AGENT_RETRY_AFTER", "5")),
+        # 工具调用模式: native(原生tool_calls) 或 react(文本解析)
+        "agent_tool_mode": os.getenv("AGENT_TOOL_MODE", "native"),
+        "tool_max_workers": int(os.getenv("TOOL_MAX_WORKERS", "8")),
+        "router_enabled": _env_bool("ROUTER_ENABLED", True),
+        # 上下文压缩：精简工具结果、较早轮次折叠为摘要，每次调用的提示不超过token预算（本地估算）
+        "context_compaction_enabled": _env_bool("CONTEXT_COMPACTION_ENABLED", True),
+        "prompt_token_budget": int(os.getenv("PROMPT_TOKEN_BUDGET", "6000")),
+        # 批量交付：每种资源类型的并发上限
+        "provision_concurrency": {
+            "ecs": int(os.getenv("PROVISION_ECS_CONCURRENCY", "5")),
+            "oss": int(os.getenv("PROVISION_OSS_CONCURRENCY", "10")),
+            "vswitch": int(os.getenv("PROVISION_VSWITCH_CONCURRENCY", "2")),
+            "ecs_fleet": int(os.getenv("PROVISION_ECS_FLEET_CONCURRENCY", "2")),
+        },
+        # 资源就绪等待
+        "waiter_initial_interval": float(os.getenv("WAITER_INITIAL_INTERVAL", "0.5")),
+        "waiter_max_interval": float(os.getenv("WAITER_MAX_INTERVAL", "8")),
+        "waiter_max_workers": int(os.getenv("WAITER_MAX_WORKERS", "4")),
+        "oss_ready_timeout": float(os.getenv("OSS_READY_TIMEOUT", "30")),
+        "ecs_ready_timeout": float(os.getenv("ECS_READY_TIMEOUT", "300")),
+        # 实例组工具同步等待全部实例Running的最长时间，超时后返回operation_id
+        "fleet_wait_timeout": float(os.getenv("FLEET_WAIT_TIMEOUT", "120")),
+        # ECS状态查询合并
+        "ecs_status_batch_window": float(os.getenv("ECS_STATUS_BATCH_WINDOW", "0.02")),
+        "ecs_status_batch_size": int(os.getenv("ECS_STATUS_BATCH_SIZE", "100")),
+        # 资源状态缓存
+        "state_cache_max_entries": int(os.getenv("STATE_CACHE_MAX_ENTRIES", "4096")),
+        "ecs_status_cache_ttl": float(os.getenv("ECS_STATUS_CACHE_TTL", "5")),
+        "bucket_exists_cache_ttl": float(os.getenv("BUCKET_EXISTS_CACHE_TTL", "300")),
+        "negative_cache_ttl": float(os.getenv("NEGATIVE_CACHE_TTL", "10")),
+        # 本账号Bucket索引（基于ListBuckets）及刷新间隔（秒）
+        "bucket_index_enabled": _env_bool("BUCKET_INDEX_ENABLED", True),
+        "bucket_index_refresh_interval": float(os.getenv("BUCKET_INDEX_REFRESH_INTERVAL", "300")),
+        # 创建类调用去重与幂等窗口（秒）
+        "idempotency_window": float(os.getenv("IDEMPOTENCY_WINDOW", "600")),
+        "idempotency_max_entries": int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1024")),
+        # LLM补全缓存（默认关闭）
+        "llm_cache_enabled": _env_bool("LLM_CACHE_ENABLED"),
+        "llm_cache_max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        "llm_cache_ttl": float(os.getenv("LLM_CACHE_TTL", "3600")),
+        "llm_cache_disk_path": os.getenv("LLM_CACHE_DISK_PATH", ""),
+        "llm_cache_disk_max_entries": int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "10000")),
+        # 本地资源清单（SQLite）及后台增量同步间隔（秒）
+        "inventory_enabled": _env_bool("INVENTORY_ENABLED", True),
+        "inventory_path": os.getenv("INVENTORY_PATH", "inventory.db"),
+        "inventory_sync_interval": float(os.getenv("INVENTORY_SYNC_INTERVAL", "300")),
+        # 后台任务队列: memory(进程内)、sqlite(本机多进程) 或 redis
+        "job_backend": os.getenv("JOB_BACKEND", "memory"),
+        "job_sqlite_path": os.getenv("JOB_SQLITE_PATH", "jobs.db"),
+        "job_lease_seconds": float(os.getenv("JOB_LEASE_SECONDS", "900")),
+        "job_max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        "job_result_ttl": float(os.getenv("JOB_RESULT_TTL", "86400")),
+        # API进程内消费任务的线程数（0表示只由独立的worker.py进程消费）
+        "job_inprocess_workers": int(os.getenv("JOB_INPROCESS_WORKERS", "2")),
+        "job_worker_processes": int(os.getenv("JOB_WORKER_PROCESSES", str(os.cpu_count() or 1))),
+        "job_worker_concurrency": int(os.getenv("JOB_WORKER_CONCURRENCY", "4")),
+        # 流量录制/回放: off、record（录制大模型和ECS/OSS调用）或 replay（按cassette回放，不访问远程服务）
+        "cassette_mode": os.getenv("CASSETTE_MODE", "off"),
+        "cassette_path": os.getenv("CASSETTE_PATH", "cassette.jsonl"),
+        # 回放时是否按录制的原始耗时等待，false为全速回放
+        "cassette_realtime": _env_bool("CASSETTE_REALTIME", True),
+        # 多轮会话存储
+        "session_backend": os.getenv("SESSION_BACKEND", "memory"),
+        "redis_url": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        "session_idle_ttl": float(os.getenv("SESSION_IDLE_TTL", "1800")),
+        "session_max_messages": int(os.getenv("SESSION_MAX_MESSAGES", "50")),
+        "session_history_token_budget": int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "2000")),
     }
\ No newline at end of file
@@ -0,0 +1,145 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """等待队列已满，请求被拒绝"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"服务繁忙，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class AgentExecutor:
+    """有界工作线程池 + 准入控制
+
+    同步的Agent调用在线程池中执行，避免阻塞事件循环；
+    同时执行的请求数受max_concurrency限制，最多允许queue_size个请求排队，
+    超出部分立即拒绝（由调用方返回503 + Retry-After）。
+    """
+
+    def __init__(self, max_concurrency: int = 8, queue_size: int = 32, retry_after: int = 5):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent-worker")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._waiting = 0
+        self._counters = {"admitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 延迟到事件循环中创建，保证绑定到正确的loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _acquire(self):
+        """获取执行槽位；队列已满时抛出OverloadedError"""
+        semaphore = self._get_semaphore()
+        if self._active >= self.max_concurrency and self._waiting >= self.queue_size:
+            self._counters["rejected"] += 1
+            logger.warning(f"请求被拒绝: 执行中 {self._active}, 排队中 {self._waiting}")
+            raise OverloadedError(self.retry_after)
+
+        self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        self._counters["admitted"] += 1
+
+    def _release(self):
+        self._active -= 1
+        self._get_semaphore().release()
+
+    def _release_when_done(self, future: Future, cleanup: Optional[Callable[[], Any]] = None):
+        """工作线程真正结束后才归还槽位
+
+        请求被取消（如客户端断开）时工作线程仍在执行，提前归还会让同时执行的请求超出max_concurrency。
+        """
+        loop = asyncio.get_running_loop()
+
+        def done(_):
+            try:
+                if cleanup is not None:
+                    cleanup()
+            finally:
+                try:
+                    loop.call_soon_threadsafe(self._release)
+                except RuntimeError:
+                    # 事件循环已关闭（进程退出中），无需归还
+                    pass
+
+        future.add_done_callback(done)
+
+    def _run_in_worker(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """在工作线程中执行同步函数，并传递当前的上下文变量（如请求用户）"""
+        context = contextvars.copy_context()
+        return self._pool.submit(context.run, func, *args, **kwargs)
+
+    async def submit(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """准入后在工作线程中执行同步函数"""
+        await self._acquire()
+        future = self._run_in_worker(func, *args, **kwargs)
+        self._release_when_done(future)
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        self._counters["completed"] += 1
+        return result
+
+    async def stream(self, gen_func: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """准入后在工作线程中逐个拉取同步生成器的元素
+
+        准入失败时在第一次迭代抛出OverloadedError；整个流期间持有一个执行槽位。
+        """
+        await self._acquire()
+        gen = None
+        running: Optional[Future] = None
+        sentinel = object()
+        try:
+            gen = gen_func(*args, **kwargs)
+            while True:
+                running = self._run_in_worker(next, gen, sentinel)
+                item = await asyncio.wrap_future(running)
+                if item is sentinel:
+                    break
+                yield item
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        else:
+            self._counters["completed"] += 1
+        finally:
+            close = gen.close if gen is not None else None
+            if running is not None and not running.done():
+                # 客户端断开时生成器仍在工作线程中执行，等这一步结束后再关闭生成器并归还槽位
+                self._release_when_done(running, close)
+            else:
+                try:
+                    if close is not None:
+                        close()
+                finally:
+                    self._release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_size": self.queue_size,
+            "active": self._active,
+            "waiting": self._waiting,
+            **self._counters,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
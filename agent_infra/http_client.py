@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+import logging
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from ratelimit import AdaptiveRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 需要重试的HTTP状态码：限流和服务端错误；配置了限流器时429只由限流器重新排队
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PoolStats:
+    """连接池计数器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "hits": 0,
+            "misses": 0,
+            "reconnects": 0,
+            "retries": 0,
+            "failures": 0,
+        }
+
+    def record(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def _counting_pool_class(base, stats: PoolStats):
+    """构造会统计连接复用情况的连接池类"""
+
+    class CountingPool(base):
+        def _new_conn(self):
+            conn = super()._new_conn()
+            conn._pool_fresh = True
+            return conn
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            if getattr(conn, "_pool_fresh", False):
+                # 新建连接
+                conn._pool_fresh = False
+                stats.record("misses")
+            elif getattr(conn, "sock", None) is None:
+                # 池中连接已被对端关闭，需要重新握手
+                stats.record("reconnects")
+            else:
+                stats.record("hits")
+            return conn
+
+    return CountingPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """带连接复用统计的HTTPAdapter"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+
+class PooledHTTPClient:
+    """基于requests.Session的长连接HTTP客户端，支持连接池、超时拆分和抖动退避重试
+
+    指定rate_limiter时，每次发送前在限流器中排队；429响应会降低限流速率后重新排队，
+    不计入max_retries，最多重试rate_limiter.max_retries次。
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+    ):
+        self.stats = PoolStats()
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        # 重试由本类统一处理，adapter层不再重试
+        adapter = CountingHTTPAdapter(
+            self.stats,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+        if headers:
+            self.session.headers.update(headers)
+
+    def _retry_after(self, retry_after: Optional[str]) -> Optional[float]:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """计算退避时间：优先使用Retry-After，否则使用full jitter指数退避"""
+        delay = self._retry_after(retry_after)
+        if delay is not None:
+            return delay
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def post(self, url: str, json: Dict[str, Any], **kwargs) -> requests.Response:
+        """发送POST请求，遇到429/5xx或连接错误时按抖动退避重试"""
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        throttled = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            self.stats.record("requests")
+            try:
+                response = self.session.post(url, json=json, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self.stats.record("failures")
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"请求 {url} 连接失败: {e}，{delay:.2f}秒后重试")
+            else:
+                if response.status_code == 429 and self.rate_limiter:
+                    # 限流：降速并重新排队，等待由限流器统一安排
+                    retry_after = self._retry_after(response.headers.get("Retry-After"))
+                    self.rate_limiter.on_throttle(retry_after)
+                    if throttled < self.rate_limiter.max_retries:
+                        throttled += 1
+                        logger.warning(f"请求 {url} 被限流，第 {throttled} 次重新排队")
+                        response.close()
+                        self.stats.record("retries")
+                        continue
+                    # 限流重试次数已用完：直接返回，不再进入下面的5xx退避重试
+                    self.stats.record("failures")
+                    return response
+                elif self.rate_limiter and response.status_code < 400:
+                    self.rate_limiter.on_success()
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code >= 400:
+                        self.stats.record("failures")
+                    return response
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"请求 {url} 返回 {response.status_code}，{delay:.2f}秒后重试")
+                response.close()
+
+            self.stats.record("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
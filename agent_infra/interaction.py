@@ -33,7 +33,8 @@ def main():
     print("-" * 50)
 
     try:
-        from agent_core import infra_agent
+        from agent_core import get_agent
+        infra_agent = get_agent()
         #logger.info("Agent模块导入成功")
     except ImportError as e:
         print(f"❌ 导入模块失败: {e}")
@@ -62,7 +63,7 @@ def main():
 
             # 处理用户请求
             print("🔄 处理中...")
-            response = infra_agent.process_request(user_input)
+            response = infra_agent.process_request(user_input, session_id="cli")
             print(f"\n🤖 Agent: {response}")
 
         except KeyboardInterrupt:
@@ -0,0 +1,238 @@
+import json
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+# 当前请求的用户，由API入口和任务工作线程设置；线程池提交任务时需复制上下文才能传递
+current_user: ContextVar[str] = ContextVar("current_user", default="default")
+# 当前请求的标识（API请求ID或后台任务ID），同一请求内的重试据此复用创建调用的幂等令牌
+current_request: ContextVar[str] = ContextVar("current_request", default="")
+
+# 同步时未再出现的资源标记为的状态
+REMOVED_STATUS = {"ecs": "Released", "oss": "Deleted", "vswitch": "Deleted"}
+
+
+class ResourceInventory:
+    """本地资源清单（SQLite）
+
+    每次创建结果都会写入清单，状态查询和分页同步增量更新已有记录（只写入发生变化的行），
+    按用户、资源类型、地域和状态建立索引，列表查询在本地完成，无需调用云API。
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS resources ("
+            "resource_type TEXT NOT NULL, resource_id TEXT NOT NULL, user_id TEXT, region TEXT, "
+            "status TEXT, name TEXT, details TEXT NOT NULL DEFAULT '{}', "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (resource_type, resource_id))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_resources_user "
+            "ON resources(user_id, resource_type, status COLLATE NOCASE)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_resources_region "
+            "ON resources(resource_type, region, status COLLATE NOCASE)"
+        )
+        self._db.commit()
+        self._counters = {"recorded": 0, "updated": 0, "queries": 0}
+
+    def _upsert(self, resource_type: str, resource_id: str, region: Optional[str], status: Optional[str],
+                user_id: Optional[str] = None, name: Optional[str] = None,
+                details: Optional[Dict[str, Any]] = None, now: Optional[float] = None,
+                keep_status: bool = False) -> bool:
+        """插入或更新一条记录，内容未变化时不写入；返回是否有变化（调用方持有锁）
+
+        keep_status为True时status只在插入时写入，已有记录保留其（可能更新的）状态。
+        """
+        now = now or time.time()
+        row = self._db.execute(
+            "SELECT user_id, region, status, name, details FROM resources WHERE resource_type = ? AND resource_id = ?",
+            (resource_type, resource_id)
+        ).fetchone()
+        if row is None:
+            self._db.execute(
+                "INSERT INTO resources (resource_type, resource_id, user_id, region, status, name, details, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (resource_type, resource_id, user_id, region, status, name,
+                 json.dumps(details or {}, ensure_ascii=False), now, now)
+            )
+            return True
+
+        merged = {**json.loads(row[4]), **(details or {})}
+        status = row[2] or status if keep_status else status or row[2]
+        updated = (user_id or row[0], region or row[1], status, name or row[3],
+                   json.dumps(merged, ensure_ascii=False))
+        if updated == tuple(row):
+            return False
+        self._db.execute(
+            "UPDATE resources SET user_id = ?, region = ?, status = ?, name = ?, details = ?, updated_at = ? "
+            "WHERE resource_type = ? AND resource_id = ?",
+            (*updated, now, resource_type, resource_id)
+        )
+        return True
+
+    def record(self, result: Dict[str, Any], user_id: Optional[str] = None) -> int:
+        """记录一次创建结果，返回写入的资源数；失败的结果不记录
+
+        创建结果中的状态是创建时的初始状态，只用于新记录；同一资源已在清单中时（如幂等令牌返回已有实例），
+        不覆盖轮询或同步得到的更新状态。
+        """
+        entries = _result_entries(result)
+        if not entries:
+            return 0
+        user_id = user_id or current_user.get()
+        with self._lock:
+            for entry in entries:
+                self._upsert(**entry, user_id=user_id, keep_status=True)
+            self._db.commit()
+            self._counters["recorded"] += len(entries)
+        return len(entries)
+
+    def update_status(self, resource_type: str, resource_id: str, status: str, **details: Any) -> bool:
+        """更新已有记录的状态，不在清单中的资源忽略"""
+        return self.update_statuses(resource_type, [(resource_id, status, details)]) > 0
+
+    def update_statuses(self, resource_type: str, updates: Iterable[tuple]) -> int:
+        """批量更新已有记录，updates为 (resource_id, status, details) 序列，返回变化的行数"""
+        changed = 0
+        with self._lock:
+            for resource_id, status, details in updates:
+                exists = self._db.execute(
+                    "SELECT 1 FROM resources WHERE resource_type = ? AND resource_id = ?", (resource_type, resource_id)
+                ).fetchone()
+                if exists and self._upsert(resource_type, resource_id, None, status, details=details):
+                    changed += 1
+            if changed:
+                self._db.commit()
+                self._counters["updated"] += changed
+        return changed
+
+    def apply_sync(self, resource_type: str, region: Optional[str], pages: Iterable[List[Dict[str, Any]]]) -> Dict[str, int]:
+        """按页合并一次全量列举的结果；region为None表示该类型的所有地域
+
+        每页单独提交，只写入变化的行；列举完成后，同步开始前就已存在但本次未出现的资源标记为已删除。
+        """
+        started_at = time.time()
+        seen = set()
+        changed = 0
+        for page in pages:
+            with self._lock:
+                for item in page:
+                    seen.add(item["resource_id"])
+                    if self._upsert(resource_type, item["resource_id"], item.get("region") or region,
+                                    item.get("status"), name=item.get("name"), details=item.get("details")):
+                        changed += 1
+                self._db.commit()
+
+        removed_status = REMOVED_STATUS.get(resource_type, "Deleted")
+        scope, params = "resource_type = ? AND status != ? AND updated_at < ?", [resource_type, removed_status, started_at]
+        if region:
+            scope += " AND region = ?"
+            params.append(region)
+        with self._lock:
+            missing = [
+                resource_id for (resource_id,) in
+                self._db.execute(f"SELECT resource_id FROM resources WHERE {scope}", params).fetchall()
+                if resource_id not in seen
+            ]
+            for resource_id in missing:
+                self._upsert(resource_type, resource_id, None, removed_status)
+            self._db.commit()
+            self._counters["updated"] += changed + len(missing)
+        return {"seen": len(seen), "changed": changed, "removed": len(missing)}
+
+    def query(self, user_id: Optional[str] = None, resource_type: Optional[str] = None,
+              region: Optional[str] = None, status: Optional[str] = None,
+              limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """按条件查询清单（状态不区分大小写），返回 {"total": 总数, "items": 当前页}
+
+        同步发现的资源不是经由本服务创建的，没有归属用户（user_id为空），属于整个账号，
+        按用户查询时一并返回。
+        """
+        conditions, params = [], []
+        if user_id:
+            conditions.append("(user_id = ? OR user_id IS NULL)")
+            params.append(user_id)
+        for column, value in (("resource_type", resource_type), ("region", region)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if status:
+            conditions.append("status = ? COLLATE NOCASE")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            self._counters["queries"] += 1
+            total = self._db.execute(f"SELECT COUNT(*) FROM resources {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT resource_type, resource_id, user_id, region, status, name, details, created_at, updated_at "
+                f"FROM resources {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        items = [
+            {
+                "resource_type": row[0], "resource_id": row[1], "user_id": row[2], "region": row[3],
+                "status": row[4], "name": row[5], "details": json.loads(row[6]),
+                "created_at": row[7], "updated_at": row[8],
+            }
+            for row in rows
+        ]
+        return {"total": total, "items": items}
+
+    def regions(self, resource_type: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT region FROM resources WHERE resource_type = ? AND region IS NOT NULL", (resource_type,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT resource_type, COUNT(*) FROM resources GROUP BY resource_type").fetchall())
+            counters = dict(self._counters)
+        return {**counters, "resources": counts}
+
+
+def _result_entries(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """从工具的创建结果中提取清单记录"""
+    status = result.get("status")
+    details = result.get("details") or {}
+    resource_type = result.get("resource_type")
+    if status not in ("success", "creating", "partial") or not result.get("resource_id"):
+        return []
+    if resource_type == "ecs":
+        return [{
+            "resource_type": "ecs", "resource_id": result["resource_id"], "region": details.get("region"),
+            "status": "Pending", "name": details.get("instance_name"),
+            "details": {"instance_type": details.get("instance_type")},
+        }]
+    if resource_type == "ecs_fleet":
+        return [
+            {
+                "resource_type": "ecs", "resource_id": instance_id, "region": details.get("region"),
+                "status": "Running" if status == "success" else "Pending", "name": details.get("instance_name"),
+                "details": {"instance_type": details.get("instance_type"), "fleet_request_id": result.get("request_id")},
+            }
+            for instance_id in details.get("instance_ids", [])
+        ]
+    if resource_type == "oss":
+        return [{
+            "resource_type": "oss", "resource_id": result["resource_id"], "region": details.get("region"),
+            "status": "available" if status == "success" else "creating", "name": result["resource_id"],
+            "details": {"acl": details["acl"]} if details.get("acl") else {},
+        }]
+    if resource_type == "vswitch":
+        return [{
+            "resource_type": "vswitch", "resource_id": result["resource_id"], "region": details.get("region"),
+            "status": "Available", "name": details.get("vswitch_name"),
+            "details": {"vpc_id": details.get("vpc_id"), "cidr_block": details.get("cidr_block")},
+        }]
+    return []
@@ -0,0 +1,504 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+
+def new_job(kind: str, payload: Dict[str, Any], user_id: str = "default") -> Dict[str, Any]:
+    return {
+        "job_id": f"job-{uuid.uuid4().hex[:16]}",
+        "kind": kind,
+        "user_id": user_id,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "worker": None,
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "lease_expires_at": None,
+    }
+
+
+def public_job(job: Dict[str, Any], include_result: bool = False) -> Dict[str, Any]:
+    """返回给API调用方的任务信息，不包含请求参数和内部租约字段"""
+    info = {k: v for k, v in job.items() if k not in ("payload", "result", "lease_expires_at")}
+    if include_result:
+        info["result"] = job.get("result")
+    return info
+
+
+class JobQueue:
+    """后台任务队列接口
+
+    API进程提交任务，工作进程（或线程）通过claim领取。领取的任务带有租约，
+    工作进程崩溃导致租约过期的任务会被重新入队，超过max_attempts次后标记为失败。
+    执行中的工作进程通过heartbeat续租；complete/fail校验worker和领取次数，租约已被他人接手的结果会被丢弃。
+    """
+
+    def __init__(self, lease_seconds: float = 900.0, max_attempts: int = 3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "default") -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def claim(self, worker: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """领取一个排队中的任务并标记为running；timeout秒内没有任务时返回None"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker: str, attempt: int) -> bool:
+        """延长正在执行的任务的租约；任务已不属于该worker的这次领取（租约过期后被重新领取）时返回False"""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker: str, attempt: int) -> bool:
+        """记录执行结果；只有当前持有租约的worker和领取次数才能完成任务，否则忽略并返回False"""
+        raise NotImplementedError
+
+    def fail(self, job_id: str, error: str, worker: str, attempt: int) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def _start(self, job: Dict[str, Any], worker: str) -> Dict[str, Any]:
+        now = time.time()
+        job.update(status=RUNNING, worker=worker, started_at=now,
+                   attempts=job["attempts"] + 1, lease_expires_at=now + self.lease_seconds)
+        return job
+
+    @staticmethod
+    def _owned(job: Optional[Dict[str, Any]], worker: str, attempt: int) -> bool:
+        return (job is not None and job["status"] == RUNNING
+                and job["worker"] == worker and job["attempts"] == attempt)
+
+    @staticmethod
+    def _reject_stale(job_id: str, worker: str, attempt: int) -> bool:
+        logger.warning(f"任务 {job_id} 已不属于 {worker} 的第 {attempt} 次领取，忽略其结果")
+        return False
+
+    def _expire(self, job: Dict[str, Any]) -> bool:
+        """租约过期的任务：未超过重试次数时重新入队并返回True，否则标记为失败"""
+        logger.warning(f"任务租约过期: {job['job_id']} (worker {job['worker']}, 第 {job['attempts']} 次)")
+        if job["attempts"] < self.max_attempts:
+            job.update(status=QUEUED, worker=None, lease_expires_at=None)
+            return True
+        job.update(status=FAILED, error="工作进程多次未能完成任务", finished_at=time.time(), lease_expires_at=None)
+        return False
+
+
+class InMemoryJobQueue(JobQueue):
+    """进程内任务队列，由API进程内的工作线程消费，进程重启后任务丢失"""
+
+    def __init__(self, lease_seconds: float = 900.0, max_attempts: int = 3, max_jobs: int = 1000):
+        super().__init__(lease_seconds, max_attempts)
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "default") -> Dict[str, Any]:
+        job = new_job(kind, payload, user_id)
+        with self._cond:
+            self._jobs[job["job_id"]] = job
+            # 超出容量时淘汰最早的已完成任务
+            while len(self._jobs) > self.max_jobs:
+                oldest_id = next((job_id for job_id, j in self._jobs.items() if j["status"] in FINISHED_STATUSES), None)
+                if oldest_id is None:
+                    break
+                del self._jobs[oldest_id]
+            self._queue.append(job["job_id"])
+            self._cond.notify()
+            return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def claim(self, worker: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            job = self._jobs[self._queue.popleft()]
+            return dict(self._start(job, worker))
+
+    def heartbeat(self, job_id: str, worker: str, attempt: int) -> bool:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not self._owned(job, worker, attempt):
+                return False
+            job["lease_expires_at"] = time.time() + self.lease_seconds
+            return True
+
+    def _finish(self, job_id: str, worker: str, attempt: int, **fields) -> bool:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not self._owned(job, worker, attempt):
+                return self._reject_stale(job_id, worker, attempt)
+            job.update(finished_at=time.time(), lease_expires_at=None, **fields)
+            return True
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str, worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=FAILED, error=error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"backend": "memory", **counts}
+
+
+class SQLiteJobQueue(JobQueue):
+    """SQLite任务队列，API进程和本机多个工作进程共享同一个数据库文件，重启后任务仍在"""
+
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, path: str, lease_seconds: float = 900.0, max_attempts: int = 3,
+                 result_ttl: float = 86400.0):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = path
+        self.result_ttl = result_ttl
+        # 显式管理事务：领取任务使用BEGIN IMMEDIATE，保证多个进程不会领取同一任务
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+            "lease_expires_at REAL, finished_at REAL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+        logger.info(f"使用SQLite任务队列: {path}")
+
+    def _save(self, job: Dict[str, Any]):
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, created_at, lease_expires_at, finished_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job["job_id"], job["status"], job["created_at"], job["lease_expires_at"], job["finished_at"],
+             json.dumps(job, ensure_ascii=False, default=str))
+        )
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "default") -> Dict[str, Any]:
+        job = new_job(kind, payload, user_id)
+        with self._lock:
+            self._save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load(job_id)
+
+    def claim(self, worker: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim_once(worker)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.POLL_INTERVAL)
+
+    def _claim_once(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for (job_id,) in self._db.execute(
+                        "SELECT job_id FROM jobs WHERE status = ? AND lease_expires_at < ?", (RUNNING, now)).fetchall():
+                    job = self._load(job_id)
+                    self._expire(job)
+                    self._save(job)
+                row = self._db.execute(
+                    "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                job = None
+                if row is not None:
+                    job = self._start(self._load(row[0]), worker)
+                    self._save(job)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return job
+
+    def heartbeat(self, job_id: str, worker: str, attempt: int) -> bool:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._load(job_id)
+                owned = self._owned(job, worker, attempt)
+                if owned:
+                    job["lease_expires_at"] = time.time() + self.lease_seconds
+                    self._save(job)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return owned
+
+    def _finish(self, job_id: str, worker: str, attempt: int, **fields) -> bool:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._load(job_id)
+                owned = self._owned(job, worker, attempt)
+                if owned:
+                    job.update(finished_at=time.time(), lease_expires_at=None, **fields)
+                    self._save(job)
+                # 顺带清理过期的已完成任务
+                self._db.execute(
+                    "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (*FINISHED_STATUSES, time.time() - self.result_ttl)
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return owned or self._reject_stale(job_id, worker, attempt)
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str, worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=FAILED, error=error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"backend": "sqlite", **dict(rows)}
+
+
+class RedisJobQueue(JobQueue):
+    """Redis任务队列，与docker-compose.yml中的redis服务配合，支持多台机器上的工作进程
+
+    任务数据保存在独立的键中。领取、续租、完成和租约回收都在Lua脚本中原子执行：领取时把任务ID从等待队列移到
+    处理中列表，同时写入租约（有序集合，分值为到期时间）和持有者（worker|领取次数）；续租和完成要求租约仍存在
+    且持有者一致，完成时在同一脚本中写入结果。工作进程崩溃后租约不再续期，由其他工作进程在租约过期时移回
+    等待队列，回收脚本会再次确认租约已过期且任务记录未被改动，之后原持有者的续租和结果都会被拒绝。
+    """
+
+    KEY_PREFIX = "infra-agent:job:"
+    QUEUE_KEY = "infra-agent:jobs:queued"
+    PROCESSING_KEY = "infra-agent:jobs:processing"
+    LEASES_KEY = "infra-agent:jobs:leases"
+    OWNERS_KEY = "infra-agent:jobs:owners"
+    ATTEMPTS_KEY = "infra-agent:jobs:attempts"
+    POLL_INTERVAL = 0.2
+
+    # KEYS: 等待队列, 处理中列表, 持有者, 领取次数, 租约; ARGV: worker, 租约到期时间
+    CLAIM_SCRIPT = """
+local job_id = redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT')
+if not job_id then return false end
+local attempt = redis.call('HINCRBY', KEYS[4], job_id, 1)
+redis.call('HSET', KEYS[3], job_id, ARGV[1] .. '|' .. attempt)
+redis.call('ZADD', KEYS[5], ARGV[2], job_id)
+return {job_id, attempt}
+"""
+    # KEYS: 持有者, 租约; ARGV: 任务ID, worker|领取次数, 新的到期时间
+    HEARTBEAT_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then return 0 end
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[1])
+return 1
+"""
+    # KEYS: 持有者, 租约, 处理中列表, 领取次数, 任务记录; ARGV: 任务ID, worker|领取次数, 结束后的任务记录, 保留秒数
+    RELEASE_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then return 0 end
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('LREM', KEYS[3], 1, ARGV[1])
+if ARGV[3] ~= '' then redis.call('SET', KEYS[5], ARGV[3], 'EX', ARGV[4]) end
+return 1
+"""
+    # KEYS: 租约, 持有者, 处理中列表, 等待队列, 领取次数, 任务记录
+    # ARGV: 任务ID, 当前时间, 读取时的任务记录, 回收后的任务记录, 是否重新入队, 失败记录的保留秒数
+    # 租约仍然过期、且任务记录与读取时一致才回收；已结束的任务只清理租约，不再入队
+    RECOVER_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then return 0 end
+local current = redis.call('GET', KEYS[6]) or ''
+local finished = false
+if current ~= '' then
+  local status = cjson.decode(current)['status']
+  finished = status == 'succeeded' or status == 'failed'
+end
+if not finished and current ~= ARGV[3] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('LREM', KEYS[3], 1, ARGV[1])
+if finished or ARGV[4] == '' then
+  redis.call('HDEL', KEYS[5], ARGV[1])
+  return 0
+end
+if ARGV[5] == '1' then
+  redis.call('SET', KEYS[6], ARGV[4])
+  redis.call('RPUSH', KEYS[4], ARGV[1])
+else
+  redis.call('SET', KEYS[6], ARGV[4], 'EX', ARGV[6])
+  redis.call('HDEL', KEYS[5], ARGV[1])
+end
+return 1
+"""
+
+    def __init__(self, url: str, lease_seconds: float = 900.0, max_attempts: int = 3,
+                 result_ttl: float = 86400.0, client=None):
+        super().__init__(lease_seconds, max_attempts)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("使用Redis任务队列需要安装redis包: pip install redis")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.result_ttl = int(result_ttl)
+        self._last_recovery = 0.0
+        self._claim_script = self.client.register_script(self.CLAIM_SCRIPT)
+        self._heartbeat_script = self.client.register_script(self.HEARTBEAT_SCRIPT)
+        self._release_script = self.client.register_script(self.RELEASE_SCRIPT)
+        self._recover_script = self.client.register_script(self.RECOVER_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.KEY_PREFIX}{job_id}"
+
+    @staticmethod
+    def _dumps(job: Dict[str, Any]) -> str:
+        return json.dumps(job, ensure_ascii=False, default=str)
+
+    def _save(self, job: Dict[str, Any], pipe=None):
+        ttl = self.result_ttl if job["status"] in FINISHED_STATUSES else None
+        (pipe or self.client).set(self._key(job["job_id"]), self._dumps(job), ex=ttl)
+
+    def submit(self, kind: str, payload: Dict[str, Any], user_id: str = "default") -> Dict[str, Any]:
+        job = new_job(kind, payload, user_id)
+        pipe = self.client.pipeline()
+        self._save(job, pipe)
+        pipe.lpush(self.QUEUE_KEY, job["job_id"])
+        pipe.execute()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = self.client.get(self._key(job_id))
+        return json.loads(data) if data else None
+
+    def claim(self, worker: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            self._recover_expired()
+            job = self._claim_once(worker)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.POLL_INTERVAL)
+
+    def _claim_once(self, worker: str) -> Optional[Dict[str, Any]]:
+        claimed = self._claim_script(
+            keys=[self.QUEUE_KEY, self.PROCESSING_KEY, self.OWNERS_KEY, self.ATTEMPTS_KEY, self.LEASES_KEY],
+            args=[worker, time.time() + self.lease_seconds])
+        if not claimed:
+            return None
+        job_id, attempt = claimed[0], int(claimed[1])
+        job = self.get(job_id)
+        if job is None:
+            self._release(job_id, worker, attempt, None)
+            return None
+        # 租约已在脚本中写入，这里更新的任务记录只用于查询展示
+        self._start(job, worker)
+        job["attempts"] = attempt
+        self._save(job)
+        return job
+
+    def heartbeat(self, job_id: str, worker: str, attempt: int) -> bool:
+        return bool(self._heartbeat_script(
+            keys=[self.OWNERS_KEY, self.LEASES_KEY],
+            args=[job_id, f"{worker}|{attempt}", time.time() + self.lease_seconds]))
+
+    def _release(self, job_id: str, worker: str, attempt: int, job: Optional[Dict[str, Any]]) -> bool:
+        """持有者放弃租约（完成或失败）：原子地校验租约和持有者、清理处理中列表并写入结束后的任务记录"""
+        return bool(self._release_script(
+            keys=[self.OWNERS_KEY, self.LEASES_KEY, self.PROCESSING_KEY, self.ATTEMPTS_KEY, self._key(job_id)],
+            args=[job_id, f"{worker}|{attempt}", self._dumps(job) if job else "", self.result_ttl]))
+
+    def _recover_expired(self, force: bool = False):
+        """把租约过期的任务移回等待队列；多个工作进程之间按时间间隔错开，由回收脚本保证每个任务只回收一次"""
+        now = time.time()
+        if not force and now - self._last_recovery < min(self.lease_seconds / 10, 60):
+            return
+        self._last_recovery = now
+        for job_id in self.client.zrangebyscore(self.LEASES_KEY, 0, now):
+            data = self.client.get(self._key(job_id))
+            recovered, requeued = "", False
+            if data:
+                job = json.loads(data)
+                attempt = int(self.client.hget(self.ATTEMPTS_KEY, job_id) or 0)
+                job["attempts"] = max(job["attempts"], attempt)
+                requeued = self._expire(job)
+                recovered = self._dumps(job)
+            self._recover_script(
+                keys=[self.LEASES_KEY, self.OWNERS_KEY, self.PROCESSING_KEY, self.QUEUE_KEY, self.ATTEMPTS_KEY,
+                      self._key(job_id)],
+                args=[job_id, now, data or "", recovered, int(requeued), self.result_ttl])
+
+    def _finish(self, job_id: str, worker: str, attempt: int, **fields) -> bool:
+        job = self.get(job_id)
+        if job is not None:
+            job.update(finished_at=time.time(), lease_expires_at=None, **fields)
+        if not self._release(job_id, worker, attempt, job):
+            return self._reject_stale(job_id, worker, attempt)
+        return True
+
+    def complete(self, job_id: str, result: Dict[str, Any], worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str, worker: str, attempt: int) -> bool:
+        return self._finish(job_id, worker, attempt, status=FAILED, error=error)
+
+    def stats(self) -> Dict[str, Any]:
+        pipe = self.client.pipeline()
+        pipe.llen(self.QUEUE_KEY)
+        pipe.llen(self.PROCESSING_KEY)
+        queued, running = pipe.execute()
+        return {"backend": "redis", QUEUED: queued, RUNNING: running}
+
+
+def create_job_queue(config: Dict[str, Any]) -> JobQueue:
+    """根据配置创建任务队列"""
+    backend = config["job_backend"]
+    options = {"lease_seconds": config["job_lease_seconds"], "max_attempts": config["job_max_attempts"]}
+    if backend == "redis":
+        logger.info("使用Redis任务队列")
+        return RedisJobQueue(config["redis_url"], result_ttl=config["job_result_ttl"], **options)
+    if backend == "sqlite":
+        return SQLiteJobQueue(config["job_sqlite_path"], result_ttl=config["job_result_ttl"], **options)
+    if backend != "memory":
+        raise RuntimeError(f"不支持的任务队列后端: {backend}")
+    return InMemoryJobQueue(**options)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """LLM补全结果缓存：内存LRU层 + 可选的SQLite磁盘层（重启后仍有效）"""
+
+    # 每写入多少次检查一次磁盘层容量
+    PRUNE_EVERY = 100
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 10000):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_max_entries = disk_max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {"lookups": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_completions_created ON completions(created_at)")
+            self._db.commit()
+            logger.info(f"LLM补全磁盘缓存已启用: {disk_path}")
+
+    @staticmethod
+    def make_key(model: str, params: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+        """根据模型、生成参数和规范化后的消息列表计算稳定的缓存键"""
+        normalized = []
+        for m in messages:
+            entry = {"role": m.get("role"), "content": " ".join(str(m.get("content") or "").split())}
+            # 工具调用只保留名称和参数，忽略每次生成都不同的调用id
+            if m.get("tool_calls"):
+                entry["tool_calls"] = [
+                    [c.get("function", {}).get("name"), c.get("function", {}).get("arguments")]
+                    for c in m["tool_calls"]
+                ]
+            normalized.append(entry)
+        payload = json.dumps(
+            {"model": model, "params": params, "messages": normalized},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            self._counters["lookups"] += 1
+
+        value = self.memory.get(key, MISSING)
+        if value is not MISSING:
+            with self._lock:
+                self._counters["memory_hits"] += 1
+            return value
+
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value FROM completions WHERE key = ? AND created_at > ?",
+                    (key, time.time() - self.ttl)
+                ).fetchone()
+            if row is not None:
+                # 回填内存层
+                self.memory.set(key, row[0])
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return row[0]
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune()
+            self._db.commit()
+
+    def _prune(self):
+        """删除过期条目，并将磁盘层控制在容量上限内"""
+        self._db.execute("DELETE FROM completions WHERE created_at <= ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM completions WHERE key IN ("
+            "SELECT key FROM completions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            disk_size = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0] if self._db else None
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            **counters,
+            "hit_rate": round(hits / counters["lookups"], 4) if counters["lookups"] else 0.0,
+            "memory_size": len(self.memory),
+            "disk_size": disk_size,
+        }
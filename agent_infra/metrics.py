@@ -0,0 +1,238 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# 默认延迟分桶（秒），覆盖从毫秒级解析到分钟级资源就绪
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """累积分桶直方图，只在观测时做一次二分查找和加法"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（非累积，最后一个为+Inf）, 总和, 总数]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """记录代码块耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """在抓取时读取当前值的仪表，callback返回数值或 {标签值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], object],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        value = self.callback()
+        samples = value.items() if isinstance(value, dict) else [((), value)]
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(sample)}" for key, sample in samples
+        ]
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按Prometheus文本格式输出"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"指标 {metric.name} 已注册为 {existing.kind}")
+                # 重复注册返回已有指标（如模块被重新加载）
+                if isinstance(metric, Gauge):
+                    existing.callback = metric.callback
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], object],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, callback, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 热路径指标
+LLM_LATENCY = REGISTRY.histogram(
+    "agent_llm_request_seconds", "每次迭代调用大模型的耗时", ("mode", "stream", "outcome"))
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total", "大模型返回的usage中记录的token数", ("type",))
+LLM_FINISH = REGISTRY.counter(
+    "agent_llm_finish_total", "大模型生成的结束原因（stop/length/tool_calls/abort）", ("phase", "reason"))
+PROMPT_TOKENS_SAVED = REGISTRY.counter(
+    "agent_prompt_tokens_saved_total", "上下文压缩相对未压缩提示节省的token数（本地估算）", ("mode",))
+PARSE_LATENCY = REGISTRY.histogram(
+    "agent_parse_seconds", "解析模型输出中Action/Final Answer的耗时", (),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+TOOL_LATENCY = REGISTRY.histogram(
+    "agent_tool_seconds", "云资源工具调用耗时", ("tool", "status"))
+READINESS_WAIT = REGISTRY.histogram(
+    "agent_readiness_wait_seconds", "资源从提交到确认就绪（或超时）的等待时间", ("kind", "status"))
+ITERATIONS = REGISTRY.histogram(
+    "agent_iterations_per_request", "每个请求的大模型迭代次数", ("path",),
+    buckets=(0, 1, 2, 3, 4, 5, 8, 10))
+CREATE_DEDUP = REGISTRY.counter(
+    "agent_create_requests_total", "资源创建请求数，source区分实际执行和复用结果", ("kind", "source"))
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "agent_rate_limit_wait_seconds", "调用在限流器中排队等待的时间", ("limiter",))
+RATE_LIMIT_THROTTLES = REGISTRY.counter(
+    "agent_rate_limit_throttled_total", "收到的限流信号数（429/Throttling）", ("limiter",))
+BATCH_SIZE = REGISTRY.histogram(
+    "agent_batch_size", "合并器每次批量调用包含的key数", ("batcher",),
+    buckets=(1, 2, 5, 10, 20, 50, 100))
+BATCH_WAIT = REGISTRY.histogram(
+    "agent_batch_wait_seconds", "查询从提交到所在批次开始执行的等待时间", ("batcher",))
+ERRORS = REGISTRY.counter(
+    "agent_errors_total", "按阶段和错误类别统计的错误数", ("stage", "error_class"))
+
+
+def error_class(error: BaseException) -> str:
+    """HTTP错误按状态码归类，其他错误使用异常类名"""
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code:
+        return f"http_{status_code}"
+    return type(error).__name__
+
+
+def track_tool(tool: str):
+    """装饰返回结果字典的工具方法，按结果中的status记录耗时"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = "exception"
+            try:
+                result = func(*args, **kwargs)
+                status = str(result.get("status", "unknown")) if isinstance(result, dict) else "unknown"
+                return result
+            finally:
+                TOOL_LATENCY.observe(time.perf_counter() - start, tool=tool, status=status)
+        return wrapper
+    return decorator
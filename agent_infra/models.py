@@ -4,6 +4,8 @@ from enum import Enum
 class ResourceType(str, Enum):
     ECS = "ecs"
     OSS = "oss"
+    VSWITCH = "vswitch"
+    ECS_FLEET = "ecs_fleet"
 
 class ResourceStatus(str, Enum):
     PENDING = "pending"
@@ -1,13 +1,6 @@
-import os
-import oss2
-from pathlib import Path
-from dotenv import load_dotenv
 from config import load_config
-from typing import Optional
 
 
-cfg = load_config()
-
 def create_oss_bucket(
         region: str,
         bucket_name: str,
@@ -30,6 +23,9 @@ def create_oss_bucket(
     - ValueError: 当AK或SK未设置时抛出。
     - oss2.exceptions.OssError: 当创建过程中发生错误时抛出。
     """
+    import oss2
+
+    cfg = load_config()
     access_key_id = cfg["access_key_id"]
     access_key_secret = cfg["access_key_secret"]
 
@@ -0,0 +1,149 @@
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from metrics import RATE_LIMIT_THROTTLES, RATE_LIMIT_WAIT, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitTimeout(Exception):
+    """排队等待时间超过上限"""
+
+
+class AdaptiveRateLimiter:
+    """自适应令牌桶限流器
+
+    调用方按到达顺序预约发放时间（GCRA实现），超出速率时排队等待而不是失败。
+    收到限流信号时速率乘性下降并按Retry-After暂停发放，之后每个recovery_interval
+    在成功调用时加性恢复，直到配置的QPS上限。
+    """
+
+    def __init__(self, name: str, qps: float, burst: int = 1, min_qps: float = 0.1,
+                 decrease_factor: float = 0.5, recovery_interval: float = 1.0,
+                 increase_step: Optional[float] = None, max_wait: float = 60.0, max_retries: int = 5):
+        self.name = name
+        self.max_qps = qps
+        self.min_qps = min(min_qps, qps)
+        self.burst = max(1, burst)
+        self.decrease_factor = decrease_factor
+        self.recovery_interval = recovery_interval
+        self.increase_step = increase_step or qps / 20
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+
+        self._rate = qps
+        self._tat = 0.0  # 理论到达时间
+        self._last_adjust = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"acquired": 0, "queued": 0, "throttled": 0, "wait_seconds": 0.0}
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """预约一个发放时间并等待到达，返回等待秒数；需要等待超过max_wait时抛出RateLimitTimeout"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self._rate
+            tat = max(self._tat, now)
+            wait = tat - (self.burst - 1) * interval - now
+            if wait > max_wait:
+                raise RateLimitTimeout(f"{self.name} 限流排队需要 {wait:.1f} 秒，超过上限 {max_wait:.1f} 秒")
+            self._tat = tat + interval
+            self._counters["acquired"] += 1
+            if wait > 0:
+                self._counters["queued"] += 1
+                self._counters["wait_seconds"] += wait
+
+        if wait > 0:
+            time.sleep(wait)
+        RATE_LIMIT_WAIT.observe(max(wait, 0.0), limiter=self.name)
+        return max(wait, 0.0)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """收到限流信号：降低速率，并让后续发放至少推迟retry_after秒"""
+        RATE_LIMIT_THROTTLES.inc(limiter=self.name)
+        with self._lock:
+            now = time.monotonic()
+            self._counters["throttled"] += 1
+            # 同一批并发请求可能先后收到多个限流响应，冷却期内只降速一次
+            if now - self._last_adjust >= self.recovery_interval:
+                previous = self._rate
+                self._rate = max(self.min_qps, self._rate * self.decrease_factor)
+                self._last_adjust = now
+                logger.warning(f"{self.name} 触发限流，速率 {previous:.2f} -> {self._rate:.2f} QPS")
+            pause = retry_after if retry_after is not None else 1.0 / self._rate
+            self._tat = max(self._tat, now + pause)
+
+    def on_success(self):
+        """调用成功：距上次调整超过recovery_interval时加性恢复速率"""
+        if self._rate >= self.max_qps:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_adjust >= self.recovery_interval:
+                self._rate = min(self.max_qps, self._rate + self.increase_step)
+                self._last_adjust = now
+
+    def call(self, func: Callable[..., Any], *args,
+             is_throttled: Callable[[Exception], bool] = lambda e: False, **kwargs) -> Any:
+        """限流后调用func；被限流时降速并重新排队重试，其他异常直接抛出"""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttled(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"{self.name} 调用被限流，第 {attempt} 次重新排队: {e}")
+                self.on_throttle()
+                continue
+            self.on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["wait_seconds"] = round(counters["wait_seconds"], 3)
+        return {"qps": round(self._rate, 3), "max_qps": self.max_qps, **counters}
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, qps: float, **kwargs) -> AdaptiveRateLimiter:
+    """返回进程内共享的限流器，同一端点的所有调用方共用一个配额"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = AdaptiveRateLimiter(name, qps, **kwargs)
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def is_ecs_throttled(error: Exception) -> bool:
+    """ECS OpenAPI限流错误码为 Throttling 及其子类（如 Throttling.User）"""
+    code = str(getattr(error, "code", "") or "")
+    return code.startswith("Throttling") or getattr(error, "statusCode", None) == 429
+
+
+def is_oss_throttled(error: Exception) -> bool:
+    """OSS超出QPS限制时返回429或503"""
+    return getattr(error, "status", None) in (429, 503)
+
+
+REGISTRY.gauge(
+    "agent_rate_limit_qps", "限流器当前允许的QPS",
+    lambda: {(name,): stats["qps"] for name, stats in limiter_stats().items()}, ("limiter",))
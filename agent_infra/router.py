@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+_INSTANCE_ID = r"(?P<instance_id>i-[a-z0-9]{6,})"
+_BUCKET_NAME = r"(?P<bucket_name>[a-z0-9][a-z0-9-]{1,61}[a-z0-9])"
+_TAIL = r"\s*[?？。.!！]*\s*$"
+
+# 只匹配整句结构明确的请求，含其他信息的输入一律交给大模型
+_ROUTES: List[Tuple[str, List[str]]] = [
+    ("check_ecs_status", [
+        r"^(?:请|帮我)*\s*(?:查看|查询|检查|看一下|看看)(?:一下)?\s*(?:ECS)?\s*(?:实例)?\s*" + _INSTANCE_ID
+        + r"\s*(?:的)?\s*(?:运行)?(?:状态)?" + _TAIL,
+        r"^(?:ECS\s*)?(?:实例\s*)?" + _INSTANCE_ID + r"\s*(?:的)?\s*(?:运行)?状态" + _TAIL,
+        r"^(?:check|show|get)\s+(?:the\s+)?(?:status\s+of\s+)?(?:ecs\s+)?(?:instance\s+)?" + _INSTANCE_ID
+        + r"(?:\s+status)?" + _TAIL,
+    ]),
+    ("create_oss_bucket", [
+        r"^(?:请|帮我)*\s*(?:创建|新建)(?:一个)?\s*(?:OSS)?\s*(?:bucket|存储空间)\s*[，,]?\s*(?:名称为|名为|名字为|名称|叫|：|:)?\s*"
+        r"[\"“']?" + _BUCKET_NAME + r"[\"”']?" + _TAIL,
+        r"^create\s+(?:an?\s+)?(?:oss\s+)?bucket\s+(?:named\s+|called\s+)?[\"']?" + _BUCKET_NAME + r"[\"']?" + _TAIL,
+    ]),
+]
+
+
+def _format_ecs_status(action_input: Dict[str, Any], observation: Dict[str, Any]) -> str:
+    instance_id = action_input["instance_id"]
+    status = observation.get("status")
+    if status == "unknown":
+        return f"未找到实例 {instance_id}，请确认实例ID和地域是否正确。"
+    if status == "error":
+        return f"查询实例 {instance_id} 状态失败: {observation.get('message', '')}"
+    answer = f"实例 {instance_id} 当前状态: {status}"
+    public_ip = observation.get("public_ip")
+    if public_ip:
+        answer += f"，公网IP: {', '.join(public_ip) if isinstance(public_ip, list) else public_ip}"
+    return answer + "。"
+
+
+def _format_oss_bucket(action_input: Dict[str, Any], observation: Dict[str, Any]) -> str:
+    bucket_name = action_input["bucket_name"]
+    status = observation.get("status")
+    if status == "success":
+        if (observation.get("details") or {}).get("existed"):
+            return f"OSS Bucket {bucket_name} 已存在，无需重复创建。"
+        return f"OSS Bucket {bucket_name} 创建成功。"
+    if status == "creating":
+        return (f"OSS Bucket {bucket_name} 创建请求已提交，正在确认可用性"
+                f"（操作ID: {observation.get('operation_id')}）。")
+    return f"创建OSS Bucket {bucket_name} 失败: {observation.get('message', '')}"
+
+
+_FORMATTERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], str]] = {
+    "check_ecs_status": _format_ecs_status,
+    "create_oss_bucket": _format_oss_bucket,
+}
+
+_DEFAULT_INPUTS: Dict[str, Dict[str, Any]] = {
+    "create_oss_bucket": {"acl": "private"},
+}
+
+
+class IntentRouter:
+    """确定性快速路由
+
+    在ReAct循环之前用预编译的模式匹配高置信度意图，直接调用工具并格式化回答，
+    不经过大模型；未命中的输入交给大模型处理。
+    """
+
+    def __init__(self, tools: Dict[str, Dict[str, Any]]):
+        self.tools = tools
+        self._routes: List[Tuple[str, Pattern]] = [
+            (action, re.compile(pattern, re.IGNORECASE))
+            for action, patterns in _ROUTES if action in tools
+            for pattern in patterns
+        ]
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Any] = {"requests": 0, "hits": 0, "by_intent": {}, "latency_ms_total": 0.0}
+
+    def match(self, user_input: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """返回 (工具名, 参数)，未命中返回None"""
+        text = user_input.strip()
+        for action, pattern in self._routes:
+            match = pattern.match(text)
+            if not match:
+                continue
+            captured = match.groupdict()
+            # 关键词忽略大小写，但资源ID和Bucket名称必须是小写，否则交给大模型处理
+            if any(value != value.lower() for value in captured.values()):
+                return None
+            return action, {**_DEFAULT_INPUTS.get(action, {}), **captured}
+        return None
+
+    def route(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """命中时直接调用工具，返回 {"action", "action_input", "observation", "answer"}"""
+        with self._lock:
+            self._counters["requests"] += 1
+        matched = self.match(user_input)
+        if matched is None:
+            return None
+
+        action, action_input = matched
+        start = time.perf_counter()
+        observation = self.tools[action]["function"](action_input)
+        answer = _FORMATTERS[action](action_input, observation)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._counters["hits"] += 1
+            self._counters["by_intent"][action] = self._counters["by_intent"].get(action, 0) + 1
+            self._counters["latency_ms_total"] += elapsed_ms
+        logger.info(f"快速路由命中 {action}，耗时 {elapsed_ms:.1f}ms")
+        return {"action": action, "action_input": action_input, "observation": observation, "answer": answer}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {**self._counters, "by_intent": dict(self._counters["by_intent"])}
+        requests, hits = counters["requests"], counters["hits"]
+        latency_total = counters.pop("latency_ms_total")
+        return {
+            **counters,
+            "hit_rate": round(hits / requests, 4) if requests else 0.0,
+            "avg_bypass_latency_ms": round(latency_total / hits, 2) if hits else 0.0,
+        }
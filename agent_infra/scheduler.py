@@ -0,0 +1,184 @@
+import contextvars
+import re
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 视为交付成功的状态；creating表示已提交、正在后台确认就绪
+SUCCESS_STATUSES = {"success", "creating"}
+
+# 引用依赖项结果的占位符，如 "${vsw-1.resource_id}"
+_REFERENCE_PATTERN = re.compile(r"^\$\{([^.}]+)\.([^}]+)\}$")
+
+
+class ProvisionScheduler:
+    """批量资源交付调度器
+
+    按声明的依赖关系（depends_on）拓扑执行交付任务，每种资源类型使用独立的有界线程池，
+    从而限制该类型的全局并发数。依赖项失败时，其下游任务会被跳过。
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]],
+                 concurrency: Dict[str, int]):
+        self.handlers = handlers
+        self._pools = {
+            resource_type: ThreadPoolExecutor(
+                max_workers=max(1, concurrency.get(resource_type, 1)),
+                thread_name_prefix=f"provision-{resource_type}"
+            )
+            for resource_type in handlers
+        }
+
+    def validate(self, items: List[Dict[str, Any]]):
+        """校验任务列表：id唯一、类型受支持、依赖存在且无环；不合法时抛出ValueError"""
+        ids = [item["id"] for item in items]
+        duplicates = {item_id for item_id in ids if ids.count(item_id) > 1}
+        if duplicates:
+            raise ValueError(f"任务id重复: {sorted(duplicates)}")
+
+        known = set(ids)
+        for item in items:
+            if item["type"] not in self.handlers:
+                raise ValueError(f"任务 {item['id']} 的资源类型不受支持: {item['type']}")
+            missing = [dep for dep in item.get("depends_on", []) if dep not in known]
+            if missing:
+                raise ValueError(f"任务 {item['id']} 依赖的任务不存在: {missing}")
+
+        # Kahn算法检测环
+        remaining = {item["id"]: set(item.get("depends_on", [])) for item in items}
+        resolved = [item_id for item_id, deps in remaining.items() if not deps]
+        while resolved:
+            current = resolved.pop()
+            for item_id, deps in remaining.items():
+                if current in deps:
+                    deps.discard(current)
+                    if not deps:
+                        resolved.append(item_id)
+        cyclic = sorted(item_id for item_id, deps in remaining.items() if deps)
+        if cyclic:
+            raise ValueError(f"任务之间存在循环依赖: {cyclic}")
+
+    def _resolve(self, value: Any, results: Dict[str, Dict[str, Any]]) -> Any:
+        """将参数中的 ${id.field} 占位符替换为依赖项结果中的字段"""
+        if isinstance(value, dict):
+            return {k: self._resolve(v, results) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(v, results) for v in value]
+        if isinstance(value, str):
+            match = _REFERENCE_PATTERN.match(value)
+            if match:
+                result = results.get(match.group(1), {})
+                field = match.group(2)
+                return result.get(field, (result.get("details") or {}).get(field))
+        return value
+
+    def run(self, items: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """执行批量交付，逐个产出进度事件；最后一个事件为summary"""
+        self.validate(items)
+        by_id = {item["id"]: item for item in items}
+        remaining = {item["id"]: set(item.get("depends_on", [])) for item in items}
+        dependents: Dict[str, List[str]] = {item["id"]: [] for item in items}
+        for item in items:
+            for dep in item.get("depends_on", []):
+                dependents[dep].append(item["id"])
+
+        results: Dict[str, Dict[str, Any]] = {}
+        outcomes: Dict[str, str] = {}
+        futures: Dict[Future, str] = {}
+
+        def launch(item_id: str) -> Dict[str, Any]:
+            item = by_id[item_id]
+            params = self._resolve(item.get("params", {}), results)
+            futures[self._pools[item["type"]].submit(
+                contextvars.copy_context().run, self.handlers[item["type"]], params)] = item_id
+            return {"event": "started", "data": {"id": item_id, "type": item["type"]}}
+
+        def skip_downstream(failed_id: str) -> Iterator[Dict[str, Any]]:
+            stack = list(dependents[failed_id])
+            while stack:
+                item_id = stack.pop()
+                if item_id in outcomes:
+                    continue
+                outcomes[item_id] = "skipped"
+                stack.extend(dependents[item_id])
+                yield {"event": "skipped", "data": {
+                    "id": item_id, "type": by_id[item_id]["type"], "reason": f"依赖的任务 {failed_id} 未成功"
+                }}
+
+        for item in items:
+            if not remaining[item["id"]]:
+                yield launch(item["id"])
+
+        while futures:
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                item_id = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"交付任务 {item_id} 执行异常: {e}")
+                    result = {"status": "failed", "message": str(e)}
+                results[item_id] = result
+                succeeded = result.get("status") in SUCCESS_STATUSES
+                outcomes[item_id] = "succeeded" if succeeded else "failed"
+                yield {"event": "completed", "data": {
+                    "id": item_id, "type": by_id[item_id]["type"], "result": result
+                }}
+
+                if not succeeded:
+                    yield from skip_downstream(item_id)
+                    continue
+                for dependent in dependents[item_id]:
+                    remaining[dependent].discard(item_id)
+                    if not remaining[dependent] and dependent not in outcomes:
+                        yield launch(dependent)
+
+        summary = {"total": len(items), "succeeded": 0, "failed": 0, "skipped": 0, "results": []}
+        for item in items:
+            outcome = outcomes.get(item["id"], "skipped")
+            summary[outcome] += 1
+            summary["results"].append({
+                "id": item["id"],
+                "type": item["type"],
+                "outcome": outcome,
+                "result": results.get(item["id"])
+            })
+        yield {"event": "summary", "data": summary}
+
+    def run_to_completion(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """执行批量交付并只返回最终的summary"""
+        summary = {}
+        for event in self.run(items):
+            if event["event"] == "summary":
+                summary = event["data"]
+        return summary
+
+
+_provision_scheduler: Optional[ProvisionScheduler] = None
+_provision_scheduler_lock = threading.Lock()
+
+
+def get_provision_scheduler() -> ProvisionScheduler:
+    """返回进程内共享的批量交付调度器，API请求和后台任务共用同一组并发上限"""
+    global _provision_scheduler
+    if _provision_scheduler is None:
+        with _provision_scheduler_lock:
+            if _provision_scheduler is None:
+                from config import load_config
+                from models import ResourceType
+                from tools import get_tool_kit
+
+                # 工具实例在首次调用时才创建
+                _provision_scheduler = ProvisionScheduler(
+                    handlers={
+                        ResourceType.ECS.value: lambda params: get_tool_kit().create_ecs_instance(params),
+                        ResourceType.OSS.value: lambda params: get_tool_kit().create_oss_bucket(params),
+                        ResourceType.VSWITCH.value: lambda params: get_tool_kit().create_vswitch(params),
+                        ResourceType.ECS_FLEET.value: lambda params: get_tool_kit().create_ecs_fleet(params),
+                    },
+                    concurrency=load_config()["provision_concurrency"],
+                )
+    return _provision_scheduler
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+import logging
+from typing import Any, Dict, List
+
+from tokens import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """多轮会话存储接口，按session_id（即user_id）保存对话历史"""
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内会话存储，空闲超过idle_ttl秒的会话会被清除"""
+
+    def __init__(self, idle_ttl: float = 1800.0, max_messages: int = 50):
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._expired = 0
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s["last_access"] > self.idle_ttl]
+        for sid in expired:
+            del self._sessions[sid]
+        self._expired += len(expired)
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            self._purge_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session["last_access"] = time.monotonic()
+            return list(session["messages"])
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {"messages": [], "last_access": 0.0})
+            session["messages"].extend(messages)
+            del session["messages"][:-self.max_messages]
+            session["last_access"] = time.monotonic()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "expired": self._expired}
+
+
+class RedisSessionStore(SessionStore):
+    """Redis会话存储，与docker-compose.yml中的redis服务配合使用"""
+
+    KEY_PREFIX = "infra-agent:session:"
+
+    def __init__(self, url: str, idle_ttl: float = 1800.0, max_messages: int = 50):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用Redis会话存储需要安装redis包: pip install redis")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.idle_ttl = int(idle_ttl)
+        self.max_messages = max_messages
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, self.idle_ttl)
+        items, _ = pipe.execute()
+        return [json.loads(item) for item in items]
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        if not messages:
+            return
+        key = self._key(session_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.idle_ttl)
+        pipe.execute()
+
+    def clear(self, session_id: str):
+        self.client.delete(self._key(session_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+def create_session_store(config: Dict[str, Any]) -> SessionStore:
+    """根据配置创建会话存储"""
+    backend = config["session_backend"]
+    if backend == "redis":
+        logger.info("使用Redis会话存储")
+        return RedisSessionStore(
+            config["redis_url"],
+            idle_ttl=config["session_idle_ttl"],
+            max_messages=config["session_max_messages"],
+        )
+    if backend != "memory":
+        raise RuntimeError(f"不支持的会话存储后端: {backend}")
+    return InMemorySessionStore(
+        idle_ttl=config["session_idle_ttl"],
+        max_messages=config["session_max_messages"],
+    )
+
+
+def trim_history(history: List[Dict[str, str]], token_budget: int) -> List[Dict[str, str]]:
+    """从最早的消息开始丢弃，使历史消息的估算token数不超过预算"""
+    trimmed = list(history)
+    while trimmed and estimate_message_tokens(trimmed) > token_budget:
+        # 成对丢弃（用户问题 + 助手回答），保持对话结构
+        del trimmed[:2]
+    return trimmed
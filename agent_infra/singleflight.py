@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache import MISSING, TTLCache
+
+
+class SingleFlight:
+    """相同调用去重
+
+    同一键的并发调用共享一次实际执行；执行成功的结果在window秒内被后续相同调用直接复用。
+    失败结果不会被缓存，调用方可以立即重试。
+    """
+
+    def __init__(self, window: float = 600.0, maxsize: int = 1024,
+                 cacheable: Optional[Callable[[Any], bool]] = None, name: str = "singleflight"):
+        self.window = window
+        self.name = name
+        self.cacheable = cacheable or (lambda result: True)
+        self._results = TTLCache(maxsize=maxsize, ttl=window)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "executed": 0, "shared": 0, "replayed": 0}
+
+    @staticmethod
+    def make_key(kind: str, params: Dict[str, Any]) -> str:
+        """根据资源类型和规范化后的参数计算键：字符串去除首尾空白，忽略值为None的参数"""
+        normalized = {
+            k: v.strip() if isinstance(v, str) else v
+            for k, v in params.items() if v is not None
+        }
+        payload = json.dumps({"kind": kind, "params": normalized}, ensure_ascii=False,
+                             sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, str]:
+        """执行或复用调用，返回 (结果, 来源)；来源为 executed、shared 或 replayed"""
+        with self._lock:
+            self._counters["calls"] += 1
+            cached = self._results.get(key, MISSING)
+            if cached is not MISSING:
+                self._counters["replayed"] += 1
+                return cached, "replayed"
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self._counters["executed"] += 1
+            else:
+                self._counters["shared"] += 1
+
+        if not leader:
+            return future.result(), "shared"
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if self.cacheable(result):
+                self._results.set(key, result)
+            del self._inflight[key]
+        future.set_result(result)
+        return result, "executed"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "inflight": len(self._inflight), "cached": len(self._results)}
@@ -0,0 +1,15 @@
+"""测试公共配置：模块按平铺方式导入（与 uvicorn app:app 一致），不需要真实凭证"""
+import os
+import sys
+from pathlib import Path
+
+AGENT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(AGENT_DIR))
+sys.path.insert(0, str(AGENT_DIR / "benchmarks"))
+
+# 配置在首次load_config()时解析并缓存，必须在导入业务模块之前设置
+os.environ.setdefault("QWEN_API_KEY", "test")
+os.environ.setdefault("ALIYUN_ACCESS_KEY_ID", "test")
+os.environ.setdefault("ALIYUN_ACCESS_KEY_SECRET", "test")
+# 资源清单使用内存数据库，测试不在工作目录留下inventory.db
+os.environ.setdefault("INVENTORY_PATH", ":memory:")
@@ -0,0 +1,158 @@
+import json
+import threading
+
+import pytest
+
+from agent_core import SimpleAgent
+
+
+class ScriptedLLM:
+    """按顺序返回预设的assistant消息，并记录每次调用的提示和工具定义"""
+
+    stop_sequences = None
+
+    def __init__(self, *messages):
+        self.messages = list(messages)
+        self.calls = []
+
+    def chat_message(self, messages, tools=None, **kwargs):
+        self.calls.append({"messages": [dict(m) for m in messages], "tools": tools})
+        return self.messages.pop(0)
+
+
+def _tool_call(call_id: str, name: str, arguments) -> dict:
+    arguments = arguments if isinstance(arguments, str) else json.dumps(arguments)
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+def _assistant(content: str = "", tool_calls=None, finish_reason: str = "stop") -> dict:
+    message = {"role": "assistant", "content": content, "finish_reason": finish_reason}
+    if tool_calls:
+        message.update(tool_calls=tool_calls, finish_reason="tool_calls")
+    return message
+
+
+@pytest.fixture
+def agent():
+    agent = SimpleAgent()
+    agent.router = None
+    agent.tool_mode = "native"
+    return agent
+
+
+def _fake_tool(agent: SimpleAgent, name: str, calls: list, func=None):
+    def tool(params):
+        calls.append((name, params))
+        return func(params) if func else {"status": "success", "resource_type": name, "resource_id": f"{name}-1"}
+    agent.tools[name]["function"] = tool
+
+
+def _events(agent: SimpleAgent, message: str = "创建OSS Bucket logs-2024"):
+    return list(agent.iter_events(message, use_cache=False))
+
+
+def test_native_tool_calls_pass_structured_arguments(agent):
+    calls = []
+    _fake_tool(agent, "create_oss_bucket", calls)
+    agent.llm = ScriptedLLM(
+        _assistant(tool_calls=[_tool_call("call-1", "create_oss_bucket", {"bucket_name": "logs-2024"})]),
+        _assistant("Bucket logs-2024 已创建"),
+    )
+
+    events = _events(agent)
+
+    assert calls == [("create_oss_bucket", {"bucket_name": "logs-2024"})]
+    assert events[-1]["data"]["content"] == "Bucket logs-2024 已创建"
+    assert events[-1]["data"]["iterations"] == 2
+    first, second = agent.llm.calls
+    assert {tool["function"]["name"] for tool in first["tools"]} == set(agent.tools)
+    tool_message = second["messages"][-1]
+    assert tool_message["role"] == "tool" and tool_message["tool_call_id"] == "call-1"
+    assert json.loads(tool_message["content"])["resource_id"] == "create_oss_bucket-1"
+
+
+def test_native_mode_falls_back_to_react_when_tools_unsupported(agent):
+    calls = []
+    _fake_tool(agent, "create_oss_bucket", calls)
+    agent.llm = ScriptedLLM(
+        {"role": "assistant", "content": "调用大模型失败: 400", "error": True, "status_code": 400},
+        _assistant('Thought: 创建Bucket\nAction: create_oss_bucket\nAction Input: {"bucket_name": "logs-2024"}'),
+        _assistant("Final Answer: 已创建"),
+    )
+
+    events = _events(agent)
+
+    assert calls == [("create_oss_bucket", {"bucket_name": "logs-2024"})]
+    assert events[-1]["data"]["content"] == "已创建"
+    native, react, _ = agent.llm.calls
+    assert native["tools"] and react["tools"] is None
+    assert "响应格式" in react["messages"][0]["content"]
+
+
+def test_invalid_tool_arguments_are_reported_not_executed(agent):
+    calls = []
+    _fake_tool(agent, "create_oss_bucket", calls)
+    agent.llm = ScriptedLLM(
+        _assistant(tool_calls=[_tool_call("call-1", "create_oss_bucket", '{"bucket_name": ')]),
+        _assistant("参数有误，请提供Bucket名称"),
+    )
+
+    events = _events(agent)
+
+    assert calls == []
+    assert [e["data"]["message"] for e in events if e["event"] == "error"] == ["工具 create_oss_bucket 的参数不是合法JSON"]
+    assert "参数不是合法JSON" in agent.llm.calls[1]["messages"][-1]["content"]
+
+
+def _barrier_tool(barrier: threading.Barrier):
+    """两个工具都开始执行后才返回；串行执行时等待超时"""
+    def run(params):
+        barrier.wait()
+        return {"status": "success", "resource_id": params.get("instance_name") or params.get("bucket_name")}
+    return run
+
+
+def test_tool_calls_in_one_turn_run_concurrently(agent):
+    calls = []
+    barrier = threading.Barrier(2, timeout=2)
+    _fake_tool(agent, "create_ecs_instance", calls, _barrier_tool(barrier))
+    _fake_tool(agent, "create_oss_bucket", calls, _barrier_tool(barrier))
+    agent.llm = ScriptedLLM(
+        _assistant(tool_calls=[
+            _tool_call("call-ecs", "create_ecs_instance", {"instance_name": "web"}),
+            _tool_call("call-oss", "create_oss_bucket", {"bucket_name": "logs-2024"}),
+        ]),
+        _assistant("ECS和OSS均已创建"),
+    )
+
+    events = _events(agent, "创建一台ECS和一个OSS Bucket")
+
+    assert [e for e in events if e["event"] == "error"] == []
+    assert sorted(e["data"]["action"] for e in events if e["event"] == "observation") == [
+        "create_ecs_instance", "create_oss_bucket"]
+    # 两个结果在同一条后续请求中按调用顺序回传
+    assert len(agent.llm.calls) == 2
+    tool_messages = [m for m in agent.llm.calls[1]["messages"] if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["call-ecs", "call-oss"]
+    assert [json.loads(m["content"])["resource_id"] for m in tool_messages] == ["web", "logs-2024"]
+
+
+def test_react_actions_in_one_turn_share_one_observation_message(agent):
+    calls = []
+    barrier = threading.Barrier(2, timeout=2)
+    _fake_tool(agent, "create_ecs_instance", calls, _barrier_tool(barrier))
+    _fake_tool(agent, "create_oss_bucket", calls, _barrier_tool(barrier))
+    agent.tool_mode = "react"
+    agent.llm = ScriptedLLM(
+        _assistant('Thought: 两个资源互不依赖\n'
+                   'Action: create_ecs_instance\nAction Input: {"instance_name": "web"}\n'
+                   'Action: create_oss_bucket\nAction Input: {"bucket_name": "logs-2024"}'),
+        _assistant("Final Answer: 均已创建"),
+    )
+
+    events = _events(agent, "创建一台ECS和一个OSS Bucket")
+
+    assert (events[-1]["data"]["content"], events[-1]["data"]["iterations"]) == ("均已创建", 2)
+    observation = agent.llm.calls[1]["messages"][-1]["content"].splitlines()
+    assert observation[0].startswith('Observation 1 (create_ecs_instance): {"status":"success","resource_id":"web"')
+    assert observation[1].startswith('Observation 2 (create_oss_bucket): {"status":"success","resource_id":"logs-2024"')
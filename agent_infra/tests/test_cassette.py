@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from cassette import REDACTED, Cassette, CassetteClient, CassetteHTTPClient, CassetteMiss
+from fake_aliyun import FakeEcsClient
+from fake_llm import FakeChatServer
+from http_client import PooledHTTPClient
+from ratelimit import is_ecs_throttled
+
+CHAT_BODY = {
+    "model": "qwen-plus",
+    "messages": [{"role": "user", "content": "Question: 创建ECS实例 web-1，密码是 Abc@12345"}],
+}
+
+
+class ThrottledEcsClient:
+    def describe_instances_with_options(self, request, runtime):
+        from Tea.exceptions import TeaException
+        raise TeaException({"code": "Throttling.User", "message": "too fast", "data": {"statusCode": 429}})
+
+
+def _create_request(password: str):
+    ecs_models = pytest.importorskip("alibabacloud_ecs20140526.models")
+    return ecs_models.CreateInstanceRequest(region_id="cn-hangzhou", instance_name="web-1", password=password)
+
+
+def _record(path: str):
+    """对假大模型服务和假ECS客户端录制一组调用，返回录制时得到的结果"""
+    server = FakeChatServer(latency=0, jitter=0).start()
+    http = PooledHTTPClient()
+    cassette = Cassette(path, "record")
+    try:
+        llm = CassetteHTTPClient(cassette, http)
+        answer = llm.post(f"{server.url}/chat/completions", json=CHAT_BODY).json()
+        stream = llm.post(f"{server.url}/chat/completions", json={**CHAT_BODY, "stream": True}, stream=True)
+        lines = list(stream.iter_lines(decode_unicode=True))
+        stream.close()
+
+        ecs = CassetteClient(cassette, "ecs:cn-hangzhou", FakeEcsClient(latency=0))
+        created = ecs.create_instance_with_options(_create_request("Abc@12345"), None)
+        with pytest.raises(Exception) as throttled:
+            CassetteClient(cassette, "ecs:cn-hangzhou", ThrottledEcsClient()).describe_instances_with_options({}, None)
+    finally:
+        cassette.close()
+        http.close()
+        server.stop()
+    return answer, lines, created.body.instance_id, throttled.value
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    answer, lines, instance_id, error = _record(path)
+
+    cassette = Cassette(path, "replay", realtime=False)
+    llm = CassetteHTTPClient(cassette, http=None)
+    url = "http://unreachable.invalid/chat/completions"
+
+    assert llm.post(url, json=CHAT_BODY).json() == answer
+    replayed = llm.post(url, json={**CHAT_BODY, "stream": True}, stream=True)
+    assert list(replayed.iter_lines(decode_unicode=True)) == lines
+    ecs = CassetteClient(cassette, "ecs:cn-hangzhou")
+    assert ecs.create_instance_with_options(_create_request("Abc@12345"), None).body.instance_id == instance_id
+    with pytest.raises(type(error)) as replayed_error:
+        ecs.describe_instances_with_options({}, None)
+    assert replayed_error.value.code == "Throttling.User"
+    assert is_ecs_throttled(replayed_error.value)
+    assert cassette.stats()["misses"] == 0 and cassette.stats()["fallback"] == 0
+
+
+def test_recorded_requests_are_redacted(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    _record(str(path))
+
+    content = path.read_text(encoding="utf-8")
+    assert "Abc@12345" not in content
+    entries = [json.loads(line) for line in content.splitlines()]
+    create = next(e for e in entries if e["call"].endswith("create_instance_with_options"))
+    assert create["request"]["args"][0]["Password"] == REDACTED
+    assert f"密码是 {REDACTED}" in entries[0]["request"]["messages"][0]["content"]
+
+
+def test_matching_uses_redacted_request(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    _record(path)
+
+    # 回放时的密码与录制时不同，脱敏后仍然精确匹配
+    cassette = Cassette(path, "replay", realtime=False)
+    CassetteClient(cassette, "ecs:cn-hangzhou").create_instance_with_options(_create_request("Other#999"), None)
+
+    assert cassette.stats()["fallback"] == 0
+
+
+def test_repeated_requests_replay_in_order_then_repeat_last(tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    recorder = Cassette(path, "record")
+    for status in ("Pending", "Starting", "Running"):
+        recorder.record("ecs.describe", {"InstanceIds": ["i-1"]}, {"status": status})
+    recorder.close()
+
+    cassette = Cassette(path, "replay", realtime=False)
+    statuses = [cassette.replay("ecs.describe", {"InstanceIds": ["i-1"]})["status"] for _ in range(4)]
+
+    assert statuses == ["Pending", "Starting", "Running", "Running"]
+    with pytest.raises(CassetteMiss):
+        cassette.replay("oss.put_bucket", {"bucket": "b"})
+    assert cassette.stats()["misses"] == 1
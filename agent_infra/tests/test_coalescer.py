@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from coalescer import BatchCoalescer
+from metrics import REGISTRY
+
+
+def _submit_all(coalescer: BatchCoalescer, keys):
+    """并发提交keys，返回各key对应的结果或异常"""
+    outcomes = {}
+    lock = threading.Lock()
+    start = threading.Barrier(len(keys))
+
+    def call(index, key):
+        start.wait()
+        try:
+            outcome = coalescer.call(key, timeout=2)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes[index] = outcome
+
+    threads = [threading.Thread(target=call, args=(index, key)) for index, key in enumerate(keys)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(3)
+    return [outcomes[index] for index in range(len(keys))]
+
+
+def test_concurrent_lookups_are_merged_into_one_batch():
+    batches = []
+
+    def describe(keys):
+        batches.append(sorted(keys))
+        return {key: f"status-{key}" for key in keys}
+
+    coalescer = BatchCoalescer(describe, window=0.2, max_batch_size=100)
+    keys = ["i-1", "i-2", "i-3", "i-2", "i-4"]
+
+    results = _submit_all(coalescer, keys)
+
+    assert results == [f"status-{key}" for key in keys]
+    # 重复的key在同一批次中只查询一次
+    assert batches == [["i-1", "i-2", "i-3", "i-4"]]
+    stats = coalescer.stats()
+    assert stats["requests"] == 5 and stats["batches"] == 1 and stats["max_batch"] == 4
+
+
+def test_missing_keys_resolve_to_none():
+    coalescer = BatchCoalescer(lambda keys: {}, window=0)
+
+    assert coalescer.call("i-unknown", timeout=1) is None
+
+
+def test_batch_error_fans_out_to_every_caller():
+    def describe(keys):
+        raise RuntimeError("DescribeInstances failed")
+
+    coalescer = BatchCoalescer(describe, window=0.2)
+
+    results = _submit_all(coalescer, ["i-1", "i-2", "i-1"])
+
+    assert all(isinstance(result, RuntimeError) and str(result) == "DescribeInstances failed" for result in results)
+    assert coalescer.stats()["errors"] == 1
+    # 出错后合并器仍可继续使用
+    coalescer.batch_fn = lambda keys: {key: "Running" for key in keys}
+    assert coalescer.call("i-1", timeout=1) == "Running"
+
+
+def test_full_batch_is_executed_without_waiting_for_window():
+    sizes = []
+
+    def describe(keys):
+        sizes.append(len(keys))
+        return {key: key for key in keys}
+
+    coalescer = BatchCoalescer(describe, window=0.5, max_batch_size=2)
+    leader = threading.Thread(target=coalescer.call, args=("i-1",), kwargs={"timeout": 2})
+    leader.start()
+
+    # leader仍在窗口内等待；第二个key凑满批次，由提交方立即执行
+    assert coalescer.call("i-2", timeout=1) == "i-2"
+    assert sizes == [2]
+    leader.join(2)
+
+
+@pytest.mark.parametrize("window", [0, 0.01])
+def test_sequential_calls_each_get_a_result(window):
+    coalescer = BatchCoalescer(lambda keys: {key: key.upper() for key in keys}, window=window)
+
+    assert [coalescer.call(key, timeout=1) for key in ("a", "b", "c")] == ["A", "B", "C"]
+    assert coalescer.stats()["batches"] == 3
+
+
+def test_batch_size_and_wait_are_exported_as_metrics():
+    coalescer = BatchCoalescer(lambda keys: {key: key for key in keys}, window=0.2, name="metrics-test")
+
+    _submit_all(coalescer, ["i-1", "i-2", "i-1"])
+
+    lines = REGISTRY.render().splitlines()
+    assert 'agent_batch_size_count{batcher="metrics-test"} 1' in lines
+    assert 'agent_batch_size_sum{batcher="metrics-test"} 2' in lines
+    # 每个调用方各记录一次等待时间，至少包含批量窗口
+    assert 'agent_batch_wait_seconds_count{batcher="metrics-test"} 3' in lines
+    assert 'agent_batch_wait_seconds_bucket{batcher="metrics-test",le="0.1"} 0' in lines
+    assert 'agent_batch_window_seconds{batcher="metrics-test"} 0.2' in lines
@@ -0,0 +1,142 @@
+import json
+
+from compaction import ContextCompactor, compact_observation, encode_observation, summarize_observation
+from tokens import estimate_message_tokens
+
+SYSTEM = {"role": "system", "content": "系统提示"}
+QUESTION = {"role": "user", "content": "Question: 创建实例"}
+
+
+def _message(role: str, tokens: int, mark: str) -> dict:
+    """CJK字符每个按1个token估算，mark用于区分消息"""
+    return {"role": role, "content": mark + "字" * tokens}
+
+
+def _turn(index: int, full_tokens: int = 200, summary_tokens: int = 10):
+    full = [_message("assistant", 20, f"动作{index}"), _message("user", full_tokens, f"完整{index}")]
+    summary = [full[0], _message("user", summary_tokens, f"摘要{index}")]
+    return full, summary
+
+
+def _marks(messages):
+    return [m["content"].rstrip("字") for m in messages]
+
+
+def test_older_turns_use_summary_and_recent_turn_stays_full():
+    compactor = ContextCompactor([SYSTEM, QUESTION], token_budget=10000, keep_recent=1)
+    for index in range(3):
+        compactor.add_turn(*_turn(index))
+
+    assert _marks(compactor.prompt()) == [
+        "系统提示", "Question: 创建实例", "动作0", "摘要0", "动作1", "摘要1", "动作2", "完整2"]
+
+
+def test_disabled_compactor_sends_everything_verbatim():
+    compactor = ContextCompactor([SYSTEM, QUESTION], keep_recent=1, enabled=False)
+    for index in range(2):
+        compactor.add_turn(*_turn(index))
+
+    assert _marks(compactor.prompt()) == ["系统提示", "Question: 创建实例", "动作0", "完整0", "动作1", "完整1"]
+    assert compactor.tokens_saved == 0
+
+
+def test_recent_turns_are_summarized_when_over_budget():
+    compactor = ContextCompactor([SYSTEM, QUESTION], token_budget=400, keep_recent=2)
+    for index in range(2):
+        compactor.add_turn(*_turn(index))
+
+    # 两轮完整形式超出预算，除最后一轮外都换成摘要
+    assert _marks(compactor.prompt())[2:] == ["动作0", "摘要0", "动作1", "完整1"]
+
+
+def test_history_is_dropped_in_pairs_before_turns():
+    history = [
+        _message("user", 150, "问1"), _message("assistant", 150, "答1"),
+        _message("user", 20, "问2"), _message("assistant", 20, "答2"),
+    ]
+    compactor = ContextCompactor([SYSTEM, *history, QUESTION], token_budget=330, keep_recent=1)
+    compactor.add_turn(*_turn(0))
+
+    messages = compactor.prompt()
+
+    assert _marks(messages) == ["系统提示", "问2", "答2", "Question: 创建实例", "动作0", "完整0"]
+    assert estimate_message_tokens(messages) <= 330
+
+
+def test_oldest_turns_are_dropped_last_and_final_turn_is_always_kept():
+    compactor = ContextCompactor([SYSTEM, _message("user", 50, "问1"), _message("assistant", 50, "答1"), QUESTION],
+                                 token_budget=100, keep_recent=1)
+    for index in range(3):
+        compactor.add_turn(*_turn(index, full_tokens=60, summary_tokens=40))
+
+    # 预算连最后一轮都容纳不下：历史和较早的轮次全部丢弃，系统提示、问题和最后一轮保留
+    assert _marks(compactor.prompt()) == ["系统提示", "Question: 创建实例", "动作2", "完整2"]
+
+
+def test_tokens_saved_accumulates_per_prompt():
+    compactor = ContextCompactor([SYSTEM, QUESTION], token_budget=10000, keep_recent=1)
+    for index in range(2):
+        full, summary = _turn(index)
+        compactor.add_turn(full, summary, raw_tokens=estimate_message_tokens(full) + 100)
+
+    first = compactor.prompt()
+    saved = compactor.tokens_saved
+    compactor.prompt()
+
+    raw = estimate_message_tokens([SYSTEM, QUESTION]) + 2 * (estimate_message_tokens(_turn(0)[0]) + 100)
+    assert saved == raw - estimate_message_tokens(first)
+    assert compactor.tokens_saved == 2 * saved
+
+
+def test_compact_observation_drops_noise_and_truncates():
+    value = {
+        "status": "success",
+        "request_id": "req-1",
+        "client_token": "token",
+        "message": "x" * 300,
+        "empty": None,
+        "instances": list(range(8)),
+    }
+
+    compacted = compact_observation(value)
+
+    assert set(compacted) == {"status", "message", "instances"}
+    assert compacted["message"] == "x" * 200 + "..."
+    assert compacted["instances"] == [0, 1, 2, 3, 4, "...另有 3 项"]
+    assert json.loads(encode_observation(value)) == compacted
+    assert json.loads(encode_observation(value, compact=False)) == value
+
+
+def test_summary_keeps_only_key_fields():
+    summary = json.loads(summarize_observation({
+        "status": "success", "resource_type": "ecs", "resource_id": "i-" + "a" * 80,
+        "details": {"instance_type": "ecs.g6.large"},
+    }))
+
+    assert set(summary) == {"status", "resource_type", "resource_id"}
+    assert summary["resource_id"] == "i-" + "a" * 80
+
+
+def test_fleet_ids_are_never_truncated():
+    instance_ids = [f"i-{index:020d}" for index in range(12)]
+    value = {
+        "status": "success", "resource_type": "ecs_fleet", "resource_id": ",".join(instance_ids),
+        "details": {
+            "instance_ids": instance_ids,
+            "public_ips": {instance_id: f"47.0.0.{index}" for index, instance_id in enumerate(instance_ids)},
+            "status_counts": {"Running": 12},
+            "tags": [f"tag-{index}" for index in range(8)],
+            **{f"field_{index}": index for index in range(12)},
+        },
+    }
+
+    compacted = compact_observation(value)
+
+    assert compacted["resource_id"] == value["resource_id"]
+    details = compacted["details"]
+    assert details["instance_ids"] == instance_ids
+    assert details["public_ips"] == value["details"]["public_ips"]
+    # 描述性字段照常精简
+    assert details["tags"][-1] == "...另有 3 项"
+    assert details["_omitted"] == 4
+    assert json.loads(summarize_observation(value))["resource_id"] == value["resource_id"]
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+import pytest
+
+from executor import AgentExecutor, OverloadedError
+
+
+async def _until(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "等待条件超时"
+        await asyncio.sleep(0.01)
+
+
+def test_requests_beyond_queue_are_rejected():
+    async def scenario():
+        executor = AgentExecutor(max_concurrency=1, queue_size=1, retry_after=7)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.submit(release.wait, 2))
+        queued = asyncio.ensure_future(executor.submit(lambda: "queued"))
+        await _until(lambda: executor.stats()["waiting"] == 1)
+
+        with pytest.raises(OverloadedError) as rejected:
+            await executor.submit(lambda: "rejected")
+        assert rejected.value.retry_after == 7
+
+        release.set()
+        assert await queued == "queued"
+        await running
+        return executor.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["admitted"], stats["rejected"], stats["completed"], stats["active"]) == (2, 1, 2, 0)
+
+
+def test_cancelled_submit_keeps_slot_until_worker_finishes():
+    async def scenario():
+        executor = AgentExecutor(max_concurrency=1, queue_size=1)
+        release = threading.Event()
+        task = asyncio.ensure_future(executor.submit(release.wait, 2))
+        await _until(lambda: executor.stats()["active"] == 1)
+        task.cancel()
+        await asyncio.sleep(0.05)
+
+        # 工作线程仍在执行，槽位不能归还给排队的请求
+        assert executor.stats()["active"] == 1
+        queued = asyncio.ensure_future(executor.submit(lambda: "next"))
+        await asyncio.sleep(0.05)
+        assert not queued.done()
+
+        release.set()
+        assert await queued == "next"
+        await _until(lambda: executor.stats()["active"] == 0)
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_stream_releases_slot_after_generator_step():
+    release = threading.Event()
+    closed = threading.Event()
+
+    def events():
+        try:
+            yield "first"
+            release.wait(2)
+            yield "second"
+        finally:
+            closed.set()
+
+    async def scenario():
+        executor = AgentExecutor(max_concurrency=1, queue_size=1)
+        stream = executor.stream(events)
+        assert await stream.__anext__() == "first"
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        # 客户端断开：取消正在等待的下一个元素，生成器仍在工作线程中执行
+        pending.cancel()
+        await asyncio.sleep(0.05)
+        assert executor.stats()["active"] == 1
+        assert not closed.is_set()
+
+        release.set()
+        await _until(lambda: executor.stats()["active"] == 0)
+        assert closed.is_set()
+
+    asyncio.run(scenario())
+
+
+def test_stream_admission_failure_raises_on_first_iteration():
+    async def scenario():
+        executor = AgentExecutor(max_concurrency=1, queue_size=0)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.submit(release.wait, 2))
+        await _until(lambda: executor.stats()["active"] == 1)
+        with pytest.raises(OverloadedError):
+            await executor.stream(iter, [1]).__anext__()
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_endpoints_return_503_with_retry_after(monkeypatch):
+    import app
+    from fastapi import HTTPException
+
+    async def overloaded_submit(*args, **kwargs):
+        raise OverloadedError(7)
+
+    async def overloaded_stream(*args, **kwargs):
+        raise OverloadedError(7)
+        yield
+
+    monkeypatch.setattr(app.agent_executor, "submit", overloaded_submit)
+    monkeypatch.setattr(app.agent_executor, "stream", overloaded_stream)
+    for handler in (app.chat_with_agent, app.chat_with_agent_stream):
+        with pytest.raises(HTTPException) as rejected:
+            asyncio.run(handler(app.UserRequest(message="创建实例")))
+        assert rejected.value.status_code == 503
+        assert rejected.value.headers == {"Retry-After": "7"}
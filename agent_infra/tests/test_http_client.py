@@ -0,0 +1,55 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import PooledHTTPClient
+from ratelimit import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def throttling_server():
+    """始终返回429的HTTP服务，记录收到的请求数"""
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            calls.append(1)
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/", calls
+    server.shutdown()
+    server.server_close()
+
+
+def test_429_is_retried_only_by_the_rate_limiter(throttling_server):
+    url, calls = throttling_server
+    limiter = AdaptiveRateLimiter("test", qps=1000, min_qps=500, recovery_interval=0, max_retries=2)
+    client = PooledHTTPClient(rate_limiter=limiter, max_retries=3, backoff_base=0.001)
+
+    response = client.post(url, json={})
+
+    assert response.status_code == 429
+    # 首次请求加限流器的2次重新排队，不再叠加5xx退避重试
+    assert len(calls) == 3
+    assert client.stats.snapshot()["failures"] == 1
+    client.close()
+
+
+def test_429_without_rate_limiter_uses_backoff_retries(throttling_server):
+    url, calls = throttling_server
+    client = PooledHTTPClient(max_retries=2, backoff_base=0.001, backoff_max=0.001)
+
+    assert client.post(url, json={}).status_code == 429
+    assert len(calls) == 3
+    client.close()
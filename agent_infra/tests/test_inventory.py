@@ -0,0 +1,95 @@
+from fake_aliyun import FakeEcsClient, FakeOssBackend
+from inventory import ResourceInventory, current_user
+from tools import AliyunToolKit
+
+
+def _tool_kit(ecs=None, oss=None) -> AliyunToolKit:
+    oss = oss or FakeOssBackend(latency=0)
+    return AliyunToolKit(ecs_client=ecs or FakeEcsClient(latency=0), bucket_factory=oss.bucket,
+                         oss_service=oss.service())
+
+
+def _rows(inventory: ResourceInventory, **conditions):
+    return {item["resource_id"]: item for item in inventory.query(**conditions)["items"]}
+
+
+def _ecs_result(instance_id: str, status: str = "success"):
+    return {
+        "resource_type": "ecs", "resource_id": instance_id, "status": status,
+        "details": {"region": "cn-hangzhou", "instance_name": "web", "instance_type": "ecs.g6.large"},
+    }
+
+
+def test_record_keeps_polled_status_and_update_ignores_unknown_rows():
+    inventory = ResourceInventory()
+    inventory.record(_ecs_result("i-1"), user_id="alice")
+    assert inventory.update_status("ecs", "i-1", "Running", public_ip="1.2.3.4")
+    assert not inventory.update_status("ecs", "i-missing", "Running")
+
+    # 同一实例再次记录（如幂等令牌返回已有实例）不回退到初始状态
+    inventory.record(_ecs_result("i-1"), user_id="alice")
+    inventory.record(_ecs_result("i-2", status="failed"), user_id="alice")
+
+    rows = _rows(inventory, user_id="alice")
+    assert set(rows) == {"i-1"}
+    assert rows["i-1"]["status"] == "Running"
+    assert rows["i-1"]["details"] == {"instance_type": "ecs.g6.large", "public_ip": "1.2.3.4"}
+
+
+def test_sync_merges_pages_and_marks_missing_resources_removed():
+    inventory = ResourceInventory()
+    inventory.record(_ecs_result("i-1"), user_id="alice")
+    inventory.record(_ecs_result("i-gone"), user_id="alice")
+
+    result = inventory.apply_sync("ecs", "cn-hangzhou", [
+        [{"resource_id": "i-1", "status": "Stopped"}],
+        [{"resource_id": "i-console", "status": "Running", "name": "console"}],
+    ])
+
+    assert result == {"seen": 2, "changed": 2, "removed": 1}
+    rows = _rows(inventory, user_id="alice")
+    assert rows["i-1"]["status"] == "Stopped" and rows["i-1"]["user_id"] == "alice"
+    assert rows["i-gone"]["status"] == "Released"
+    # 同步发现的资源没有归属用户，按用户查询时也能看到
+    assert rows["i-console"]["user_id"] is None
+    assert set(_rows(inventory, user_id="bob")) == {"i-console"}
+
+
+def test_oss_verified_before_result_returns_is_recorded_available():
+    tool_kit = _tool_kit(oss=FakeOssBackend(latency=0, ready_after=0.1))
+    dedup_result = tool_kit._dedup_result
+
+    def dedup_after_ready(kind, result, source):
+        # 后台轮询抢在创建请求返回之前完成验证
+        tool_kit.waiter.get(result["operation_id"]).wait(5)
+        return dedup_result(kind, result, source)
+
+    tool_kit._dedup_result = dedup_after_ready
+    result = tool_kit.create_oss_bucket({"bucket_name": "ready-bucket"})
+
+    assert result["status"] == "creating"
+    assert _rows(tool_kit.inventory)["ready-bucket"]["status"] == "available"
+
+
+def test_ecs_ready_on_first_poll_is_recorded_with_polled_status():
+    tool_kit = _tool_kit(ecs=FakeEcsClient(latency=0, ready_after=0))
+
+    result = tool_kit.create_ecs_instance({"instance_name": "web"})
+
+    assert result["status"] == "success"
+    assert _rows(tool_kit.inventory)[result["resource_id"]]["status"] == "Stopped"
+
+
+def test_fleet_is_recorded_once_per_instance():
+    tool_kit = _tool_kit(ecs=FakeEcsClient(latency=0, ready_after=0))
+    token = current_user.set("alice")
+    try:
+        result = tool_kit.create_ecs_fleet({"instance_name": "web", "amount": 3})
+    finally:
+        current_user.reset(token)
+
+    assert result["status"] == "success"
+    rows = _rows(tool_kit.inventory, user_id="alice")
+    assert sorted(rows) == sorted(result["details"]["instance_ids"])
+    assert {row["status"] for row in rows.values()} == {"Running"}
+    assert tool_kit.inventory.stats()["recorded"] == 3
@@ -0,0 +1,257 @@
+import threading
+import time
+
+import pytest
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, InMemoryJobQueue, RedisJobQueue, SQLiteJobQueue
+from worker import JobWorker
+
+LEASE = 0.3
+
+
+def _memory_queue(tmp_path, **options):
+    return InMemoryJobQueue(**options)
+
+
+def _sqlite_queue(tmp_path, **options):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"), **options)
+
+
+def _redis_queue(tmp_path, **options):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisJobQueue("redis://test", client=fakeredis.FakeRedis(decode_responses=True), **options)
+
+
+QUEUES = [_memory_queue, _sqlite_queue, _redis_queue]
+# 进程内队列的任务随进程结束，不回收租约
+LEASED_QUEUES = [_sqlite_queue, _redis_queue]
+
+
+def _expire_leases(queue):
+    time.sleep(LEASE + 0.1)
+    if isinstance(queue, RedisJobQueue):
+        queue._recover_expired(force=True)
+
+
+@pytest.fixture(params=QUEUES, ids=["memory", "sqlite", "redis"])
+def queue(request, tmp_path):
+    return request.param(tmp_path, lease_seconds=LEASE, max_attempts=2)
+
+
+@pytest.fixture(params=LEASED_QUEUES, ids=["sqlite", "redis"])
+def leased_queue(request, tmp_path):
+    return request.param(tmp_path, lease_seconds=LEASE, max_attempts=2)
+
+
+def test_submit_claim_complete(queue):
+    job = queue.submit("chat", {"message": "hi", "tags": []}, user_id="alice")
+    assert queue.get(job["job_id"])["status"] == QUEUED
+
+    claimed = queue.claim("w1", timeout=1)
+
+    assert claimed["job_id"] == job["job_id"]
+    assert (claimed["status"], claimed["worker"], claimed["attempts"]) == (RUNNING, "w1", 1)
+    assert claimed["payload"] == {"message": "hi", "tags": []}
+    assert queue.complete(job["job_id"], {"response": "ok"}, "w1", 1)
+    finished = queue.get(job["job_id"])
+    assert (finished["status"], finished["result"], finished["user_id"]) == (SUCCEEDED, {"response": "ok"}, "alice")
+
+
+def test_claim_is_fifo_and_returns_none_when_empty(queue):
+    ids = [queue.submit("chat", {"n": n})["job_id"] for n in range(3)]
+
+    assert [queue.claim("w", timeout=1)["job_id"] for _ in ids] == ids
+    assert queue.claim("w", timeout=0.05) is None
+
+
+def test_fail_records_error(queue):
+    job = queue.submit("fleet", {})
+    claimed = queue.claim("w1", timeout=1)
+
+    assert queue.fail(job["job_id"], "quota exceeded", "w1", claimed["attempts"])
+    assert (queue.get(job["job_id"])["status"], queue.get(job["job_id"])["error"]) == (FAILED, "quota exceeded")
+
+
+def test_other_owner_cannot_complete_or_renew(queue):
+    job = queue.submit("chat", {})
+    queue.claim("w1", timeout=1)
+
+    assert not queue.heartbeat(job["job_id"], "w2", 1)
+    assert not queue.complete(job["job_id"], {"response": "stale"}, "w2", 1)
+    assert not queue.fail(job["job_id"], "stale", "w1", 2)
+    assert queue.get(job["job_id"])["status"] == RUNNING
+    assert queue.heartbeat(job["job_id"], "w1", 1)
+    assert queue.complete(job["job_id"], {"response": "ok"}, "w1", 1)
+    # 已完成的任务不能再次完成
+    assert not queue.complete(job["job_id"], {"response": "again"}, "w1", 1)
+
+
+def test_expired_lease_is_requeued_and_stale_owner_rejected(leased_queue):
+    job = leased_queue.submit("fleet", {"amount": 2})
+    leased_queue.claim("w1", timeout=1)
+    _expire_leases(leased_queue)
+
+    reclaimed = leased_queue.claim("w2", timeout=1)
+
+    assert (reclaimed["job_id"], reclaimed["worker"], reclaimed["attempts"]) == (job["job_id"], "w2", 2)
+    # 原持有者的续租和结果都被拒绝，不会覆盖新持有者
+    assert not leased_queue.heartbeat(job["job_id"], "w1", 1)
+    assert not leased_queue.complete(job["job_id"], {"by": "w1"}, "w1", 1)
+    assert leased_queue.complete(job["job_id"], {"by": "w2"}, "w2", 2)
+    assert leased_queue.get(job["job_id"])["result"] == {"by": "w2"}
+
+
+def test_job_fails_after_max_attempts(leased_queue):
+    job = leased_queue.submit("chat", {})
+    for _ in range(2):
+        assert leased_queue.claim("w", timeout=1) is not None
+        _expire_leases(leased_queue)
+
+    assert leased_queue.claim("w", timeout=0.05) is None
+    assert leased_queue.get(job["job_id"])["status"] == FAILED
+
+
+def test_heartbeat_keeps_lease_alive(leased_queue):
+    job = leased_queue.submit("chat", {})
+    leased_queue.claim("w1", timeout=1)
+
+    for _ in range(4):
+        time.sleep(LEASE / 3)
+        assert leased_queue.heartbeat(job["job_id"], "w1", 1)
+    if isinstance(leased_queue, RedisJobQueue):
+        leased_queue._recover_expired(force=True)
+
+    assert leased_queue.claim("w2", timeout=0.05) is None
+    assert leased_queue.complete(job["job_id"], {}, "w1", 1)
+
+
+def test_redis_recovery_between_move_and_lease_write_does_not_lose_job(tmp_path):
+    queue = _redis_queue(tmp_path, lease_seconds=LEASE)
+    job = queue.submit("chat", {})
+    claim_script = queue._claim_script
+
+    def claim_then_recover(*args, **kwargs):
+        claimed = claim_script(*args, **kwargs)
+        # 模拟其他工作进程在领取脚本之后、任务记录更新之前执行租约回收
+        queue._recover_expired(force=True)
+        return claimed
+
+    queue._claim_script = claim_then_recover
+    claimed = queue.claim("w1", timeout=1)
+
+    assert claimed["job_id"] == job["job_id"]
+    assert queue.client.lrange(queue.PROCESSING_KEY, 0, -1) == [job["job_id"]]
+    assert queue.client.zscore(queue.LEASES_KEY, job["job_id"]) is not None
+    assert queue.complete(job["job_id"], {}, "w1", 1)
+    assert queue.client.llen(queue.PROCESSING_KEY) == 0
+
+
+def _before_recover_script(queue, action):
+    """在回收脚本执行前插入action，模拟其他进程在回收读取任务记录之后的并发操作"""
+    recover_script = queue._recover_script
+
+    def wrapped(*args, **kwargs):
+        action()
+        return recover_script(*args, **kwargs)
+
+    queue._recover_script = wrapped
+
+
+def test_redis_release_racing_recovery_is_not_requeued(tmp_path):
+    queue = _redis_queue(tmp_path, lease_seconds=LEASE)
+    job = queue.submit("chat", {})
+    queue.claim("w1", timeout=1)
+    time.sleep(LEASE + 0.1)
+    # 租约已过期但尚未回收时原持有者完成了任务
+    _before_recover_script(queue, lambda: queue.complete(job["job_id"], {"by": "w1"}, "w1", 1))
+
+    queue._recover_expired(force=True)
+
+    finished = queue.get(job["job_id"])
+    assert (finished["status"], finished["result"]) == (SUCCEEDED, {"by": "w1"})
+    assert queue.client.llen(queue.QUEUE_KEY) == 0
+    assert queue.claim("w2", timeout=0.05) is None
+
+
+def test_redis_recovery_skips_job_record_changed_after_read(tmp_path):
+    queue = _redis_queue(tmp_path, lease_seconds=LEASE)
+    job = queue.submit("chat", {})
+    queue.claim("w1", timeout=1)
+    time.sleep(LEASE + 0.1)
+
+    def touch():
+        record = queue.get(job["job_id"])
+        record["started_at"] += 1
+        queue._save(record)
+
+    _before_recover_script(queue, touch)
+    queue._recover_expired(force=True)
+    assert queue.client.llen(queue.QUEUE_KEY) == 0
+
+    # 下一轮回收读取到最新记录后正常回收
+    queue._recover_script = queue.client.register_script(queue.RECOVER_SCRIPT)
+    queue._recover_expired(force=True)
+    assert queue.claim("w2", timeout=1)["attempts"] == 2
+
+
+def test_redis_heartbeat_and_release_fail_once_lease_is_gone(tmp_path):
+    queue = _redis_queue(tmp_path, lease_seconds=LEASE)
+    job = queue.submit("chat", {})
+    queue.claim("w1", timeout=1)
+    queue.client.zrem(queue.LEASES_KEY, job["job_id"])
+
+    assert not queue.heartbeat(job["job_id"], "w1", 1)
+    assert queue.client.zscore(queue.LEASES_KEY, job["job_id"]) is None
+    assert not queue.complete(job["job_id"], {}, "w1", 1)
+    assert queue.get(job["job_id"])["status"] == RUNNING
+
+
+def test_redis_concurrent_workers_run_each_job_once(tmp_path):
+    queue = _redis_queue(tmp_path, lease_seconds=5)
+    job_ids = {queue.submit("chat", {"n": n})["job_id"] for n in range(30)}
+    runs = []
+    lock = threading.Lock()
+
+    def work(name):
+        while True:
+            queue._recover_expired(force=True)
+            job = queue.claim(name, timeout=0.05)
+            if job is None:
+                return
+            with lock:
+                runs.append(job["job_id"])
+            assert queue.complete(job["job_id"], {}, name, job["attempts"])
+
+    threads = [threading.Thread(target=work, args=(f"w{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sorted(runs) == sorted(job_ids)
+    assert all(queue.get(job_id)["status"] == SUCCEEDED for job_id in job_ids)
+    assert queue.stats()[QUEUED] == queue.stats()[RUNNING] == 0
+
+
+def test_worker_heartbeat_prevents_double_execution(leased_queue):
+    runs = []
+
+    def slow(payload):
+        runs.append(payload)
+        time.sleep(LEASE * 3)
+        return {"ok": True}
+
+    worker = JobWorker(leased_queue, concurrency=2, handlers={"chat": slow}, poll_timeout=0.05)
+    job = leased_queue.submit("chat", {"n": 1})
+    worker.start()
+    deadline = time.monotonic() + 5
+    while leased_queue.get(job["job_id"])["status"] != SUCCEEDED and time.monotonic() < deadline:
+        if isinstance(leased_queue, RedisJobQueue):
+            leased_queue._recover_expired(force=True)
+        time.sleep(0.05)
+    worker.stop(timeout=2)
+
+    assert leased_queue.get(job["job_id"])["status"] == SUCCEEDED
+    assert runs == [{"n": 1}]
+    assert worker.stats()["succeeded"] == 1
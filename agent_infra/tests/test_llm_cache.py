@@ -0,0 +1,96 @@
+import json
+
+from agent_core import QwenClient
+from llm_cache import CompletionCache
+
+MESSAGES = [{"role": "user", "content": "创建实例"}]
+
+
+class FakeStreamResponse:
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=True):
+        yield from self.lines
+
+    def close(self):
+        self.closed = True
+
+
+class FakeHTTP:
+    """按SSE分片返回预设内容的HTTP客户端替身"""
+
+    def __init__(self, chunks, done: bool = True):
+        self.chunks = chunks
+        self.done = done
+        self.posts = 0
+
+    def post(self, url, json=None, stream=False):
+        self.posts += 1
+        lines = [f"data: {_json(chunk)}" for chunk in self.chunks]
+        return FakeStreamResponse(lines + (["data: [DONE]"] if self.done else []))
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _chunk(content: str = None, finish_reason: str = None) -> dict:
+    delta = {"content": content} if content else {}
+    return {"choices": [{"delta": delta, "finish_reason": finish_reason}]}
+
+
+def _client(chunks, done: bool = True) -> QwenClient:
+    client = QwenClient()
+    client.http = FakeHTTP(chunks, done)
+    client.cache = CompletionCache(maxsize=16, ttl=60)
+    return client
+
+
+def _stream(client: QwenClient, **kwargs):
+    parts = []
+    generator = client.chat_message_stream(MESSAGES, **kwargs)
+    while True:
+        try:
+            parts.append(next(generator))
+        except StopIteration as finished:
+            return "".join(parts), finished.value
+
+
+def test_completed_stream_is_cached_and_replayed():
+    client = _client([_chunk("Final Answer: "), _chunk("完成", finish_reason="stop")])
+
+    text, message = _stream(client)
+    replayed, cached = _stream(client)
+
+    assert text == replayed == "Final Answer: 完成"
+    assert cached == message and message["finish_reason"] == "stop"
+    assert client.http.posts == 1
+
+
+def test_early_aborted_stream_is_not_cached():
+    action = 'Action: check_ecs_status\nAction Input: {"instance_id": "i-1"}'
+    client = _client([_chunk(action), _chunk("\nObservation: 猜测的结果", finish_reason="stop")])
+    complete_at = lambda text: len(action) if text.startswith(action) else None
+
+    text, message = _stream(client, complete_at=complete_at)
+    assert (text, message["finish_reason"]) == (action, "abort")
+
+    # 没有提前结束的调用重新请求服务端，得到完整的生成结果
+    text, message = _stream(client)
+    assert message["finish_reason"] == "stop" and text.endswith("猜测的结果")
+    assert client.http.posts == 2
+
+
+def test_stream_without_finish_reason_is_not_cached():
+    client = _client([_chunk("Final Answer: 完")], done=False)
+
+    _, message = _stream(client)
+    _stream(client)
+
+    assert message["finish_reason"] is None
+    assert client.http.posts == 2
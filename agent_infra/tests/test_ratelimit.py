@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from ratelimit import AdaptiveRateLimiter, RateLimitTimeout, is_ecs_throttled
+
+
+class Throttled(Exception):
+    code = "Throttling.User"
+
+
+def test_gcra_spaces_acquisitions_at_the_configured_rate():
+    limiter = AdaptiveRateLimiter("test", qps=20)
+
+    start = time.monotonic()
+    waits = [limiter.acquire() for _ in range(5)]
+    elapsed = time.monotonic() - start
+
+    assert waits[0] == 0
+    # 每次发放间隔1/qps秒
+    assert all(wait == pytest.approx(0.05, abs=0.02) for wait in waits[1:])
+    assert elapsed == pytest.approx(0.2, abs=0.08)
+    assert limiter.stats()["queued"] == 4
+
+
+def test_burst_is_granted_without_waiting():
+    limiter = AdaptiveRateLimiter("test", qps=10, burst=3)
+
+    waits = [limiter.acquire() for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] > 0
+
+
+def test_acquire_raises_when_wait_exceeds_max_wait():
+    limiter = AdaptiveRateLimiter("test", qps=1)
+    limiter.acquire()
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(max_wait=0.1)
+    # 超时的调用不占用配额
+    assert limiter.stats()["acquired"] == 1
+
+
+def test_throttle_decreases_rate_once_per_cooldown():
+    limiter = AdaptiveRateLimiter("test", qps=100, min_qps=10, decrease_factor=0.5, recovery_interval=60)
+
+    limiter.on_throttle(retry_after=0)
+    limiter.on_throttle(retry_after=0)
+
+    # 同一批并发请求的多个限流响应只降速一次
+    assert limiter.rate == 50
+    assert limiter.stats()["throttled"] == 2
+
+
+def test_throttle_respects_min_qps():
+    limiter = AdaptiveRateLimiter("test", qps=10, min_qps=4, decrease_factor=0.5, recovery_interval=0)
+
+    for _ in range(5):
+        limiter.on_throttle(retry_after=0)
+
+    assert limiter.rate == 4
+
+
+def test_retry_after_pauses_following_acquisitions():
+    limiter = AdaptiveRateLimiter("test", qps=1000)
+
+    limiter.on_throttle(retry_after=0.1)
+
+    assert limiter.acquire() == pytest.approx(0.1, abs=0.03)
+
+
+def test_success_recovers_rate_additively_up_to_max():
+    limiter = AdaptiveRateLimiter("test", qps=10, decrease_factor=0.5, recovery_interval=0.02, increase_step=2)
+    limiter.on_throttle(retry_after=0)
+    assert limiter.rate == 5
+
+    # 冷却期内成功不恢复
+    limiter.on_success()
+    assert limiter.rate == 5
+
+    rates = []
+    for _ in range(4):
+        time.sleep(0.03)
+        limiter.on_success()
+        rates.append(limiter.rate)
+
+    assert rates == [7, 9, 10, 10]
+
+
+def test_call_requeues_throttled_calls_and_then_succeeds():
+    limiter = AdaptiveRateLimiter("test", qps=1000, recovery_interval=0, max_retries=3)
+    attempts = []
+
+    def describe():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Throttled("Throttling.User")
+        return "ok"
+
+    assert limiter.call(describe, is_throttled=is_ecs_throttled) == "ok"
+    assert len(attempts) == 3
+    assert limiter.stats()["throttled"] == 2
+
+
+def test_call_gives_up_after_max_retries_and_passes_other_errors_through():
+    limiter = AdaptiveRateLimiter("test", qps=1000, recovery_interval=0, max_retries=1)
+
+    def throttled():
+        raise Throttled("Throttling.User")
+
+    with pytest.raises(Throttled):
+        limiter.call(throttled, is_throttled=is_ecs_throttled)
+    with pytest.raises(ValueError):
+        limiter.call(lambda: int("x"), is_throttled=is_ecs_throttled)
+    assert limiter.stats()["throttled"] == 1
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import ProvisionScheduler
+
+
+def _item(item_id, resource_type="ecs", depends_on=(), **params):
+    return {"id": item_id, "type": resource_type, "params": params, "depends_on": list(depends_on)}
+
+
+def _scheduler(handlers=None, concurrency=None):
+    handlers = handlers or {
+        "vswitch": lambda params: {"status": "success", "resource_id": f"vsw-{params['name']}"},
+        "ecs": lambda params: {"status": "creating", "resource_id": f"i-{params['name']}",
+                               "details": {"vswitch_id": params.get("vswitch_id")}},
+    }
+    return ProvisionScheduler(handlers, concurrency or {name: 4 for name in handlers})
+
+
+@pytest.mark.parametrize("items, message", [
+    ([_item("a"), _item("a")], "任务id重复"),
+    ([_item("a", resource_type="rds")], "资源类型不受支持"),
+    ([_item("a", depends_on=["b"])], "依赖的任务不存在"),
+    ([_item("a", depends_on=["b"]), _item("b", depends_on=["a"]), _item("c")], "循环依赖"),
+])
+def test_validate_rejects_invalid_plans(items, message):
+    with pytest.raises(ValueError, match=message):
+        _scheduler().validate(items)
+
+
+def test_validate_accepts_a_dag():
+    _scheduler().validate([_item("vsw", "vswitch"), _item("a", depends_on=["vsw"]), _item("b", depends_on=["vsw", "a"])])
+
+
+def test_run_respects_dependencies_and_resolves_references():
+    items = [
+        _item("web", depends_on=["vsw"], name="web", vswitch_id="${vsw.resource_id}"),
+        _item("vsw", "vswitch", name="main"),
+    ]
+
+    events = list(_scheduler().run(items))
+
+    assert [(e["event"], e["data"].get("id")) for e in events] == [
+        ("started", "vsw"), ("completed", "vsw"), ("started", "web"), ("completed", "web"), ("summary", None)]
+    web = events[3]["data"]["result"]
+    assert web["details"]["vswitch_id"] == "vsw-main"
+    summary = events[-1]["data"]
+    assert (summary["total"], summary["succeeded"], summary["failed"], summary["skipped"]) == (2, 2, 0, 0)
+    # summary按提交顺序列出
+    assert [r["id"] for r in summary["results"]] == ["web", "vsw"]
+
+
+def test_failure_skips_transitive_dependents_only():
+    def vswitch(params):
+        if params["name"] == "bad":
+            raise RuntimeError("quota exceeded")
+        return {"status": "success", "resource_id": f"vsw-{params['name']}"}
+
+    scheduler = _scheduler({"vswitch": vswitch, "ecs": lambda params: {"status": "success", "resource_id": "i-1"}})
+    items = [
+        _item("bad", "vswitch", name="bad"),
+        _item("a", depends_on=["bad"]),
+        _item("b", depends_on=["a"]),
+        _item("ok", "vswitch", name="ok"),
+        _item("c", depends_on=["ok"]),
+    ]
+
+    summary = scheduler.run_to_completion(items)
+
+    outcomes = {r["id"]: r["outcome"] for r in summary["results"]}
+    assert outcomes == {"bad": "failed", "a": "skipped", "b": "skipped", "ok": "succeeded", "c": "succeeded"}
+    assert summary["results"][0]["result"] == {"status": "failed", "message": "quota exceeded"}
+    assert (summary["succeeded"], summary["failed"], summary["skipped"]) == (2, 1, 2)
+
+
+def test_failed_status_counts_as_failure():
+    scheduler = _scheduler({"ecs": lambda params: {"status": "failed", "message": "no stock"}})
+
+    summary = scheduler.run_to_completion([_item("a"), _item("b", depends_on=["a"])])
+
+    assert [r["outcome"] for r in summary["results"]] == ["failed", "skipped"]
+
+
+def test_per_type_concurrency_is_bounded():
+    active = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def ecs(params):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return {"status": "success", "resource_id": params["name"]}
+
+    scheduler = _scheduler({"ecs": ecs}, concurrency={"ecs": 2})
+
+    summary = scheduler.run_to_completion([_item(f"i{n}", name=f"i{n}") for n in range(6)])
+
+    assert summary["succeeded"] == 6
+    assert active["max"] == 2
+
+
+def test_run_validates_before_starting():
+    calls = []
+    scheduler = _scheduler({"ecs": lambda params: calls.append(params) or {"status": "success"}})
+
+    with pytest.raises(ValueError):
+        list(scheduler.run([_item("a", depends_on=["missing"])]))
+    assert calls == []
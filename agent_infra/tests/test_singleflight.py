@@ -0,0 +1,111 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def _wait_until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待条件超时"
+        time.sleep(0.005)
+
+
+def _run_concurrently(flight: SingleFlight, key: str, func, followers: int):
+    """leader进入func后再发起followers个相同调用，返回各调用的 (结果或异常, 来源)"""
+    release = threading.Event()
+    outcomes = []
+    lock = threading.Lock()
+
+    def blocking():
+        release.wait(2)
+        return func()
+
+    def call():
+        try:
+            outcome = flight.do(key, blocking)
+        except Exception as e:
+            outcome = (e, "error")
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    _wait_until(lambda: flight.stats()["inflight"] == 1)
+    for _ in range(followers):
+        thread = threading.Thread(target=call)
+        thread.start()
+        threads.append(thread)
+    _wait_until(lambda: flight.stats()["shared"] == followers)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(window=60)
+    executions = []
+
+    outcomes = _run_concurrently(flight, "k", lambda: executions.append(1) or {"status": "success"}, followers=5)
+
+    assert len(executions) == 1
+    assert sorted(source for _, source in outcomes) == ["executed"] + ["shared"] * 5
+    assert all(result == {"status": "success"} for result, _ in outcomes)
+
+
+def test_success_is_replayed_within_window():
+    flight = SingleFlight(window=60)
+    calls = []
+
+    first = flight.do("k", lambda: calls.append(1) or "result")
+    second = flight.do("k", lambda: calls.append(1) or "other")
+
+    assert first == ("result", "executed")
+    assert second == ("result", "replayed")
+    assert len(calls) == 1
+
+
+def test_different_keys_execute_separately():
+    flight = SingleFlight(window=60)
+
+    assert flight.do("a", lambda: 1) == (1, "executed")
+    assert flight.do("b", lambda: 2) == (2, "executed")
+
+
+def test_error_fans_out_to_waiters_and_is_not_cached():
+    flight = SingleFlight(window=60)
+
+    def boom():
+        raise RuntimeError("create failed")
+
+    outcomes = _run_concurrently(flight, "k", boom, followers=3)
+
+    assert len(outcomes) == 4
+    assert all(isinstance(error, RuntimeError) and str(error) == "create failed" for error, _ in outcomes)
+    assert flight.stats()["inflight"] == 0
+    # 失败不缓存，可以立即重试
+    assert flight.do("k", lambda: "ok") == ("ok", "executed")
+
+
+def test_uncacheable_results_are_not_replayed():
+    flight = SingleFlight(window=60, cacheable=lambda result: result.get("status") == "success")
+
+    assert flight.do("k", lambda: {"status": "failed"})[1] == "executed"
+    assert flight.do("k", lambda: {"status": "success"})[1] == "executed"
+    assert flight.do("k", lambda: {"status": "other"}) == ({"status": "success"}, "replayed")
+
+
+def test_make_key_normalizes_params():
+    key = SingleFlight.make_key("ecs", {"instance_name": " web ", "vswitch_id": None})
+
+    assert key == SingleFlight.make_key("ecs", {"instance_name": "web"})
+    assert key != SingleFlight.make_key("oss", {"instance_name": "web"})
+
+
+def test_replay_expires_after_window():
+    flight = SingleFlight(window=0.05)
+    flight.do("k", lambda: "old")
+    time.sleep(0.1)
+
+    assert flight.do("k", lambda: "new") == ("new", "executed")
@@ -0,0 +1,38 @@
+import time
+
+from fake_aliyun import FakeEcsClient, FakeOssBackend
+from inventory import current_request
+from singleflight import SingleFlight
+from tools import AliyunToolKit
+
+
+def _tool_kit() -> AliyunToolKit:
+    oss = FakeOssBackend(latency=0)
+    return AliyunToolKit(ecs_client=FakeEcsClient(latency=0), bucket_factory=oss.bucket, oss_service=oss.service())
+
+
+def _token_in_request(tool_kit: AliyunToolKit, key: str, request: str) -> str:
+    token = current_request.set(request)
+    try:
+        return tool_kit._client_token(key)
+    finally:
+        current_request.reset(token)
+
+
+def test_client_token_is_stable_for_retries_of_one_request(monkeypatch):
+    tool_kit = _tool_kit()
+    key = SingleFlight.make_key("ecs", {"instance_name": "web"})
+    first = _token_in_request(tool_kit, key, "req-1")
+
+    # 重试跨越去重窗口的边界也使用同一令牌
+    monkeypatch.setattr(time, "time", lambda: 10 ** 10 + tool_kit.idempotency_window * 3)
+    assert _token_in_request(tool_kit, key, "req-1") == first
+    assert _token_in_request(tool_kit, key, "req-2") != first
+    assert _token_in_request(tool_kit, SingleFlight.make_key("ecs", {"instance_name": "db"}), "req-1") != first
+
+
+def test_client_token_without_request_is_unique():
+    tool_kit = _tool_kit()
+    key = SingleFlight.make_key("ecs", {"instance_name": "web"})
+
+    assert tool_kit._client_token(key) != tool_kit._client_token(key)
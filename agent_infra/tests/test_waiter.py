@@ -0,0 +1,90 @@
+import threading
+import time
+
+from models import ResourceStatus
+from waiter import ReadinessWaiter
+
+
+def _check_ready_after(checks: int, times: list):
+    """第checks次检查时就绪，并记录每次检查的时间"""
+    def check():
+        times.append(time.monotonic())
+        return {"status": "success"} if len(times) >= checks else None
+    return check
+
+
+def test_ready_on_first_check_finishes_in_caller_thread():
+    waiter = ReadinessWaiter()
+    caller = threading.current_thread()
+    threads = []
+
+    def check():
+        threads.append(threading.current_thread())
+        return {"status": "success"}
+
+    operation = waiter.submit("ecs", "i-1", check)
+
+    assert operation.done() and operation.status == ResourceStatus.SUCCESS
+    assert operation.attempts == 1 and threads == [caller]
+    assert waiter.get(operation.id) is operation
+
+
+def test_polls_back_off_exponentially_up_to_max_interval():
+    waiter = ReadinessWaiter(initial_interval=0.02, max_interval=0.08, multiplier=2.0)
+    times = []
+
+    operation = waiter.submit("ecs", "i-1", _check_ready_after(6, times), timeout=5)
+
+    assert operation.wait(5) == {"status": "success"}
+    assert operation.attempts == 6
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    expected = [0.02, 0.04, 0.08, 0.08, 0.08]
+    assert all(gap >= minimum * 0.9 for gap, minimum in zip(gaps, expected))
+    # 间隔不超过max_interval（留出调度抖动）
+    assert max(gaps) < 0.08 + 0.1
+
+
+def test_timeout_finishes_with_on_timeout_result():
+    waiter = ReadinessWaiter(initial_interval=0.15, max_interval=5.0, multiplier=10.0)
+    timed_out = []
+
+    def on_timeout(operation):
+        timed_out.append(operation.attempts)
+        return {"status": "failed", "attempts": operation.attempts}
+
+    started = time.monotonic()
+    operation = waiter.submit("oss", "bucket", lambda: None, timeout=0.2, on_timeout=on_timeout)
+    result = operation.wait(5)
+
+    # 退避间隔被截断到截止时间，超时及时发现
+    assert time.monotonic() - started < 1.0
+    assert operation.status == ResourceStatus.FAILED
+    assert operation.error == "等待资源就绪超时"
+    assert result == {"status": "failed", "attempts": operation.attempts} and timed_out == [operation.attempts]
+    assert waiter.stats()["failed"] == 1
+
+
+def test_failing_checks_are_retried():
+    waiter = ReadinessWaiter(initial_interval=0.01)
+    calls = []
+
+    def check():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("throttled")
+        return {"status": "success"}
+
+    operation = waiter.submit("ecs", "i-1", check, timeout=5)
+
+    assert operation.wait(5) == {"status": "success"}
+    assert operation.attempts == 3
+
+
+def test_finished_operations_are_evicted_first():
+    waiter = ReadinessWaiter(initial_interval=10, max_operations=2)
+    first = waiter.submit("ecs", "i-1", lambda: {"status": "success"})
+    pending = waiter.submit("ecs", "i-2", lambda: None, timeout=60)
+    latest = waiter.submit("ecs", "i-3", lambda: {"status": "success"})
+
+    assert waiter.get(first.id) is None
+    assert waiter.get(pending.id) is pending and waiter.get(latest.id) is latest
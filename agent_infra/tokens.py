@@ -0,0 +1,28 @@
+import json
+import re
+from typing import Any, Dict, List
+
+# CJK字符（含全角标点）通常每个字约占1个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+# 每条消息的角色和分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本token数：CJK字符按1个token计，其余按约4个字符1个token计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """估算消息列表的总token数，原生工具调用的参数也计入"""
+    total = 0
+    for m in messages:
+        total += estimate_tokens(str(m.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
+        if m.get("tool_calls"):
+            total += estimate_tokens(json.dumps(m["tool_calls"], ensure_ascii=False))
+    return total
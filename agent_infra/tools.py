@@ -1,68 +1,259 @@
+import hashlib
 import json
+import time
 import uuid
+import threading
 import logging
-from typing import Dict, Any
-from alibabacloud_ecs20140526.client import Client as EcsClient
-from alibabacloud_ecs20140526 import models as ecs_models
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_tea_util import models as util_models
-import oss2
-from oss2.exceptions import NoSuchBucket, OssError
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
+from bucket_index import BucketIndex
 from config import load_config
+from cache import MISSING, ResourceStateCache
+from client_pool import RegionClientPool
+from coalescer import BatchCoalescer
+from inventory import ResourceInventory, current_request, current_user
+from metrics import CREATE_DEDUP, track_tool
+from ratelimit import get_limiter, is_ecs_throttled, is_oss_throttled
+from singleflight import SingleFlight
+from waiter import ReadinessWaiter, Operation
 
 logger = logging.getLogger(__name__)
 
+# RunInstances单次最多创建100台实例，DescribeInstances单次最多查询100个实例ID
+FLEET_MAX_AMOUNT = 100
+
 
 class AliyunToolKit:
-    def __init__(self):
+    def __init__(self, ecs_client=None, bucket_factory: Optional[Callable[[str, str], Any]] = None,
+                 oss_service=None):
+        """ecs_client、bucket_factory(bucket_name, region)和oss_service用于注入替代实现（如离线基准测试），默认使用阿里云SDK"""
         config = load_config()
         self.region_id = config["region_id"]
         self.access_key_id = config["access_key_id"]
         self.access_key_secret = config["access_key_secret"]
 
-        # 初始化ECS客户端
+        # ECS客户端和OSS连接池按地域在首次使用时创建，避免导入阶段加载SDK；
+        # 地域数量有上限（LRU），长时间未使用的地域会被淘汰
+        # 录制/回放模式下所有SDK调用经过cassette，回放时不创建真实客户端；cassette依赖requests，按需导入
+        self.cassette = None
+        if config["cassette_mode"] != "off":
+            from cassette import get_cassette
+            self.cassette = get_cassette()
+        self._bucket_factory = bucket_factory
+        self._oss_service = self._recorded("oss", lambda: oss_service) if oss_service is not None else None
+        self._oss_auth = None
+        self._client_lock = threading.Lock()
+        pool_options = {"maxsize": config["region_pool_max_size"], "idle_ttl": config["region_pool_idle_ttl"]}
+        new_ecs_client = (lambda region: ecs_client) if ecs_client is not None else self._new_ecs_client
+        self.ecs_clients = RegionClientPool(
+            lambda region: self._recorded(f"ecs:{region}", lambda: new_ecs_client(region)),
+            name="ecs", **pool_options
+        )
+        self.oss_sessions = RegionClientPool(
+            self._new_oss_session, close=lambda session: session.session.close(), name="oss", **pool_options
+        )
+        # ECS和OSS OpenAPI限流器：超出配额时排队，被限流时自动降速重试
+        limiter_options = {"max_wait": config["rate_limit_max_wait"], "max_retries": config["rate_limit_max_retries"]}
+        self.ecs_limiter = get_limiter("ecs", config["rate_limits"]["ecs"], **limiter_options)
+        self.oss_limiter = get_limiter("oss", config["rate_limits"]["oss"], **limiter_options)
+        # 资源状态缓存：减少重复的状态和存在性查询
+        self.state_cache = ResourceStateCache(
+            ttls={
+                "ecs_status": config["ecs_status_cache_ttl"],
+                "oss_bucket": config["bucket_exists_cache_ttl"],
+            },
+            negative_ttl=config["negative_cache_ttl"],
+            maxsize=config["state_cache_max_entries"],
+        )
+        # 合并并发的实例状态查询，DescribeInstances单次最多支持100个实例ID
+        self.ecs_status_batcher = BatchCoalescer(
+            self._describe_instances,
+            window=config["ecs_status_batch_window"],
+            max_batch_size=min(config["ecs_status_batch_size"], 100),
+            name="ecs_status"
+        )
+
+        # 本账号Bucket索引：已有Bucket的存在性和名称冲突检查在内存中完成
+        self.bucket_index = BucketIndex(
+            self._list_buckets_page,
+            refresh_interval=config["bucket_index_refresh_interval"],
+        ) if config["bucket_index_enabled"] else None
+
+        # 本地资源清单：记录创建结果，列表查询不再调用云API；后台按间隔增量同步
+        self.inventory = ResourceInventory(config["inventory_path"]) if config["inventory_enabled"] else None
+        self.inventory_sync_interval = config["inventory_sync_interval"]
+        self._inventory_sync_lock = threading.Lock()
+        self._inventory_synced_at: Optional[float] = None
+        self._inventory_last_sync: Dict[str, Any] = {}
+
+        # 默认地域的OSS Endpoint（外网），其他地域见 _oss_endpoint
+        self.oss_endpoint = self._oss_endpoint(self.region_id)
+
+        # 共享的资源就绪等待器（单个后台线程调度，检查在小线程池中并发执行）
+        self.waiter = ReadinessWaiter(
+            initial_interval=config["waiter_initial_interval"],
+            max_interval=config["waiter_max_interval"],
+            max_workers=config["waiter_max_workers"],
+        )
+        self.oss_ready_timeout = config["oss_ready_timeout"]
+        self.ecs_ready_timeout = config["ecs_ready_timeout"]
+        self.fleet_wait_timeout = config["fleet_wait_timeout"]
+
+        # 创建类调用去重：相同参数的并发请求共享一次远程调用，成功结果在窗口期内复用
+        self.idempotency_window = config["idempotency_window"]
+        self.create_dedup = SingleFlight(
+            window=self.idempotency_window,
+            maxsize=config["idempotency_max_entries"],
+            cacheable=lambda result: result.get("status") in ("success", "creating"),
+            name="create"
+        )
+
+    def _new_ecs_client(self, region: str):
+        from alibabacloud_ecs20140526.client import Client as EcsClient
+        from alibabacloud_tea_openapi import models as open_api_models
         ecs_config = open_api_models.Config(
             access_key_id=self.access_key_id,
             access_key_secret=self.access_key_secret,
-            endpoint=f'ecs.{self.region_id}.aliyuncs.com'
+            endpoint=f'ecs.{region}.aliyuncs.com'
         )
-        self.ecs_client = EcsClient(ecs_config)
+        return EcsClient(ecs_config)
 
-        # 初始化OSS认证 - 使用更稳定的方式
-        self.oss_auth = oss2.Auth(self.access_key_id, self.access_key_secret)
-        # 使用外部Endpoint，避免内网问题
-        self.oss_endpoint = f"https://oss-{self.region_id}.aliyuncs.com"
+    def _recorded(self, scope: str, factory: Callable[[], Any]):
+        """未启用cassette时直接返回factory()创建的客户端，否则返回经cassette录制或回放的代理"""
+        if self.cassette is None:
+            return factory()
+        from cassette import CassetteClient
+        return CassetteClient(self.cassette, scope, None if self.cassette.replaying else factory())
+
+    def _new_oss_session(self, region: str):
+        import oss2
+        return oss2.Session()
 
+    @property
+    def ecs_client(self):
+        """默认地域的ECS客户端"""
+        return self.ecs_clients.get(self.region_id)
+
+    def _ecs(self, region: Optional[str]):
+        return self.ecs_clients.get(region or self.region_id)
+
+    def _oss_endpoint(self, region: str) -> str:
+        # 使用外部Endpoint，避免内网问题
+        return f"https://oss-{region}.aliyuncs.com"
+
+    @property
+    def oss_auth(self):
+        """OSS认证，首次访问时导入SDK并创建"""
+        if self._oss_auth is None:
+            with self._client_lock:
+                if self._oss_auth is None:
+                    import oss2
+                    self._oss_auth = oss2.Auth(self.access_key_id, self.access_key_secret)
+        return self._oss_auth
+
+    def _oss_bucket(self, bucket_name: str, region: Optional[str] = None):
+        """返回Bucket操作对象，同一地域的Bucket共享一个HTTP连接池"""
+        region = region or self.region_id
+        return self._recorded(f"oss:{bucket_name}", lambda: self._new_oss_bucket(bucket_name, region))
+
+    def _new_oss_bucket(self, bucket_name: str, region: str):
+        if self._bucket_factory is not None:
+            return self._bucket_factory(bucket_name, region)
+        import oss2
+        return oss2.Bucket(self.oss_auth, self._oss_endpoint(region), bucket_name,
+                           session=self.oss_sessions.get(region))
+
+    @property
+    def oss_service(self):
+        """用于ListBuckets的Service对象，复用默认地域的连接池"""
+        if self._oss_service is None:
+            import oss2
+            self._oss_service = self._recorded("oss", lambda: oss2.Service(
+                self.oss_auth, self.oss_endpoint, session=self.oss_sessions.get(self.region_id)))
+        return self._oss_service
+
+    def _list_buckets_page(self, marker: str):
+        """ListBuckets单页，返回 ([(bucket_name, region)], 下一页marker)"""
+        result = self.oss_limiter.call(
+            self.oss_service.list_buckets, marker=marker, max_keys=1000, is_throttled=is_oss_throttled)
+        buckets = [(bucket.name, _location_region(bucket.location)) for bucket in result.buckets]
+        return buckets, result.next_marker if result.is_truncated else ""
+
+    def _client_token(self, key: str) -> str:
+        """由去重键和当前请求标识派生ECS ClientToken，同一请求（或同一后台任务）的重试无论相隔多久都使用同一令牌
+
+        令牌与时间无关，去重窗口只决定本地去重记录何时过期；没有请求标识时每次生成新令牌。
+        """
+        request = current_request.get()
+        if not request:
+            return uuid.uuid4().hex
+        return hashlib.sha256(f"{key}:{request}".encode("utf-8")).hexdigest()[:48]
+
+    def _dedup_result(self, kind: str, result: Dict[str, Any], source: str) -> Dict[str, Any]:
+        """创建结果已在执行时（提交就绪等待之前）写入清单，这里只统计去重来源并标记复用的结果"""
+        CREATE_DEDUP.inc(kind=kind, source=source)
+        if source == "executed":
+            return result
+        logger.info(f"复用相同的{kind}创建请求结果 ({source}): {result.get('resource_id')}")
+        return {**result, "deduplicated": True}
+
+    @track_tool("create_ecs_instance")
     def create_ecs_instance(self, ecs_config: Dict[str, Any]) -> Dict[str, Any]:
-        """创建ECS实例"""
+        """创建ECS实例；相同参数的并发请求和窗口期内的重复请求只会创建一台"""
+        params = {
+            "region": ecs_config.get("region") or self.region_id,
+            "instance_type": ecs_config.get("instance_type", "ecs.g6.large"),
+            "image_id": ecs_config.get("image_id", "centos_7_9_x64_20G_alibase_20231219.vhd"),
+            "instance_name": ecs_config.get("instance_name", "agent-created-ecs"),
+            "system_disk_size": ecs_config.get("system_disk_size", 40),
+            "security_group_id": ecs_config.get("security_group_id"),
+            "vswitch_id": ecs_config.get("vswitch_id"),
+            "password": ecs_config.get("password"),
+        }
+        # 调用方显式传入的幂等令牌参与去重，不同令牌表示确实需要多台实例
+        key = SingleFlight.make_key("ecs", {
+            **params, "client_token": ecs_config.get("client_token")
+        })
+        client_token = ecs_config.get("client_token") or self._client_token(key)
+        result, source = self.create_dedup.do(key, lambda: self._create_ecs_instance(params, client_token))
+        return self._dedup_result("ecs", result, source)
+
+    def _create_ecs_instance(self, params: Dict[str, Any], client_token: str) -> Dict[str, Any]:
+        from alibabacloud_ecs20140526 import models as ecs_models
+        from alibabacloud_tea_util import models as util_models
+
         request_id = str(uuid.uuid4())
         try:
-            logger.info(f"开始创建ECS实例: {ecs_config.get('instance_name', 'unknown')}")
+            logger.info(f"开始创建ECS实例: {params['instance_name']}")
 
-            # 构建创建实例请求
+            # 构建创建实例请求；ClientToken保证重试不会重复创建
             create_request = ecs_models.CreateInstanceRequest(
-                region_id=self.region_id,
-                instance_type=ecs_config.get("instance_type", "ecs.g6.large"),
-                image_id=ecs_config.get("image_id", "centos_7_9_x64_20G_alibase_20231219.vhd"),
-                instance_name=ecs_config.get("instance_name", "agent-created-ecs"),
-                system_disk_size=ecs_config.get("system_disk_size", 40),
+                region_id=params["region"],
+                instance_type=params["instance_type"],
+                image_id=params["image_id"],
+                instance_name=params["instance_name"],
+                system_disk=ecs_models.CreateInstanceRequestSystemDisk(
+                    size=params["system_disk_size"]
+                ),
+                client_token=client_token,
             )
 
             # 可选参数
-            if ecs_config.get("security_group_id"):
-                create_request.security_group_id = ecs_config["security_group_id"]
-            if ecs_config.get("vswitch_id"):
-                create_request.vswitch_id = ecs_config["vswitch_id"]
-            if ecs_config.get("password"):
-                create_request.password = ecs_config["password"]
+            if params["security_group_id"]:
+                create_request.security_group_id = params["security_group_id"]
+            if params["vswitch_id"]:
+                create_request.v_switch_id = params["vswitch_id"]
+            if params["password"]:
+                create_request.password = params["password"]
 
             runtime = util_models.RuntimeOptions()
-            response = self.ecs_client.create_instance_with_options(create_request, runtime)
+            response = self.ecs_limiter.call(
+                self._ecs(params["region"]).create_instance_with_options, create_request, runtime,
+                is_throttled=is_ecs_throttled)
 
             logger.info(f"ECS实例创建成功: {response.body.instance_id}")
-
-            return {
+            self.state_cache.invalidate("ecs_status", response.body.instance_id)
+            result = {
                 "request_id": request_id,
                 "resource_type": "ecs",
                 "resource_id": response.body.instance_id,
@@ -70,11 +261,18 @@ class AliyunToolKit:
                 "message": "ECS实例创建成功",
                 "details": {
                     "instance_id": response.body.instance_id,
-                    "instance_name": ecs_config.get("instance_name", "agent-created-ecs"),
-                    "instance_type": ecs_config.get("instance_type", "ecs.g6.large"),
-                    "region": self.region_id
+                    "instance_name": params["instance_name"],
+                    "instance_type": params["instance_type"],
+                    "region": params["region"],
+                    "client_token": client_token
                 }
             }
+            # 先写入清单再提交等待：等待器的首次检查在当前线程中执行，只会更新清单中已有的记录
+            self._record(result)
+
+            # 后台跟踪实例创建完成，调用方可通过operation_id查询进度
+            operation = self.wait_ecs_ready(response.body.instance_id, region=params["region"])
+            return {**result, "operation_id": operation.id}
 
         except Exception as e:
             logger.error(f"创建ECS实例失败: {str(e)}")
@@ -85,8 +283,232 @@ class AliyunToolKit:
                 "message": f"ECS实例创建失败: {str(e)}"
             }
 
+    @track_tool("create_ecs_fleet")
+    def create_ecs_fleet(self, fleet_config: Dict[str, Any]) -> Dict[str, Any]:
+        """通过RunInstances一次创建最多100台相同配置的实例，并返回整个实例组的汇总结果
+
+        实例组就绪（全部Running）由一个等待操作批量轮询DescribeInstances跟踪；
+        wait为True（默认）时最多等待fleet_wait_timeout秒，超时则返回creating和operation_id。
+        """
+        try:
+            amount = int(fleet_config.get("amount", 1))
+            min_amount = int(amount if fleet_config.get("min_amount") is None else fleet_config["min_amount"])
+        except (TypeError, ValueError):
+            return {"resource_type": "ecs_fleet", "status": "failed", "message": "amount和min_amount必须为整数"}
+        if not 1 <= amount <= FLEET_MAX_AMOUNT or not 1 <= min_amount <= amount:
+            return {
+                "resource_type": "ecs_fleet",
+                "status": "failed",
+                "message": f"amount须在1-{FLEET_MAX_AMOUNT}之间，min_amount须在1-amount之间"
+            }
+        params = {
+            "region": fleet_config.get("region") or self.region_id,
+            "instance_type": fleet_config.get("instance_type", "ecs.g6.large"),
+            "image_id": fleet_config.get("image_id", "centos_7_9_x64_20G_alibase_20231219.vhd"),
+            "instance_name": fleet_config.get("instance_name", "agent-created-ecs"),
+            "system_disk_size": fleet_config.get("system_disk_size", 40),
+            "security_group_id": fleet_config.get("security_group_id"),
+            "vswitch_id": fleet_config.get("vswitch_id"),
+            "password": fleet_config.get("password"),
+            "amount": amount,
+            "min_amount": min_amount,
+        }
+        key = SingleFlight.make_key("ecs_fleet", {**params, "client_token": fleet_config.get("client_token")})
+        client_token = fleet_config.get("client_token") or self._client_token(key)
+        result, source = self.create_dedup.do(key, lambda: self._create_ecs_fleet(params, client_token))
+        result = self._dedup_result("ecs_fleet", result, source)
+
+        operation = self.waiter.get(result.get("operation_id") or "")
+        if operation is not None and fleet_config.get("wait", True):
+            operation.wait(self.fleet_wait_timeout)
+            if operation.done() and operation.result:
+                result = {**operation.result, "deduplicated": True} if result.get("deduplicated") else operation.result
+        return result
+
+    def _create_ecs_fleet(self, params: Dict[str, Any], client_token: str) -> Dict[str, Any]:
+        from alibabacloud_ecs20140526 import models as ecs_models
+        from alibabacloud_tea_util import models as util_models
+
+        request_id = str(uuid.uuid4())
+        region = params["region"]
+        try:
+            logger.info(f"开始创建ECS实例组: {params['instance_name']} x {params['amount']}")
+            run_request = ecs_models.RunInstancesRequest(
+                region_id=region,
+                instance_type=params["instance_type"],
+                image_id=params["image_id"],
+                instance_name=params["instance_name"],
+                system_disk=ecs_models.RunInstancesRequestSystemDisk(
+                    size=str(params["system_disk_size"])
+                ),
+                amount=params["amount"],
+                min_amount=params["min_amount"],
+                # 多台实例的名称自动追加有序后缀
+                unique_suffix=params["amount"] > 1,
+                client_token=client_token,
+            )
+            if params["security_group_id"]:
+                run_request.security_group_id = params["security_group_id"]
+            if params["vswitch_id"]:
+                run_request.v_switch_id = params["vswitch_id"]
+            if params["password"]:
+                run_request.password = params["password"]
+
+            runtime = util_models.RuntimeOptions()
+            response = self.ecs_limiter.call(
+                self._ecs(region).run_instances_with_options, run_request, runtime, is_throttled=is_ecs_throttled)
+        except Exception as e:
+            logger.error(f"创建ECS实例组失败: {str(e)}")
+            return {
+                "request_id": request_id,
+                "resource_type": "ecs_fleet",
+                "status": "failed",
+                "message": f"ECS实例组创建失败: {str(e)}"
+            }
+
+        id_sets = response.body.instance_id_sets
+        instance_ids = list(id_sets.instance_id_set or []) if id_sets else []
+        logger.info(f"ECS实例组创建请求成功: {len(instance_ids)}/{params['amount']} 台")
+        details = {
+            "instance_name": params["instance_name"],
+            "instance_type": params["instance_type"],
+            "region": region,
+            "amount": params["amount"],
+            "min_amount": params["min_amount"],
+            "created": len(instance_ids),
+            "instance_ids": instance_ids,
+            "order_id": response.body.order_id,
+            "client_token": client_token,
+        }
+        fleet = {"request_id": request_id, "details": details, "statuses": {}}
+        # 先写入清单再提交等待，等待过程中的状态查询更新各实例的记录
+        self._record(self._fleet_result(fleet, ready=False, final=False))
+        operation = self.waiter.submit(
+            "ecs_fleet",
+            request_id,
+            lambda: self._fleet_ready_result(fleet),
+            timeout=self.ecs_ready_timeout,
+            on_timeout=lambda op: self._fleet_result(fleet, op.attempts, ready=False),
+        )
+        if operation.done():
+            return operation.result
+        return {**self._fleet_result(fleet, operation.attempts, ready=False, final=False),
+                "operation_id": operation.id}
+
+    def _fleet_ready_result(self, fleet: Dict[str, Any]):
+        """批量查询实例组状态，全部Running时返回汇总结果，否则返回None"""
+        region = fleet["details"]["region"]
+        instance_ids = fleet["details"]["instance_ids"]
+        statuses = {}
+        for start in range(0, len(instance_ids), FLEET_MAX_AMOUNT):
+            keys = [(region, instance_id) for instance_id in instance_ids[start:start + FLEET_MAX_AMOUNT]]
+            for (_, instance_id), status in self._describe_instances(keys).items():
+                self.state_cache.set("ecs_status", instance_id, status)
+                statuses[instance_id] = status
+        fleet["statuses"] = statuses
+        if instance_ids and all(statuses.get(i, {}).get("status") == "Running" for i in instance_ids):
+            return self._fleet_result(fleet, ready=True)
+        return None
+
+    def _fleet_result(self, fleet: Dict[str, Any], attempts: int = None, ready: bool = False,
+                      final: bool = True) -> Dict[str, Any]:
+        """汇总实例组状态：全部Running为success；等待超时时达到min_amount为partial，否则failed"""
+        details = fleet["details"]
+        statuses = fleet["statuses"]
+        counts: Dict[str, int] = {}
+        for instance_id in details["instance_ids"]:
+            state = statuses.get(instance_id, {}).get("status", "Pending")
+            counts[state] = counts.get(state, 0) + 1
+        running = counts.get("Running", 0)
+        if ready:
+            status, message = "success", f"ECS实例组创建成功，{running} 台实例已运行"
+        elif not final:
+            status, message = "creating", f"ECS实例组已提交 {details['created']} 台，{running} 台已运行，正在等待其余实例启动"
+        elif running >= details["min_amount"]:
+            status, message = "partial", f"等待超时，{running}/{details['created']} 台实例已运行"
+        else:
+            status, message = "failed", f"等待超时，仅 {running}/{details['created']} 台实例已运行"
+        result = {
+            "request_id": fleet["request_id"],
+            "resource_type": "ecs_fleet",
+            "resource_id": ",".join(details["instance_ids"]),
+            "status": status,
+            "message": message,
+            "details": {
+                **details,
+                "running": running,
+                "status_counts": counts,
+                "public_ips": {
+                    instance_id: state["public_ip"]
+                    for instance_id, state in statuses.items() if state.get("public_ip")
+                },
+            }
+        }
+        if attempts is not None:
+            result["details"]["verification_attempts"] = attempts
+        return result
+
+    @track_tool("create_vswitch")
+    def create_vswitch(self, vswitch_config: Dict[str, Any]) -> Dict[str, Any]:
+        """创建交换机（VSwitch）"""
+        return self._record(self._create_vswitch(vswitch_config))
+
+    def _create_vswitch(self, vswitch_config: Dict[str, Any]) -> Dict[str, Any]:
+        request_id = str(uuid.uuid4())
+        missing = [k for k in ("vpc_id", "zone_id", "cidr_block") if not vswitch_config.get(k)]
+        if missing:
+            return {
+                "request_id": request_id,
+                "resource_type": "vswitch",
+                "status": "failed",
+                "message": f"缺少必要参数: {', '.join(missing)}"
+            }
+
+        from alibabacloud_ecs20140526 import models as ecs_models
+        from alibabacloud_tea_util import models as util_models
+
+        region = vswitch_config.get("region") or self.region_id
+        try:
+            logger.info(f"开始创建交换机: {vswitch_config.get('vswitch_name', 'unknown')}")
+            create_request = ecs_models.CreateVSwitchRequest(
+                region_id=region,
+                vpc_id=vswitch_config["vpc_id"],
+                zone_id=vswitch_config["zone_id"],
+                cidr_block=vswitch_config["cidr_block"],
+                v_switch_name=vswitch_config.get("vswitch_name"),
+            )
+            runtime = util_models.RuntimeOptions()
+            response = self.ecs_limiter.call(
+                self._ecs(region).create_vswitch_with_options, create_request, runtime, is_throttled=is_ecs_throttled)
+
+            logger.info(f"交换机创建成功: {response.body.v_switch_id}")
+            return {
+                "request_id": request_id,
+                "resource_type": "vswitch",
+                "resource_id": response.body.v_switch_id,
+                "status": "success",
+                "message": "交换机创建成功",
+                "details": {
+                    "vswitch_id": response.body.v_switch_id,
+                    "vpc_id": vswitch_config["vpc_id"],
+                    "zone_id": vswitch_config["zone_id"],
+                    "cidr_block": vswitch_config["cidr_block"],
+                    "region": region
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"创建交换机失败: {str(e)}")
+            return {
+                "request_id": request_id,
+                "resource_type": "vswitch",
+                "status": "failed",
+                "message": f"交换机创建失败: {str(e)}"
+            }
+
+    @track_tool("create_oss_bucket")
     def create_oss_bucket(self, oss_config: Dict[str, Any]) -> Dict[str, Any]:
-        """创建OSS Bucket - 简化且可靠的版本"""
+        """创建OSS Bucket；相同名称的并发请求和窗口期内的重复请求只会发起一次创建"""
         request_id = str(uuid.uuid4())
         bucket_name = oss_config.get("bucket_name", "").strip()
 
@@ -107,16 +529,35 @@ class AliyunToolKit:
                 "message": "Bucket名称格式无效。只能包含小写字母、数字和短横线，且必须以字母或数字开头结尾，长度3-63字符"
             }
 
+        acl = oss_config.get("acl", "private")
+        region = oss_config.get("region") or self.region_id
+        key = SingleFlight.make_key("oss", {"bucket_name": bucket_name, "acl": acl, "region": region})
+        result, source = self.create_dedup.do(
+            key, lambda: self._create_oss_bucket(request_id, bucket_name, acl, region))
+
+        # 复用的结果可能仍是creating，以等待器中的最新状态为准
+        if result.get("status") == "creating":
+            operation = self.waiter.get(result.get("operation_id"))
+            if operation is not None:
+                if oss_config.get("wait_ready") and not operation.done():
+                    operation.wait(self.oss_ready_timeout)
+                if operation.done():
+                    result = operation.result
+        return self._dedup_result("oss", result, source)
+
+    def _create_oss_bucket(self, request_id: str, bucket_name: str, acl: str, region: str) -> Dict[str, Any]:
         logger.info(f"开始创建OSS Bucket: {bucket_name}")
+        from oss2.exceptions import OssError
 
         try:
             # 创建Bucket实例
-            bucket = oss2.Bucket(self.oss_auth, self.oss_endpoint, bucket_name)
+            bucket = self._oss_bucket(bucket_name, region)
 
             # 首先检查是否已存在
-            if self._check_bucket_exists(bucket_name):
+            if self._check_bucket_exists(bucket_name, region=region):
                 logger.info(f"OSS Bucket已存在: {bucket_name}")
-                return {
+                indexed = self.bucket_index.lookup(bucket_name) if self.bucket_index else None
+                return self._record({
                     "request_id": request_id,
                     "resource_type": "oss",
                     "resource_id": bucket_name,
@@ -124,15 +565,15 @@ class AliyunToolKit:
                     "message": "OSS Bucket已存在",
                     "details": {
                         "bucket_name": bucket_name,
-                        "region": self.region_id,
+                        "region": (indexed or {}).get("region") or region,
                         "existed": True
                     }
-                }
+                })
 
             # 创建Bucket - 使用最简单的创建方式
             # 注意：某些region可能不支持存储类型设置，我们先创建基础bucket
-            create_result = bucket.create_bucket(
-                permission=oss_config.get("acl", "private")
+            create_result = self.oss_limiter.call(
+                bucket.create_bucket, permission=acl, is_throttled=is_oss_throttled
             )
 
             # 检查HTTP状态码确认创建成功
@@ -145,42 +586,51 @@ class AliyunToolKit:
                 }
 
             logger.info(f"OSS Bucket创建请求已发送: {bucket_name}")
+            # 清除创建前写入的“不存在”负缓存，并记入Bucket索引
+            self.state_cache.invalidate("oss_bucket", bucket_name)
+            if self.bucket_index:
+                self.bucket_index.add(bucket_name, region)
 
-            # 等待并验证Bucket是否真正创建成功
-            import time
-            max_retries = 5
-            for i in range(max_retries):
-                time.sleep(2)  # 等待2秒
-                if self._check_bucket_exists(bucket_name):
-                    logger.info(f"OSS Bucket验证成功: {bucket_name}")
-                    return {
-                        "request_id": request_id,
-                        "resource_type": "oss",
-                        "resource_id": bucket_name,
-                        "status": "success",
-                        "message": "OSS Bucket创建并验证成功",
-                        "details": {
-                            "bucket_name": bucket_name,
-                            "acl": oss_config.get("acl", "private"),
-                            "region": self.region_id,
-                            "endpoint": self.oss_endpoint,
-                            "verification_retries": i + 1
-                        }
-                    }
-                logger.info(f"第 {i + 1} 次验证Bucket存在性失败，等待重试...")
-
-            # 如果验证失败
-            return {
+            pending = {
                 "request_id": request_id,
                 "resource_type": "oss",
-                "status": "failed",
-                "message": "Bucket创建请求已发送，但验证存在性失败。请稍后在OSS控制台检查",
+                "resource_id": bucket_name,
+                "status": "creating",
                 "details": {
                     "bucket_name": bucket_name,
-                    "region": self.region_id,
-                    "verification_attempts": max_retries
+                    "acl": acl,
+                    "region": region
                 }
             }
+            # 先写入清单再提交等待：等待器的首次检查在当前线程中执行，验证成功时只更新清单中已有的记录
+            self._record(pending)
+
+            # 由共享的就绪等待器验证Bucket是否真正创建成功，请求路径不再sleep
+            operation = self.waiter.submit(
+                "oss",
+                bucket_name,
+                lambda: self._oss_ready_result(request_id, bucket_name, acl, region),
+                timeout=self.oss_ready_timeout,
+                on_timeout=lambda op: {
+                    "request_id": request_id,
+                    "resource_type": "oss",
+                    "status": "failed",
+                    "message": "Bucket创建请求已发送，但验证存在性失败。请稍后在OSS控制台检查",
+                    "details": {
+                        "bucket_name": bucket_name,
+                        "region": region,
+                        "verification_attempts": op.attempts
+                    }
+                }
+            )
+            if operation.done():
+                return operation.result
+
+            return {
+                **pending,
+                "operation_id": operation.id,
+                "message": f"OSS Bucket创建请求已发送，正在确认可用性，可通过 GET /operations/{operation.id} 查询进度",
+            }
 
         except OssError as e:
             error_msg = f"OSS操作失败: {e}"
@@ -201,6 +651,28 @@ class AliyunToolKit:
                 "status": "failed",
                 "message": error_msg
             }
+
+    def _oss_ready_result(self, request_id: str, bucket_name: str, acl: str, region: str):
+        """Bucket已可访问时返回创建成功结果，否则返回None"""
+        if not self._check_bucket_exists(bucket_name, use_cache=False, region=region):
+            return None
+        logger.info(f"OSS Bucket验证成功: {bucket_name}")
+        if self.inventory:
+            self.inventory.update_status("oss", bucket_name, "available")
+        return {
+            "request_id": request_id,
+            "resource_type": "oss",
+            "resource_id": bucket_name,
+            "status": "success",
+            "message": "OSS Bucket创建并验证成功",
+            "details": {
+                "bucket_name": bucket_name,
+                "acl": acl,
+                "region": region,
+                "endpoint": self._oss_endpoint(region)
+            }
+        }
+
     def _is_valid_bucket_name(self, bucket_name: str) -> bool:
         """验证Bucket名称格式"""
         import re
@@ -208,15 +680,32 @@ class AliyunToolKit:
         pattern = r'^[a-z0-9][a-z0-9-]{1,61}[a-z0-9]$'
         return bool(re.match(pattern, bucket_name)) and len(bucket_name) >= 3 and len(bucket_name) <= 63
 
-    def _check_bucket_exists(self, bucket_name: str) -> bool:
-        """检查Bucket是否存在 - 更健壮的版本"""
+    def _check_bucket_exists(self, bucket_name: str, use_cache: bool = True, region: Optional[str] = None) -> bool:
+        """检查Bucket是否存在 - 更健壮的版本
+
+        本账号的Bucket由索引直接回答；不在索引中的名称可能属于其他账号，需要远程确认。
+        use_cache=False时（如创建后的就绪验证）总是远程查询。
+        """
+        if use_cache:
+            if self.bucket_index and self.bucket_index.lookup(bucket_name):
+                return True
+            cached = self.state_cache.get("oss_bucket", bucket_name)
+            if cached is not MISSING:
+                return cached
+        from oss2.exceptions import NoSuchBucket, OssError
+
         try:
-            bucket = oss2.Bucket(self.oss_auth, self.oss_endpoint, bucket_name)
+            bucket = self._oss_bucket(bucket_name, region)
             # 尝试获取Bucket信息
-            bucket_info = bucket.get_bucket_info()
+            bucket_info = self.oss_limiter.call(bucket.get_bucket_info, is_throttled=is_oss_throttled)
             logger.debug(f"Bucket存在: {bucket_name}, 创建时间: {bucket_info.creation_date}")
+            self.state_cache.set("oss_bucket", bucket_name, True)
+            if self.bucket_index:
+                self.bucket_index.add(bucket_name, _location_region(getattr(bucket_info, "location", None)) or region)
             return True
         except NoSuchBucket:
+            # 只有明确不存在时才做负缓存，其他错误不缓存
+            self.state_cache.set("oss_bucket", bucket_name, False, found=False)
             return False
         except OssError as e:
             logger.warning(f"检查Bucket存在性时OSS错误: {e}")
@@ -225,33 +714,224 @@ class AliyunToolKit:
             logger.warning(f"检查Bucket存在性时异常: {e}")
             return False
 
-    def check_ecs_status(self, instance_id: str) -> Dict[str, Any]:
-        """检查ECS实例状态"""
+    def wait_ecs_ready(self, instance_id: str, target_statuses=("Stopped", "Running"),
+                       timeout: float = None, region: Optional[str] = None) -> Operation:
+        """提交ECS实例就绪等待；CreateInstance创建的实例完成后处于Stopped状态"""
+        def check():
+            status = self.check_ecs_status(instance_id, use_cache=False, region=region)
+            return status if status.get("status") in target_statuses else None
+
+        return self.waiter.submit("ecs", instance_id, check, timeout=timeout or self.ecs_ready_timeout)
+
+    @track_tool("check_ecs_status")
+    def check_ecs_status(self, instance_id, use_cache: bool = True, region: Optional[str] = None) -> Dict[str, Any]:
+        """检查ECS实例状态（并发查询会被合并为批量DescribeInstances）"""
+        if isinstance(instance_id, dict):
+            region = region or instance_id.get("region")
+        region = region or self.region_id
+        instance_id = self._normalize_instance_id(instance_id)
+        if not instance_id:
+            return {"status": "error", "message": "缺少实例ID"}
+        if use_cache:
+            cached = self.state_cache.get("ecs_status", instance_id)
+            if cached is not MISSING:
+                return dict(cached)
         try:
             logger.info(f"检查ECS实例状态: {instance_id}")
-            describe_request = ecs_models.DescribeInstancesRequest(
-                region_id=self.region_id,
-                instance_ids=json.dumps([instance_id])
-            )
-            runtime = util_models.RuntimeOptions()
-            response = self.ecs_client.describe_instances_with_options(describe_request, runtime)
-
-            if response.body.instances and response.body.instances.instance:
-                instance = response.body.instances.instance[0]
-                return {
-                    "status": instance.status,
-                    "instance_id": instance.instance_id,
-                    "instance_name": instance.instance_name,
-                    "public_ip": instance.public_ip_address.ip_address if instance.public_ip_address else None
-                }
-            return {"status": "unknown"}
+            status = self.ecs_status_batcher.call((region, instance_id))
+            if not status:
+                self.state_cache.set("ecs_status", instance_id, {"status": "unknown"}, found=False)
+                return {"status": "unknown"}
+            self.state_cache.set("ecs_status", instance_id, status)
+            return dict(status)
 
         except Exception as e:
             logger.error(f"检查ECS状态失败: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    def _normalize_instance_id(self, instance_id) -> str:
+        """兼容Agent传入的字典参数，如 {"instance_id": "i-xxx"}"""
+        if isinstance(instance_id, dict):
+            instance_id = instance_id.get("instance_id") or next(
+                (v for v in instance_id.values() if isinstance(v, str)), "")
+        return str(instance_id or "").strip()
 
-# 工具实例
-tool_kit = AliyunToolKit()
+    def _describe_instances(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """按地域分组批量查询实例状态，键为 (地域, 实例ID)，单次最多100个实例ID"""
+        from alibabacloud_ecs20140526 import models as ecs_models
+        from alibabacloud_tea_util import models as util_models
 
+        by_region: Dict[str, List[str]] = {}
+        for region, instance_id in keys:
+            by_region.setdefault(region, []).append(instance_id)
 
+        statuses = {}
+        for region, instance_ids in by_region.items():
+            describe_request = ecs_models.DescribeInstancesRequest(
+                region_id=region,
+                instance_ids=json.dumps(instance_ids),
+                page_size=max(len(instance_ids), 10)
+            )
+            runtime = util_models.RuntimeOptions()
+            response = self.ecs_limiter.call(
+                self._ecs(region).describe_instances_with_options, describe_request, runtime,
+                is_throttled=is_ecs_throttled)
+
+            if response.body.instances and response.body.instances.instance:
+                for instance in response.body.instances.instance:
+                    statuses[(region, instance.instance_id)] = {
+                        "status": instance.status,
+                        "instance_id": instance.instance_id,
+                        "instance_name": instance.instance_name,
+                        "region": region,
+                        "public_ip": instance.public_ip_address.ip_address if instance.public_ip_address else None
+                    }
+        # 顺带更新清单中已有实例的状态
+        if self.inventory and statuses:
+            self.inventory.update_statuses("ecs", [
+                (status["instance_id"], status["status"], {"public_ip": status["public_ip"]})
+                for status in statuses.values()
+            ])
+        return statuses
+
+    def _record(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """把创建结果写入资源清单（归属当前用户）；清单写入失败不影响创建结果"""
+        if self.inventory:
+            try:
+                self.inventory.record(result)
+            except Exception as e:
+                logger.warning(f"写入资源清单失败: {e}")
+        return result
+
+    @track_tool("query_inventory")
+    def query_inventory(self, query=None) -> Dict[str, Any]:
+        """查询当前用户的本地资源清单，如已停止的实例；不调用云API"""
+        if not self.inventory:
+            return {"status": "error", "message": "资源清单未启用"}
+        query = query if isinstance(query, dict) else {}
+        self.maybe_sync_inventory()
+        try:
+            limit = min(max(int(query.get("limit") or 50), 1), 200)
+        except (TypeError, ValueError):
+            limit = 50
+        result = self.inventory.query(
+            user_id=current_user.get(),
+            resource_type=query.get("resource_type"),
+            region=query.get("region"),
+            status=query.get("status"),
+            limit=limit,
+        )
+        return {"status": "success", **result, "sync": self.inventory_sync_stats()}
+
+    def maybe_sync_inventory(self):
+        """清单超过同步间隔未同步时在后台线程中同步，调用方不等待"""
+        synced_at = self._inventory_synced_at
+        if synced_at is not None and time.monotonic() - synced_at < self.inventory_sync_interval:
+            return
+        if not self._inventory_sync_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._sync_inventory()
+            finally:
+                self._inventory_sync_lock.release()
+
+        threading.Thread(target=run, name="inventory-sync", daemon=True).start()
+
+    def sync_inventory(self) -> Dict[str, Any]:
+        """立即同步清单；已有同步在进行时等待其完成"""
+        with self._inventory_sync_lock:
+            return self._sync_inventory()
+
+    def _sync_inventory(self) -> Dict[str, Any]:
+        """分页列举清单中涉及的各地域ECS实例和本账号的Bucket，合并进清单"""
+        results: Dict[str, Any] = {}
+        sources = [(f"ecs:{region}", "ecs", region, self._ecs_inventory_pages(region))
+                   for region in sorted(set(self.inventory.regions("ecs")) | {self.region_id})]
+        sources.append(("oss", "oss", None, self._oss_inventory_pages()))
+        for name, resource_type, region, pages in sources:
+            try:
+                results[name] = self.inventory.apply_sync(resource_type, region, pages)
+            except Exception as e:
+                logger.warning(f"同步资源清单失败 {name}: {e}")
+                results[name] = {"error": str(e)}
+        self._inventory_synced_at = time.monotonic()
+        self._inventory_last_sync = results
+        logger.info(f"资源清单同步完成: {results}")
+        return results
+
+    def _ecs_inventory_pages(self, region: str):
+        from alibabacloud_ecs20140526 import models as ecs_models
+        from alibabacloud_tea_util import models as util_models
+
+        next_token = None
+        while True:
+            describe_request = ecs_models.DescribeInstancesRequest(
+                region_id=region, max_results=100, next_token=next_token)
+            response = self.ecs_limiter.call(
+                self._ecs(region).describe_instances_with_options, describe_request, util_models.RuntimeOptions(),
+                is_throttled=is_ecs_throttled)
+            instances = response.body.instances.instance if response.body.instances else []
+            yield [
+                {
+                    "resource_id": instance.instance_id,
+                    "status": instance.status,
+                    "name": instance.instance_name,
+                    "details": {
+                        "instance_type": instance.instance_type,
+                        "public_ip": instance.public_ip_address.ip_address if instance.public_ip_address else None,
+                    },
+                }
+                for instance in instances or []
+            ]
+            next_token = response.body.next_token
+            if not next_token:
+                return
+
+    def _oss_inventory_pages(self):
+        marker = ""
+        while True:
+            buckets, marker = self._list_buckets_page(marker)
+            yield [
+                {"resource_id": name, "region": region, "status": "available", "name": name}
+                for name, region in buckets
+            ]
+            if not marker:
+                return
+
+    def inventory_sync_stats(self) -> Dict[str, Any]:
+        synced_at = self._inventory_synced_at
+        return {
+            "last_sync_age": round(time.monotonic() - synced_at, 1) if synced_at is not None else None,
+            "syncing": self._inventory_sync_lock.locked(),
+            "last_result": self._inventory_last_sync,
+        }
+
+
+def _location_region(location: Optional[str]) -> Optional[str]:
+    """OSS返回的location形如 oss-cn-hangzhou"""
+    if location and location.startswith("oss-"):
+        return location[len("oss-"):]
+    return location
+
+
+_tool_kit: Optional[AliyunToolKit] = None
+_tool_kit_lock = threading.Lock()
+
+
+def get_tool_kit() -> AliyunToolKit:
+    """返回工具实例，首次调用时创建"""
+    global _tool_kit
+    if _tool_kit is None:
+        with _tool_kit_lock:
+            if _tool_kit is None:
+                _tool_kit = AliyunToolKit()
+    return _tool_kit
+
+
+def __getattr__(name: str):
+    # 兼容 from tools import tool_kit 的用法，访问时才创建实例
+    if name == "tool_kit":
+        return get_tool_kit()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import READINESS_WAIT
+from models import ResourceStatus
+
+logger = logging.getLogger(__name__)
+
+# 就绪检查函数：资源就绪时返回结果字典，未就绪时返回None
+ReadinessCheck = Callable[[], Optional[Dict[str, Any]]]
+
+
+class Operation:
+    """一次资源就绪等待操作的句柄"""
+
+    def __init__(self, kind: str, resource_id: str, check: ReadinessCheck,
+                 timeout: float, on_timeout: Optional[Callable[["Operation"], Dict[str, Any]]] = None):
+        self.id = f"op-{uuid.uuid4().hex[:16]}"
+        self.kind = kind
+        self.resource_id = resource_id
+        self.check = check
+        self.on_timeout = on_timeout
+        self.status = ResourceStatus.CREATING
+        self.attempts = 0
+        self.created_at = time.time()
+        self.deadline = time.monotonic() + timeout
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.future: Future = Future()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """阻塞等待操作完成，返回就绪结果；超时返回None"""
+        try:
+            return self.future.result(timeout=timeout)
+        except Exception:
+            return self.result
+
+    def _finish(self, status: ResourceStatus, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        READINESS_WAIT.observe(self.finished_at - self.created_at, kind=self.kind, status=status.value)
+        self.future.set_result(result)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        return {
+            "operation_id": self.id,
+            "resource_type": self.kind,
+            "resource_id": self.resource_id,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "elapsed_seconds": round(elapsed, 3),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ReadinessWaiter:
+    """资源就绪等待器
+
+    所有等待中的操作由一个共享的后台线程按指数退避调度，到期的检查交给一个小线程池并发执行，
+    单个慢的DescribeInstances不会拖延其他操作，调用方也不再在请求路径上sleep。
+    提交时会先在调用线程中立即检查一次，已就绪则直接完成。
+    """
+
+    def __init__(self, initial_interval: float = 0.5, max_interval: float = 8.0,
+                 multiplier: float = 2.0, max_operations: int = 1000, max_workers: int = 4):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.max_operations = max_operations
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="readiness-check")
+
+        self._operations: "OrderedDict[str, Operation]" = OrderedDict()
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, kind: str, resource_id: str, check: ReadinessCheck, timeout: float = 60.0,
+               on_timeout: Optional[Callable[[Operation], Dict[str, Any]]] = None) -> Operation:
+        """提交就绪等待操作并返回句柄"""
+        operation = Operation(kind, resource_id, check, timeout, on_timeout)
+        self._register(operation)
+
+        # 首次检查在调用线程中立即执行，就绪则无需进入后台轮询
+        if self._poll(operation):
+            return operation
+
+        with self._cond:
+            self._schedule(operation, self.initial_interval)
+            self._ensure_thread()
+            self._cond.notify()
+        return operation
+
+    def get(self, operation_id: str) -> Optional[Operation]:
+        with self._cond:
+            return self._operations.get(operation_id)
+
+    def _register(self, operation: Operation):
+        with self._cond:
+            self._operations[operation.id] = operation
+            # 超出容量时淘汰最早的已完成操作
+            while len(self._operations) > self.max_operations:
+                oldest_id = next((op_id for op_id, op in self._operations.items() if op.done()), None)
+                if oldest_id is None:
+                    break
+                del self._operations[oldest_id]
+
+    def _schedule(self, operation: Operation, interval: float):
+        heapq.heappush(self._heap, (time.monotonic() + interval, next(self._seq), interval, operation))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="readiness-waiter", daemon=True)
+            self._thread.start()
+
+    def _poll(self, operation: Operation) -> bool:
+        """执行一次就绪检查，操作结束（成功或超时）时返回True"""
+        operation.attempts += 1
+        try:
+            result = operation.check()
+        except Exception as e:
+            logger.warning(f"就绪检查异常 {operation.kind}:{operation.resource_id}: {e}")
+            result = None
+
+        if result is not None:
+            logger.info(f"资源已就绪 {operation.kind}:{operation.resource_id}, 检查次数 {operation.attempts}")
+            operation._finish(ResourceStatus.SUCCESS, result)
+            return True
+
+        if time.monotonic() >= operation.deadline:
+            logger.warning(f"等待资源就绪超时 {operation.kind}:{operation.resource_id}")
+            timeout_result = None
+            if operation.on_timeout:
+                try:
+                    timeout_result = operation.on_timeout(operation)
+                except Exception as e:
+                    logger.error(f"超时回调异常 {operation.kind}:{operation.resource_id}: {e}")
+            operation._finish(ResourceStatus.FAILED, timeout_result, "等待资源就绪超时")
+            return True
+        return False
+
+    def _poll_and_reschedule(self, operation: Operation, interval: float):
+        """在线程池中执行一次检查，未结束时按退避间隔重新调度；任何异常都不会让操作停留在等待状态"""
+        try:
+            if self._poll(operation):
+                return
+        except Exception as e:
+            logger.error(f"就绪检查失败 {operation.kind}:{operation.resource_id}: {e}")
+            if not operation.done():
+                operation._finish(ResourceStatus.FAILED, None, str(e))
+            return
+        next_interval = min(interval * self.multiplier, self.max_interval)
+        # 不超过截止时间，保证超时能被及时发现
+        next_interval = max(0.0, min(next_interval, operation.deadline - time.monotonic()))
+        with self._cond:
+            self._schedule(operation, next_interval)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, interval, operation = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._heap)
+
+            try:
+                self._executor.submit(self._poll_and_reschedule, operation, interval)
+            except Exception as e:
+                logger.error(f"提交就绪检查失败 {operation.kind}:{operation.resource_id}: {e}")
+                if not operation.done():
+                    operation._finish(ResourceStatus.FAILED, None, str(e))
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            operations = list(self._operations.values())
+            pending = len(self._heap)
+        return {
+            "pending": pending,
+            "tracked": len(operations),
+            "succeeded": sum(1 for op in operations if op.status == ResourceStatus.SUCCESS),
+            "failed": sum(1 for op in operations if op.status == ResourceStatus.FAILED),
+        }
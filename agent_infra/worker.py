@@ -0,0 +1,200 @@
+"""后台任务工作进程
+
+从任务队列（SQLite/Redis）领取 /jobs 提交的任务并执行。每个进程只创建一次Agent和云SDK客户端，
+之后的任务复用其中的连接池；多个进程可分布在多个CPU核或多台机器上，API进程重启不影响已提交的任务。
+
+用法:
+    python worker.py --workers 4 --concurrency 4
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from config import load_config
+from inventory import current_request, current_user
+from jobs import JobQueue, create_job_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _run_chat(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from agent_core import get_agent
+    response = get_agent().process_request(
+        payload["message"], use_cache=payload.get("use_cache", True), session_id=payload.get("session_id"))
+    return {"response": response}
+
+
+def _run_provision(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from scheduler import get_provision_scheduler
+    return get_provision_scheduler().run_to_completion(payload["items"])
+
+
+def _run_fleet(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from tools import get_tool_kit
+    return get_tool_kit().create_ecs_fleet(payload["fleet_config"])
+
+
+# 任务类型 -> 处理函数，参数为提交时已校验和规范化的payload
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "chat": _run_chat,
+    "provision": _run_provision,
+    "fleet": _run_fleet,
+}
+
+
+class JobWorker:
+    """在concurrency个线程中循环领取并执行任务"""
+
+    def __init__(self, queue: JobQueue, concurrency: int = 1, name: Optional[str] = None,
+                 handlers: Optional[Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]] = None,
+                 poll_timeout: float = 1.0):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = handlers or JOB_HANDLERS
+        self.poll_timeout = poll_timeout
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._counters = {"succeeded": 0, "failed": 0, "running": 0}
+
+    def start(self):
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"{self.name}/{index}",),
+                                      name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"任务工作线程已启动: {self.name} x {self.concurrency}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止领取新任务，等待正在执行的任务完成"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self, worker_name: str):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker_name, timeout=self.poll_timeout)
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                self._stop.wait(self.poll_timeout)
+                continue
+            if job is not None:
+                self.run_job(job)
+
+    def run_job(self, job: Dict[str, Any]):
+        handler = self.handlers.get(job["kind"])
+        logger.info(f"开始执行任务 {job['job_id']} ({job['kind']}), 第 {job['attempts']} 次")
+        with self._lock:
+            self._counters["running"] += 1
+        token = current_user.set(job.get("user_id") or "default")
+        # 任务被重新领取（如租约过期）后，创建调用沿用同一幂等令牌，不会重复创建资源
+        request_token = current_request.set(job["job_id"])
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, finished),
+                                     name=f"job-heartbeat-{job['job_id'][:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise ValueError(f"不支持的任务类型: {job['kind']}")
+            result = handler(job["payload"])
+            self.queue.complete(job["job_id"], result, job["worker"], job["attempts"])
+            outcome = "succeeded"
+        except Exception as e:
+            logger.error(f"任务 {job['job_id']} 执行失败: {e}")
+            self.queue.fail(job["job_id"], str(e), job["worker"], job["attempts"])
+            outcome = "failed"
+        finally:
+            finished.set()
+            current_user.reset(token)
+            current_request.reset(request_token)
+        with self._lock:
+            self._counters["running"] -= 1
+            self._counters[outcome] += 1
+
+    def _heartbeat(self, job: Dict[str, Any], finished: threading.Event):
+        """任务执行期间每隔三分之一租约续租一次，长任务不会因租约过期被其他工作进程重复执行"""
+        interval = max(self.queue.lease_seconds / 3, 0.05)
+        while not finished.wait(interval):
+            try:
+                if not self.queue.heartbeat(job["job_id"], job["worker"], job["attempts"]):
+                    logger.warning(f"任务 {job['job_id']} 的租约已失效，执行结果将被忽略")
+                    return
+            except Exception as e:
+                logger.warning(f"任务 {job['job_id']} 续租失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"name": self.name, "concurrency": self.concurrency, **self._counters}
+
+
+def warm_up():
+    """预先创建Agent、工具集和默认地域的ECS客户端并在后台加载Bucket索引，第一个任务不再承担初始化开销"""
+    from agent_core import get_agent
+    from tools import get_tool_kit
+    get_agent()
+    tool_kit = get_tool_kit()
+    tool_kit.ecs_client
+    if tool_kit.bucket_index:
+        tool_kit.bucket_index.warm()
+
+
+def _worker_process(concurrency: int):
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [worker {os.getpid()}] %(levelname)s %(message)s")
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    warm_up()
+    worker = JobWorker(create_job_queue(load_config()), concurrency=concurrency)
+    worker.start()
+    stop.wait()
+    logger.info("收到退出信号，等待正在执行的任务完成")
+    worker.stop()
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="后台任务工作进程")
+    parser.add_argument("--workers", type=int, default=config["job_worker_processes"], help="工作进程数")
+    parser.add_argument("--concurrency", type=int, default=config["job_worker_concurrency"],
+                        help="每个进程同时执行的任务数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if config["job_backend"] == "memory":
+        parser.error("内存任务队列只能由API进程内的工作线程消费，请设置 JOB_BACKEND=sqlite 或 redis")
+
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+
+    def spawn() -> multiprocessing.Process:
+        process = multiprocessing.Process(target=_worker_process, args=(args.concurrency,), daemon=False)
+        process.start()
+        return process
+
+    processes = [spawn() for _ in range(max(1, args.workers))]
+    logger.info(f"已启动 {len(processes)} 个工作进程，每个并发 {args.concurrency}")
+    # 监督子进程：异常退出的进程会被重新拉起，其未完成的任务在租约过期后重新入队
+    while not stopping.is_set():
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                logger.warning(f"工作进程 {process.pid} 已退出 (exitcode {process.exitcode})，重新启动")
+                processes[index] = spawn()
+        stopping.wait(1.0)
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()